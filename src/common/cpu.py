@@ -1,8 +1,146 @@
+import copy
 import logging
+import struct
 from common.utils import *
 
 logger = logging.getLogger('cpu')
 
+# Register names and CPU attributes, indexed by the register code in the instruction opcode
+# (code 6 is a memory cell addressed by HL)
+REG_SYMB = "BCDEHLMA"
+REG_ATTR = ["_b", "_c", "_d", "_e", "_h", "_l", None, "_a"]
+
+# Register pair names and high/low register attributes, indexed by the register pair code
+REG_PAIR_SYMB = ["BC", "DE", "HL", "SP"]
+REG_PAIR_ATTR = [("_b", "_c"), ("_d", "_e"), ("_h", "_l"), None]
+
+# Conditions of conditional jumps, calls, and returns: flag attribute, and expected flag value
+CONDITIONS = [("_zero", False), ("_zero", True), ("_carry", False), ("_carry", True),
+              ("_parity", False), ("_parity", True), ("_sign", False), ("_sign", True)]
+
+
+# Precomputed flag tables. Instead of calculating flags on every ALU operation, the flags are looked up
+# in the tables below, that are built once on module load.
+
+def _build_szp_table():
+    """ Sign, zero, and parity flags for each possible 8-bit result """
+    return [((res & 0x80) != 0, res == 0, bin(res).count("1") % 2 == 0) for res in range(0x100)]
+
+
+def _build_half_carry_add_table():
+    """ Half carry flag of ADD/ADC, indexed by (carry << 8) | (a_low_nibble << 4) | value_low_nibble """
+    return [((index >> 4) & 0x0f) + (index & 0x0f) + (index >> 8) > 0x0f for index in range(0x200)]
+
+
+def _build_half_carry_sub_table():
+    """ Half carry flag of SUB/SBB/CMP, indexed by (carry << 8) | (a_low_nibble << 4) | value_low_nibble """
+    table = []
+    for index in range(0x200):
+        carry = index >> 8
+        neg_value = ~(index & 0x0f) + 1
+        table.append(((index >> 4) & 0x0f) + ((neg_value - carry) & 0x0f) > 0x0f)
+    return table
+
+
+def _build_daa_table():
+    """ DAA results (accumulator, carry, half carry), indexed by (half_carry << 9) | (carry << 8) | a """
+    table = []
+    for index in range(0x400):
+        a = index & 0xff
+        carry = (index & 0x100) != 0
+        half_carry = (index & 0x200) != 0
+
+        if (a & 0xf) > 9 or half_carry:
+            a = (a + 0x6) & 0xff
+            half_carry = True
+
+        if (a & 0xf0) > 0x90 or carry:
+            a = (a + 0x60) & 0xff
+            carry = True
+
+        table.append((a, carry, half_carry))
+    return table
+
+
+def _build_mnemonics_table():
+    """
+    Instruction mnemonic templates for the instructions logging, indexed by opcode. Immediate operands
+    are substituted with {d8} or {d16} fields. Undocumented opcodes (and HLT) are None.
+    """
+    table = [None] * 0x100
+
+    for reg_pair, symb in enumerate(REG_PAIR_SYMB):
+        table[0x01 | (reg_pair << 4)] = f"LXI {symb}, {{d16:04x}}"
+        table[0x03 | (reg_pair << 4)] = f"INX {symb}"
+        table[0x09 | (reg_pair << 4)] = f"DAD {symb}"
+        table[0x0B | (reg_pair << 4)] = f"DCX {symb}"
+        table[0xC1 | (reg_pair << 4)] = f"POP {'PSW' if reg_pair == 3 else symb}"
+        table[0xC5 | (reg_pair << 4)] = f"PUSH {'PSW' if reg_pair == 3 else symb}"
+
+    for reg_pair in range(2):
+        table[0x02 | (reg_pair << 4)] = f"STAX {REG_PAIR_SYMB[reg_pair]}"
+        table[0x0A | (reg_pair << 4)] = f"LDAX {REG_PAIR_SYMB[reg_pair]}"
+
+    for reg, symb in enumerate(REG_SYMB):
+        table[0x04 | (reg << 3)] = f"INR {symb}"
+        table[0x05 | (reg << 3)] = f"DCR {symb}"
+        table[0x06 | (reg << 3)] = f"MVI {symb}, {{d8:02x}}"
+
+        for src, src_symb in enumerate(REG_SYMB):
+            table[0x40 | (reg << 3) | src] = f"MOV {symb}, {src_symb}"
+
+    table[0x76] = None      # HLT is not supported
+
+    for op in range(8):
+        for reg, symb in enumerate(REG_SYMB):
+            table[0x80 | (op << 3) | reg] = f"{['ADD', 'ADC', 'SUB', 'SBB', 'ANA', 'XRA', 'ORA', 'CMP'][op]} {symb}"
+
+        table[0xC6 | (op << 3)] = f"{['ADI', 'ACI', 'SUI', 'SBI', 'ANI', 'XRI', 'ORI', 'CPI'][op]} {{d8:02x}}"
+        table[0xC0 | (op << 3)] = ["RNZ", "RZ", "RNC", "RC", "RPO", "RPE", "RP", "RM"][op]
+        table[0xC2 | (op << 3)] = f"{['JNZ', 'JZ', 'JNC', 'JC', 'JPO', 'JPE', 'JP', 'JM'][op]} {{d16:04x}}"
+        table[0xC4 | (op << 3)] = f"{['CNZ', 'CZ', 'CNC', 'CC', 'CPO', 'CPE', 'CP', 'CM'][op]} {{d16:04x}}"
+        table[0xC7 | (op << 3)] = f"RST {op}"
+
+    table[0x00] = "NOP"
+    table[0x07] = "RLC"
+    table[0x0F] = "RRC"
+    table[0x17] = "RAL"
+    table[0x1F] = "RAR"
+    table[0x22] = "SHLD {d16:04x}"
+    table[0x27] = "DAA"
+    table[0x2A] = "LHLD {d16:04x}"
+    table[0x2F] = "CMA"
+    table[0x32] = "STA {d16:04x}"
+    table[0x37] = "STC"
+    table[0x3A] = "LDA {d16:04x}"
+    table[0x3F] = "CMC"
+
+    table[0xC3] = "JMP {d16:04x}"
+    table[0xC9] = "RET"
+    table[0xCD] = "CALL {d16:04x}"
+    table[0xD3] = "OUT {d8:02x}"
+    table[0xDB] = "IN {d8:02x}"
+    table[0xE3] = "XTHL"
+    table[0xE9] = "PCHL"
+    table[0xEB] = "XCHG"
+    table[0xF3] = "DI"
+    table[0xF9] = "SPHL"
+    table[0xFB] = "EI"
+
+    return table
+
+
+SZP_FLAGS = _build_szp_table()
+HALF_CARRY_ADD = _build_half_carry_add_table()
+HALF_CARRY_SUB = _build_half_carry_sub_table()
+DAA_RESULTS = _build_daa_table()
+MNEMONICS = _build_mnemonics_table()
+
+# Instructions that are logged before execution, so that the log shows CPU state before the stack is changed
+LOG_BEFORE_EXECUTION = {0xCD, 0xC9, 0xE9, 0xF9, 0xD3} | {0xC0 | (op << 3) for op in range(8)} \
+                       | {0xC2 | (op << 3) for op in range(8)} | {0xC4 | (op << 3) for op in range(8)} \
+                       | {0xC7 | (op << 3) for op in range(8)} | {0xC3}
+
 class CPU:
     """
         Intel 8080 CPU emulator
@@ -16,21 +154,29 @@ class CPU:
         to connect the needed device to the bus. Similar to the hardware, the CPU class is working with
         the Machine object, requesting the memory or I/O data transfer. Devices and memories installed
         in a particular Machine will respond to the request.
+
+        As a performance optimization the CPU may access plain RAM and ROM memories directly, if the Machine
+        exposes them as a flat memory image. Page tables provided by the Machine tell which memory pages
+        can be accessed directly, while all other accesses (e.g. memory mapped devices) go through the Machine.
     """
 
     def __init__(self, machine):
         self._machine = machine
         machine.set_cpu(self)
 
+        # Flat memory image and page tables are updated by the Machine in place
+        self._memory, self._read_pages, self._write_pages, self._stack_pages = machine.get_memory_map()
+
         self.reset()
 
         # Instructions and execution
         self._cycles = 0
         self._current_inst = 0  # current instruction
+        self._registers_logging = False
+        self._trace_recorder = None
+        self._tracing = False
         self._instructions = [None] * 0x100
         self.init_instruction_table();
-    
-        self._registers_logging = False
 
 
     def reset(self):
@@ -60,6 +206,44 @@ class CPU:
         self._interrupt_instructions = []
 
 
+    # Registers, flags, interrupt enable flag, cycles counter, and pending interrupt instructions count
+    STATE_FORMAT = '<HH7B6?QB'
+
+    def save_state(self):
+        """
+        Returns CPU registers, flags, and pending interrupt state as bytes
+        """
+        return struct.pack(self.STATE_FORMAT, self._pc, self._sp & 0xffff,
+                           self._a, self._b, self._c, self._d, self._e, self._h, self._l,
+                           self._sign, self._zero, self._half_carry, self._parity, self._carry,
+                           self._enable_interrupts, self._cycles, len(self._interrupt_instructions)
+                           ) + bytes(self._interrupt_instructions)
+
+
+    def load_state(self, data):
+        """
+        Restores CPU state previously saved with save_state()
+        """
+        size = struct.calcsize(self.STATE_FORMAT)
+        (self._pc, self._sp, self._a, self._b, self._c, self._d, self._e, self._h, self._l,
+         self._sign, self._zero, self._half_carry, self._parity, self._carry,
+         self._enable_interrupts, self._cycles, count) = struct.unpack_from(self.STATE_FORMAT, data)
+        self._interrupt_instructions = list(data[size : size + count])
+
+
+    # Instruction tables contain closures over the CPU object, they are rebuilt rather than copied
+    INSTRUCTION_TABLES = ("_instructions", "_lean_instructions", "_traced_instructions")
+
+    def __deepcopy__(self, memo):
+        cpu = CPU.__new__(CPU)
+        memo[id(self)] = cpu
+        for name, value in self.__dict__.items():
+            if name not in self.INSTRUCTION_TABLES:
+                setattr(cpu, name, copy.deepcopy(value, memo))
+        cpu.init_instruction_table()
+        return cpu
+
+
     def step(self):
         """
         Executes an instruction and updates processor state
@@ -85,6 +269,30 @@ class CPU:
 
     def enable_registers_logging(self, value):
         self._registers_logging = value
+        self.update_logging()
+
+
+    def update_logging(self):
+        """
+        Select the instruction table according to the 'cpu' logger level. The lean table does not perform
+        any logging, while the tracing table logs every executed instruction. This function shall be called
+        when the logging configuration changes.
+        """
+        logging_enabled = logger.getEffectiveLevel() <= logging.DEBUG
+        instructions = self._traced_instructions if logging_enabled else self._lean_instructions
+
+        if self._trace_recorder:
+            instructions = [self._make_recorded(opcode, handler) if handler else None 
+                            for opcode, handler in enumerate(instructions)]
+
+        self._tracing = logging_enabled or self._trace_recorder is not None
+        self._instructions = instructions
+
+
+    def set_trace_recorder(self, recorder):
+        """ Attach the trace recorder (see TraceRecorder class), or detach it if None is passed """
+        self._trace_recorder = recorder
+        self.update_logging()
 
 
     @property
@@ -302,12 +510,53 @@ class CPU:
         self._carry = is_bit_set(value, 0)
 
 
+    def _read_memory_byte(self, addr):
+        if self._read_pages[addr >> 8]:
+            return self._memory[addr]
+        return self._machine.read_memory_byte(addr)
+
+
+    def _read_memory_word(self, addr):
+        if self._read_pages[addr >> 8] and self._read_pages[(addr + 1) >> 8]:
+            return self._memory[addr] | (self._memory[addr + 1] << 8)
+        return self._machine.read_memory_word(addr)
+
+
+    def _write_memory_byte(self, addr, value):
+        if self._write_pages[addr >> 8]:
+            self._memory[addr] = value
+        else:
+            self._machine.write_memory_byte(addr, value)
+
+
+    def _write_memory_word(self, addr, value):
+        if self._write_pages[addr >> 8] and self._write_pages[(addr + 1) >> 8]:
+            self._memory[addr] = value & 0xff
+            self._memory[addr + 1] = value >> 8
+        else:
+            self._machine.write_memory_word(addr, value)
+
+
+    def _read_stack(self, addr):
+        if self._stack_pages[addr >> 8] and self._stack_pages[(addr + 1) >> 8]:
+            return self._memory[addr] | (self._memory[addr + 1] << 8)
+        return self._machine.read_stack(addr)
+
+
+    def _write_stack(self, addr, value):
+        if self._stack_pages[addr >> 8] and self._stack_pages[(addr + 1) >> 8]:
+            self._memory[addr] = value & 0xff
+            self._memory[addr + 1] = value >> 8
+        else:
+            self._machine.write_stack(addr, value)
+
+
     def _fetch_next_byte(self):
         if self._enable_interrupts and self._interrupt_instructions:
             data = self._interrupt_instructions[0]
             del self._interrupt_instructions[0]
         else:
-            data = self._machine.read_memory_byte(self._pc)
+            data = self._read_memory_byte(self._pc)
             self._pc += 1
         return data
 
@@ -320,98 +569,22 @@ class CPU:
             del self._interrupt_instructions[0]
             del self._interrupt_instructions[0]
         else:
-            data = self._machine.read_memory_word(self._pc)
+            data = self._read_memory_word(self._pc)
             self._pc += 2
         return data
 
 
     def _push_to_stack(self, value):
         self._sp -= 2
-        self._machine.write_stack(self._sp, value)
+        self._write_stack(self._sp, value)
 
 
     def _pop_from_stack(self):
-        value = self._machine.read_stack(self._sp)
+        value = self._read_stack(self._sp)
         self._sp += 2
         return value
 
 
-    def _get_register(self, reg_idx):
-        if reg_idx == 0:
-            return self._b
-        if reg_idx == 1:
-            return self._c
-        if reg_idx == 2:
-            return self._d
-        if reg_idx == 3:
-            return self._e
-        if reg_idx == 4:
-            return self._h
-        if reg_idx == 5:
-            return self._l
-        if reg_idx == 6:
-            return self._machine.read_memory_byte(self.hl)
-        if reg_idx == 7:
-            return self._a
-
-
-    def _set_register(self, reg_idx, value):
-        assert value >= 0x00 and value <= 0xff
-        if reg_idx == 0:
-            self._b = value
-        if reg_idx == 1:
-            self._c = value
-        if reg_idx == 2:
-            self._d = value
-        if reg_idx == 3:
-            self._e = value
-        if reg_idx == 4:
-            self._h = value
-        if reg_idx == 5:
-            self._l = value
-        if reg_idx == 6:
-            self._machine.write_memory_byte(self.hl, value)
-        if reg_idx == 7:
-            self._a = value
-
-
-    def _set_register_pair(self, reg_pair, value):
-        if reg_pair == 0:
-            self.bc = value
-        if reg_pair == 1:
-            self.de = value
-        if reg_pair == 2:
-            self.hl = value
-        if reg_pair == 3:
-            self._sp = value
-
-
-    def _get_register_pair(self, reg_pair):
-        if reg_pair == 0:
-            return self.bc
-        if reg_pair == 1:
-            return self.de
-        if reg_pair == 2:
-            return self.hl
-        if reg_pair == 3:
-            return self._sp
-
-
-    def _reg_symb(self, reg_idx):
-        return "BCDEHLMA"[reg_idx]
-
-
-    def _reg_pair_symb(self, reg_pair):
-        if reg_pair == 0:
-            return "BC"
-        if reg_pair == 1:
-            return "DE"
-        if reg_pair == 2:
-            return "HL"
-        if reg_pair == 3:
-            return "SP"
-
-
     def _get_cpu_state_str(self):
         res = f"A={self._a:02x} BC={self.bc:04x} DE={self.de:04x} "
         res += f"HL={self.hl:04x} SP={self._sp:04x} "
@@ -424,48 +597,66 @@ class CPU:
         return res
 
 
-    def _log_1b_instruction(self, mnemonic):
-        if logger.level > logging.DEBUG:
-            return
+    def _log_instruction(self, addr, template):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return      # Logging may be temporarily disabled (e.g. by the NestedLogger)
 
-        addr = self._pc - 1
-        log_str = f' {addr:04x}  {self._current_inst:02x}         {mnemonic}'
+        if "{d16" in template:
+            param1 = self._machine.read_memory_byte(addr + 1)
+            param2 = self._machine.read_memory_byte(addr + 2)
+            mnemonic = template.format(d16=(param2 << 8) | param1)
+            log_str = f' {addr:04x}  {self._current_inst:02x} {param1:02x} {param2:02x}   {mnemonic}'
+        elif "{d8" in template:
+            param = self._machine.read_memory_byte(addr + 1)
+            mnemonic = template.format(d8=param)
+            log_str = f' {addr:04x}  {self._current_inst:02x} {param:02x}      {mnemonic}'
+        else:
+            log_str = f' {addr:04x}  {self._current_inst:02x}         {template}'
 
         if self._registers_logging:
             log_str = f"{log_str:35} {self._get_cpu_state_str()}"
-            
-        logger.debug(log_str)
-
 
-    def _log_2b_instruction(self, mnemonic):
-        if logger.level > logging.DEBUG:
-            return
-
-        addr = self._pc - 2
-        param = self._machine.read_memory_byte(self._pc - 1)
-        log_str = f' {addr:04x}  {self._current_inst:02x} {param:02x}      {mnemonic}'
-
-        if self._registers_logging:
-            log_str = f"{log_str:35} {self._get_cpu_state_str()}"
-            
         logger.debug(log_str)
 
 
-    def _log_3b_instruction(self, mnemonic):
-        if logger.level > logging.DEBUG:
-            return
-
-        addr = self._pc - 3
-        param1 = self._machine.read_memory_byte(self._pc - 2)
-        param2 = self._machine.read_memory_byte(self._pc - 1)
+    def _make_traced(self, opcode, handler):
+        """ Wrap the instruction handler with the instruction logging """
+        template = MNEMONICS[opcode]
 
-        log_str = f' {addr:04x}  {self._current_inst:02x} {param1:02x} {param2:02x}   {mnemonic}'
-
-        if self._registers_logging:
-            log_str = f"{log_str:35} {self._get_cpu_state_str()}"
-            
-        logger.debug(log_str)
+        if opcode in LOG_BEFORE_EXECUTION:
+            def traced():
+                self._log_instruction(self._pc - 1, template)
+                handler()
+        else:
+            def traced():
+                addr = self._pc - 1
+                handler()
+                self._log_instruction(addr, template)
+
+        return traced
+
+
+    def _make_recorded(self, opcode, handler):
+        """ Wrap the instruction handler with recording the instruction to the trace recorder """
+        record = self._trace_recorder.record
+        template = MNEMONICS[opcode]
+
+        if "{d16" in template:
+            def recorded():
+                pc = self._pc - 1
+                record(self, pc, self._read_memory_word(pc + 1))
+                handler()
+        elif "{d8" in template:
+            def recorded():
+                pc = self._pc - 1
+                record(self, pc, self._read_memory_byte(pc + 1))
+                handler()
+        else:
+            def recorded():
+                record(self, self._pc - 1, 0)
+                handler()
 
+        return recorded
 
 
     # Data transfer instructions
@@ -474,172 +665,171 @@ class CPU:
         """ Do nothing """
         self._cycles += 4
 
-        self._log_1b_instruction("NOP")
 
-
-    def _mov(self):
+    def _make_mov(self, dst, src):
         """ Move byte between 2 registers """
-        dst = (self._current_inst & 0x38) >> 3
-        src = self._current_inst & 0x07
-        value = self._get_register(src)
-        self._set_register(dst, value)
-
-        self._cycles += 5
-        if src == 6 or dst == 6:
-            self._cycles += 2
+        dst_attr = REG_ATTR[dst]
+        src_attr = REG_ATTR[src]
+
+        if src == 6:
+            def mov():
+                setattr(self, dst_attr, self._read_memory_byte((self._h << 8) | self._l))
+                self._cycles += 7
+        elif dst == 6:
+            def mov():
+                self._write_memory_byte((self._h << 8) | self._l, getattr(self, src_attr))
+                self._cycles += 7
+        else:
+            def mov():
+                setattr(self, dst_attr, getattr(self, src_attr))
+                self._cycles += 5
 
-        self._log_1b_instruction(f"MOV {self._reg_symb(dst)}, {self._reg_symb(src)}")
+        return mov
 
 
-    def _lxi(self):
+    def _make_lxi(self, reg_pair):
         """ Load register pair immediate """
-        reg_pair = (self._current_inst & 0x30) >> 4
-        value = self._fetch_next_word()
         if reg_pair == 3:
-            self._sp = value
-        else: 
-            self._set_register_pair(reg_pair, value)
-        self._cycles += 10
+            def lxi():
+                value = self._fetch_next_word()
+                self._sp = value
+                self._cycles += 10
+        else:
+            high_attr, low_attr = REG_PAIR_ATTR[reg_pair]
+            def lxi():
+                value = self._fetch_next_word()
+                setattr(self, high_attr, value >> 8)
+                setattr(self, low_attr, value & 0xff)
+                self._cycles += 10
 
-        self._log_3b_instruction(f"LXI {self._reg_pair_symb(reg_pair)}, {value:04x}")
+        return lxi
 
 
-    def _mvi(self):
+    def _make_mvi(self, reg):
         """ Move immediate to register or memory """
-        reg = (self._current_inst & 0x38) >> 3
-        value = self._fetch_next_byte()
-        self._set_register(reg, value)
-        self._cycles += (7 if reg != 6 else 10)
+        if reg == 6:
+            def mvi():
+                value = self._fetch_next_byte()
+                self._write_memory_byte((self._h << 8) | self._l, value)
+                self._cycles += 10
+        else:
+            attr = REG_ATTR[reg]
+            def mvi():
+                value = self._fetch_next_byte()
+                setattr(self, attr, value)
+                self._cycles += 7
 
-        self._log_2b_instruction(f"MVI {self._reg_symb(reg)}, {value:02x}")
+        return mvi
 
 
     def _sta(self):
         """ Store accumulator direct """
         addr = self._fetch_next_word()
-        self._machine.write_memory_byte(addr, self._a)
+        self._write_memory_byte(addr, self._a)
         self._cycles += 13
 
-        self._log_3b_instruction(f"STA {addr:04x}")
-
 
     def _lda(self):
         """ Load accumulator direct """
         addr = self._fetch_next_word()
-        self._a = self._machine.read_memory_byte(addr)
+        self._a = self._read_memory_byte(addr)
         self._cycles += 13
 
-        self._log_3b_instruction(f"LDA {addr:04x}")
 
-
-    def _ldax(self):
+    def _make_ldax(self, reg_pair):
         """ Load accumulator """
-        reg_pair = (self._current_inst & 0x10) >> 4
-        addr = self._get_register_pair(reg_pair)
-        self._a = self._machine.read_memory_byte(addr)
-        self._cycles += 7
+        high_attr, low_attr = REG_PAIR_ATTR[reg_pair]
+
+        def ldax():
+            addr = (getattr(self, high_attr) << 8) | getattr(self, low_attr)
+            self._a = self._read_memory_byte(addr)
+            self._cycles += 7
 
-        self._log_1b_instruction(f"LDAX {self._reg_pair_symb(reg_pair)}")
+        return ldax
 
 
-    def _stax(self):
+    def _make_stax(self, reg_pair):
         """ Store accumulator """
-        reg_pair = (self._current_inst & 0x10) >> 4
-        addr = self._get_register_pair(reg_pair)
-        self._machine.write_memory_byte(addr, self._a)
-        self._cycles += 7
+        high_attr, low_attr = REG_PAIR_ATTR[reg_pair]
+
+        def stax():
+            addr = (getattr(self, high_attr) << 8) | getattr(self, low_attr)
+            self._write_memory_byte(addr, self._a)
+            self._cycles += 7
 
-        self._log_1b_instruction(f"STAX {self._reg_pair_symb(reg_pair)}")
+        return stax
 
 
     def _shld(self):
         """ Store H and L direct"""
         addr = self._fetch_next_word()
-        self._machine.write_memory_word(addr, self.hl)
+        self._write_memory_word(addr, self.hl)
         self._cycles += 16
 
-        self._log_3b_instruction(f"SHLD {addr:04x}")
-
 
     def _lhld(self):
         """ Load H and L direct"""
         addr = self._fetch_next_word()
-        self.hl = self._machine.read_memory_word(addr)
+        self.hl = self._read_memory_word(addr)
         self._cycles += 16
 
-        self._log_3b_instruction(f"LHLD {addr:04x}")
-
 
     def _xchg(self):
         """ Exchange DE and HL """
-        value = self.hl
-        self.hl = self.de
-        self.de = value
+        self._d, self._e, self._h, self._l = self._h, self._l, self._d, self._e
         self._cycles += 5
 
-        self._log_1b_instruction(f"XCHG")
-
 
     def _xthl(self):
         """ Exchange HL and 2 bytes on the stack """
         value = self.hl
-        self.hl = self._machine.read_stack(self._sp)
-        self._machine.write_stack(self._sp, value)
+        self.hl = self._read_stack(self._sp)
+        self._write_stack(self._sp, value)
         self._cycles += 18
 
-        self._log_1b_instruction(f"XTHL")
-
 
-    def _push(self):
+    def _make_push(self, reg_pair):
         """ Push register pair to stack """
-        reg_pair = (self._current_inst & 0x30) >> 4
-
-        if reg_pair != 3:
-            reg_pair_name = self._reg_pair_symb(reg_pair)
-            value = self._get_register_pair(reg_pair)
+        if reg_pair == 3:
+            def push():
+                self._push_to_stack(self.psw)
+                self._cycles += 11
         else:
-            reg_pair_name = "PSW"
-            value = self.psw
-
-        self._push_to_stack(value)
-        self._cycles += 11
+            high_attr, low_attr = REG_PAIR_ATTR[reg_pair]
+            def push():
+                self._push_to_stack((getattr(self, high_attr) << 8) | getattr(self, low_attr))
+                self._cycles += 11
 
-        self._log_1b_instruction(f"PUSH {reg_pair_name}")
+        return push
 
 
-    def _pop(self):
+    def _make_pop(self, reg_pair):
         """ Pop register pair from stack """
-        reg_pair = (self._current_inst & 0x30) >> 4
-
-        value = self._pop_from_stack()
-
-        if reg_pair != 3:
-            reg_pair_name = self._reg_pair_symb(reg_pair)
-            self._set_register_pair(reg_pair, value)
+        if reg_pair == 3:
+            def pop():
+                self.psw = self._pop_from_stack()
+                self._cycles += 10
         else:
-            reg_pair_name = "PSW"
-            self.psw = value
+            high_attr, low_attr = REG_PAIR_ATTR[reg_pair]
+            def pop():
+                value = self._pop_from_stack()
+                setattr(self, high_attr, value >> 8)
+                setattr(self, low_attr, value & 0xff)
+                self._cycles += 10
 
-        self._cycles += 10
-
-        self._log_1b_instruction(f"POP {reg_pair_name}")
+        return pop
 
 
     def _in(self):
         """ IO Input """
         addr = self._fetch_next_byte()
-
         self._a = self._machine.read_io(addr)
         self._cycles += 10
 
-        self._log_2b_instruction(f"IN {addr:02x}")
-
 
     def _out(self):
         """ IO Output """
         addr = self._fetch_next_byte()
-        self._log_2b_instruction(f"OUT {addr:02x}")
-
         self._machine.write_io(addr, self._a)
         self._cycles += 10
 
@@ -649,118 +839,86 @@ class CPU:
     def _jmp(self):
         """ Unconditional jump """
         addr = self._fetch_next_word()
-
-        self._log_3b_instruction(f"JMP {addr:04x}")
-
         self._pc = addr
         self._cycles += 10
 
 
-    def _check_condition(self, op):
-        """ Helper function to check condition on conditional JUMP, CALL, and RET """
-        if op == 0:
-            return not self._zero
-        if op == 1:
-            return self._zero
-        if op == 2:
-            return not self._carry
-        if op == 3:
-            return self._carry
-        if op == 4:
-            return not self._parity
-        if op == 5:
-            return self._parity
-        if op == 6:
-            return not self._sign
-        if op == 7:
-            return self._sign
-
-
-    def _jmp_cond(self):
+    def _make_jmp_cond(self, op):
         """ Conditional jump """
-        addr = self._fetch_next_word()
-        op = (self._current_inst & 0x38) >> 3
-        op_symb = ["JNZ", "JZ", "JNC", "JC", "JPO", "JPE", "JP", "JM"][op]
+        flag_attr, expected = CONDITIONS[op]
 
-        self._log_3b_instruction(f"{op_symb} {addr:04x}")
+        def jmp_cond():
+            addr = self._fetch_next_word()
+            if getattr(self, flag_attr) == expected:
+                self._pc = addr
 
-        if self._check_condition(op):
-            self._pc = addr
+            self._cycles += 10
 
-        self._cycles += 10
+        return jmp_cond
 
 
     def _call(self):
         """ Call a subroutine """
         addr = self._fetch_next_word()
-
-        self._log_3b_instruction(f"CALL {addr:04x}")
-
         self._push_to_stack(self._pc)
         self._pc = addr
         self._cycles += 17
 
 
-    def _call_cond(self):
+    def _make_call_cond(self, op):
         """ Conditional call """
-        addr = self._fetch_next_word()
-        op = (self._current_inst & 0x38) >> 3
-        op_symb = ["CNZ", "CZ", "CNC", "CC", "CPO", "CPE", "CP", "CM"][op]
+        flag_attr, expected = CONDITIONS[op]
 
-        self._log_3b_instruction(f"{op_symb} {addr:04x}")
+        def call_cond():
+            addr = self._fetch_next_word()
+            if getattr(self, flag_attr) == expected:
+                self._push_to_stack(self._pc)
+                self._pc = addr
+                self._cycles += 17
+            else:
+                self._cycles += 11
 
-        if self._check_condition(op):
-            self._push_to_stack(self._pc)
-            self._pc = addr
-            self._cycles += 17
-        else:
-            self._cycles += 11
+        return call_cond
 
 
     def _ret(self):
         """ Return from a subroutine """
-
-        self._log_1b_instruction(f"RET")
-
         self._pc = self._pop_from_stack()
         self._cycles += 10
 
 
-    def _ret_cond(self):
+    def _make_ret_cond(self, op):
         """ Conditional return """
-        op = (self._current_inst & 0x38) >> 3
-        op_symb = ["RNZ", "RZ", "RNC", "RC", "RPO", "RPE", "RP", "RM"][op]
+        flag_attr, expected = CONDITIONS[op]
 
-        self._log_1b_instruction(f"{op_symb}")
+        def ret_cond():
+            if getattr(self, flag_attr) == expected:
+                self._pc = self._pop_from_stack()
+                self._cycles += 11
+            else:
+                self._cycles += 5
 
-        if self._check_condition(op):
-            self._pc = self._pop_from_stack()
-            self._cycles += 11
-        else:
-            self._cycles += 5
+        return ret_cond
 
 
-    def _rst(self):
+    def _make_rst(self, rst):
         """ Restart (special subroutine call) """
-        rst = (self._current_inst & 0x38) >> 3
+        def rst_handler():
+            self._push_to_stack(self._pc)
+            self._pc = rst << 3
+            self._cycles += 11
 
-        self._log_1b_instruction(f"RST {rst}")
-
-        self._push_to_stack(self._pc)
-        self._pc = rst << 3
-        self._cycles += 11
+        return rst_handler
 
     
     def _pchl(self):
         """ Load HL value to PC register """
-        self._log_1b_instruction(f"PCHL")
         self._pc = self.hl
         self._cycles += 5
 
 
     def _sphl(self):
         """ Load HL value to SP register """
-        self._log_1b_instruction(f"SPHL")
         self._sp = self.hl
         self._cycles += 5
 
@@ -772,73 +930,90 @@ class CPU:
         self._enable_interrupts = True
         self._cycles += 4
 
-        self._log_1b_instruction("EI")
-
 
     def _di(self):
         """ Enable interrupts """
         self._enable_interrupts = False
         self._cycles += 4
 
-        self._log_1b_instruction("DI")
-
 
     # Arithmetic instructions
 
-    def _count_bits(self, n):
-        """ Return number of set bits """
-        if (n == 0):
-            return 0
-        else:
-            return 1 + self._count_bits(n & (n - 1))
-
-    def _alu_op(self, op, value):
-        """ Internal implementation of an ALU operation between the accumulator and value.
-        The function updates flags as a result of the operation """
-
-        # Perform the operation
-        if op == 0: # ADD
-            res = self._a + value
-            self._carry = res > 0xff
-            self._half_carry = ((self._a & 0x0f) + (value & 0x0f)) > 0x0f
-        if op == 1: # ADC
-            carry = 1 if self._carry else 0
-            res = self._a + value + carry
-            self._carry = res > 0xff
-            self._half_carry = ((self._a & 0x0f) + (value & 0x0f) + carry) > 0x0f
-        if op == 2 or op == 7: # SUB and CMP
-            res = self._a - value
-            self._carry = res < 0
-            neg_value = ~value + 1
-            self._half_carry = ((self._a & 0x0f) + (neg_value & 0x0f)) > 0x0f
-        if op == 3: # SBB
-            carry = 1 if self._carry else 0
-            res = self._a - value - carry
-            self._carry = res < 0 
-            neg_value = ~value + 1
-            self._half_carry = ((self._a & 0x0f) + ((neg_value - carry) & 0x0f)) > 0x0f
-        if op == 4: # AND
-            res = self._a & value
-        if op == 5: # XOR
-            res = self._a ^ value
-        if op == 6: # OR
-            res = self._a | value
-
-        res &= 0xff
-
-        # Store result for all operations, except for CMP
-        if op != 7:
-            self._a = res
-
-        # Update common flags
-        if op >= 4 and op < 7: self._carry = False
-        if op >= 4 and op < 7: self._half_carry = False
-        self._zero = res == 0
-        self._parity = self._count_bits(res) % 2 == 0
-        self._sign = (res & 0x80) != 0
-
-
-    def _alu(self):
+    def _alu_add(self, value):
+        a = self._a
+        res = a + value
+        self._carry = res > 0xff
+        self._half_carry = HALF_CARRY_ADD[((a & 0x0f) << 4) | (value & 0x0f)]
+        self._a = res = res & 0xff
+        self._sign, self._zero, self._parity = SZP_FLAGS[res]
+
+
+    def _alu_adc(self, value):
+        a = self._a
+        carry = 1 if self._carry else 0
+        res = a + value + carry
+        self._carry = res > 0xff
+        self._half_carry = HALF_CARRY_ADD[(carry << 8) | ((a & 0x0f) << 4) | (value & 0x0f)]
+        self._a = res = res & 0xff
+        self._sign, self._zero, self._parity = SZP_FLAGS[res]
+
+
+    def _alu_sub(self, value):
+        a = self._a
+        res = a - value
+        self._carry = res < 0
+        self._half_carry = HALF_CARRY_SUB[((a & 0x0f) << 4) | (value & 0x0f)]
+        self._a = res = res & 0xff
+        self._sign, self._zero, self._parity = SZP_FLAGS[res]
+
+
+    def _alu_sbb(self, value):
+        a = self._a
+        carry = 1 if self._carry else 0
+        res = a - value - carry
+        self._carry = res < 0 
+        self._half_carry = HALF_CARRY_SUB[(carry << 8) | ((a & 0x0f) << 4) | (value & 0x0f)]
+        self._a = res = res & 0xff
+        self._sign, self._zero, self._parity = SZP_FLAGS[res]
+
+
+    def _alu_and(self, value):
+        self._a = res = self._a & value
+        self._carry = False
+        self._half_carry = False
+        self._sign, self._zero, self._parity = SZP_FLAGS[res]
+
+
+    def _alu_xor(self, value):
+        self._a = res = self._a ^ value
+        self._carry = False
+        self._half_carry = False
+        self._sign, self._zero, self._parity = SZP_FLAGS[res]
+
+
+    def _alu_or(self, value):
+        self._a = res = self._a | value
+        self._carry = False
+        self._half_carry = False
+        self._sign, self._zero, self._parity = SZP_FLAGS[res]
+
+
+    def _alu_cmp(self, value):
+        # Same as SUB, but the result is not stored to the accumulator
+        a = self._a
+        res = a - value
+        self._carry = res < 0
+        self._half_carry = HALF_CARRY_SUB[((a & 0x0f) << 4) | (value & 0x0f)]
+        self._sign, self._zero, self._parity = SZP_FLAGS[res & 0xff]
+
+
+    def _get_alu_op(self, op):
+        """ Get an ALU operation between the accumulator and value, that also updates flags """
+        return [self._alu_add, self._alu_adc, self._alu_sub, self._alu_sbb, 
+                self._alu_and, self._alu_xor, self._alu_or, self._alu_cmp][op]
+
+
+    def _make_alu(self, op, reg):
         """ 
         Implementation of the following instructions:
             - ADD - add a register to the accumulator
@@ -850,18 +1025,22 @@ class CPU:
             - ORA - logical OR a register with the accumulator
             - CMP - compare a register with the accumulator (set flags, but not change accumulator)
         """
-        op = (self._current_inst & 0x38) >> 3
-        op_name = ["ADD", "ADC", "SUB", "SBB", "ANA", "XRA", "ORA", "CMP"][op]
-        reg = self._current_inst & 0x07
-        value = self._get_register(reg)
+        alu_op = self._get_alu_op(op)
 
-        self._alu_op(op, value)
-        self._cycles += 4 if reg != 6 else 7
+        if reg == 6:
+            def alu():
+                alu_op(self._read_memory_byte((self._h << 8) | self._l))
+                self._cycles += 7
+        else:
+            attr = REG_ATTR[reg]
+            def alu():
+                alu_op(getattr(self, attr))
+                self._cycles += 4
 
-        self._log_1b_instruction(f"{op_name} {self._reg_symb(reg)}")
+        return alu
 
 
-    def _alu_immediate(self):
+    def _make_alu_immediate(self, op):
         """ 
         Implementation of ALU instructions between the accumulator register and 
         immediate operand:
@@ -874,95 +1053,125 @@ class CPU:
             - ORI - logical OR the operand with the accumulator
             - CPI - compare the operand with the accumulator (set flags, but not change accumulator)
         """
-        op = (self._current_inst & 0x38) >> 3
-        op_name = ["ADI", "ACI", "SUI", "SBI", "ANI", "XRI", "ORI", "CPI"][op]
-        value = self._fetch_next_byte()
+        alu_op = self._get_alu_op(op)
 
-        self._alu_op(op, value)
-        self._cycles += 7
+        def alu_immediate():
+            value = self._fetch_next_byte()
+            alu_op(value)
+            self._cycles += 7
 
-        self._log_2b_instruction(f"{op_name} {value:02x}")
+        return alu_immediate
 
 
     def _daa(self):
         """ Decimal adjust accumulator """
-        if (self._a & 0xf) > 9 or self._half_carry:
-            self._a = (self._a + 0x6) & 0xff
-            self._half_carry = True
-
-        if (self._a & 0xf0) > 0x90 or self._carry:
-            self._a = (self._a + 0x60) & 0xff
-            self._carry = True
-
-        self._zero = (self._a & 0xff) == 0
-        self._parity = self._count_bits(self._a) % 2 == 0
-        self._sign = (self._a & 0x80) != 0
+        index = self._a | (0x100 if self._carry else 0) | (0x200 if self._half_carry else 0)
+        self._a, self._carry, self._half_carry = DAA_RESULTS[index]
+        self._sign, self._zero, self._parity = SZP_FLAGS[self._a]
 
         self._cycles += 4
-        self._log_1b_instruction(f"DAA")
-        
 
-    def _dcr(self):
-        """ Decrement a register """
-        reg = (self._current_inst & 0x38) >> 3
-        value = (self._get_register(reg) - 1) & 0xff
-        self._set_register(reg, value)
 
-        self._zero = (value & 0xff) == 0
-        self._parity = self._count_bits(value) % 2 == 0
-        self._sign = (value & 0x80) != 0
-        self._half_carry = value == 0x0f
+    def _make_dcr(self, reg):
+        """ Decrement a register """
+        if reg == 6:
+            def dcr():
+                addr = (self._h << 8) | self._l
+                value = (self._read_memory_byte(addr) - 1) & 0xff
+                self._write_memory_byte(addr, value)
+                self._sign, self._zero, self._parity = SZP_FLAGS[value]
+                self._half_carry = value == 0x0f
+                self._cycles += 10
+        else:
+            attr = REG_ATTR[reg]
+            def dcr():
+                value = (getattr(self, attr) - 1) & 0xff
+                setattr(self, attr, value)
+                self._sign, self._zero, self._parity = SZP_FLAGS[value]
+                self._half_carry = value == 0x0f
+                self._cycles += 5
 
-        self._log_1b_instruction(f"DCR {self._reg_symb(reg)}")
-        self._cycles += 10 if reg == 6 else 5
+        return dcr
 
 
-    def _inr(self):
+    def _make_inr(self, reg):
         """ Increment a register """
-        reg = (self._current_inst & 0x38) >> 3
-        value = (self._get_register(reg) + 1) & 0xff
-        self._set_register(reg, value)
-
-        self._zero = (value & 0xff) == 0
-        self._parity = self._count_bits(value) % 2 == 0
-        self._sign = (value & 0x80) != 0
-        self._half_carry = (value & 0xf) == 0x0
+        if reg == 6:
+            def inr():
+                addr = (self._h << 8) | self._l
+                value = (self._read_memory_byte(addr) + 1) & 0xff
+                self._write_memory_byte(addr, value)
+                self._sign, self._zero, self._parity = SZP_FLAGS[value]
+                self._half_carry = (value & 0xf) == 0x0
+                self._cycles += 10
+        else:
+            attr = REG_ATTR[reg]
+            def inr():
+                value = (getattr(self, attr) + 1) & 0xff
+                setattr(self, attr, value)
+                self._sign, self._zero, self._parity = SZP_FLAGS[value]
+                self._half_carry = (value & 0xf) == 0x0
+                self._cycles += 5
 
-        self._log_1b_instruction(f"INR {self._reg_symb(reg)}")
-        self._cycles += 10 if reg == 6 else 5
+        return inr
 
 
-    def _dcx(self):
+    def _make_dcx(self, reg_pair):
         """ Decrement a register pair """
-        reg_pair = (self._current_inst & 0x30) >> 4
-        value = self._get_register_pair(reg_pair)
-        self._set_register_pair(reg_pair, (value - 1) & 0xffff)
-        self._cycles += 5
 
-        self._log_1b_instruction(f"DCX {self._reg_pair_symb(reg_pair)}")
+        if reg_pair == 3:
+            def dcx():
+                self._sp = (self._sp - 1) & 0xffff
+                self._cycles += 5
+        else:
+            high_attr, low_attr = REG_PAIR_ATTR[reg_pair]
+            def dcx():
+                value = (((getattr(self, high_attr) << 8) | getattr(self, low_attr)) - 1) & 0xffff
+                setattr(self, high_attr, value >> 8)
+                setattr(self, low_attr, value & 0xff)
+                self._cycles += 5
+
+        return dcx
 
 
-    def _inx(self):
+    def _make_inx(self, reg_pair):
         """ Increment a register pair """
-        reg_pair = (self._current_inst & 0x30) >> 4
-        value = self._get_register_pair(reg_pair)
-        self._set_register_pair(reg_pair, (value + 1) & 0xffff)
-        self._cycles += 5
 
-        self._log_1b_instruction(f"INX {self._reg_pair_symb(reg_pair)}")
+        if reg_pair == 3:
+            def inx():
+                self._sp = (self._sp + 1) & 0xffff
+                self._cycles += 5
+        else:
+            high_attr, low_attr = REG_PAIR_ATTR[reg_pair]
+            def inx():
+                value = (((getattr(self, high_attr) << 8) | getattr(self, low_attr)) + 1) & 0xffff
+                setattr(self, high_attr, value >> 8)
+                setattr(self, low_attr, value & 0xff)
+                self._cycles += 5
+
+        return inx
 
 
-    def _dad(self):
+    def _make_dad(self, reg_pair):
         """ Double Add """
-        reg_pair = (self._current_inst & 0x30) >> 4
-        value = self._get_register_pair(reg_pair)
-        res = self.hl + value
-        self.hl = res & 0xffff
-        self._carry = (res >= 0x10000)
 
-        self._cycles += 10
+        if reg_pair == 3:
+            def dad():
+                res = ((self._h << 8) | self._l) + self._sp
+                self._h = (res >> 8) & 0xff
+                self._l = res & 0xff
+                self._carry = (res >= 0x10000)
+                self._cycles += 10
+        else:
+            high_attr, low_attr = REG_PAIR_ATTR[reg_pair]
+            def dad():
+                res = ((self._h << 8) | self._l) + ((getattr(self, high_attr) << 8) | getattr(self, low_attr))
+                self._h = (res >> 8) & 0xff
+                self._l = res & 0xff
+                self._carry = (res >= 0x10000)
+                self._cycles += 10
 
-        self._log_1b_instruction(f"DAD {self._reg_pair_symb(reg_pair)}")
+        return dad
 
 
     def _rlc(self):
@@ -971,8 +1180,6 @@ class CPU:
         self._a = ((self._a << 1) & 0xff) | (self._a >> 7)
         self._cycles += 4
 
-        self._log_1b_instruction(f"RLC")
-
 
     def _rrc(self):
         """ Rotate accumulator right """
@@ -980,8 +1187,6 @@ class CPU:
         self._a = ((self._a >> 1) & 0xff) | ((self._a << 7) & 0xff)
         self._cycles += 4
 
-        self._log_1b_instruction(f"RRC")
-
 
     def _ral(self):
         """ Rotate accumulator left through carry """
@@ -991,8 +1196,6 @@ class CPU:
         self._carry = is_bit_set(temp, 7)
         self._cycles += 4
 
-        self._log_1b_instruction(f"RAL")
-
 
     def _rar(self):
         """ Rotate accumulator right through carry """
@@ -1002,302 +1205,98 @@ class CPU:
         self._carry = is_bit_set(temp, 0)
         self._cycles += 4
 
-        self._log_1b_instruction(f"RAR")
-
 
     def _stc(self):
         """ Set carry bit """
         self._carry = True
         self._cycles += 4
 
-        self._log_1b_instruction(f"STC")
-        
 
     def _cmc(self):
         """ Complement carry bit """
         self._carry = not self._carry
         self._cycles += 4
 
-        self._log_1b_instruction(f"CMC")
-        
 
     def _cma(self):
         """ Complement accumulator """
         self._a = (~self._a) & 0xff
         self._cycles += 4
 
-        self._log_1b_instruction(f"CMA")
-        
 
     def init_instruction_table(self):
-        self._instructions[0x00] = self._nop
-        self._instructions[0x01] = self._lxi
-        self._instructions[0x02] = self._stax
-        self._instructions[0x03] = self._inx
-        self._instructions[0x04] = self._inr
-        self._instructions[0x05] = self._dcr
-        self._instructions[0x06] = self._mvi
-        self._instructions[0x07] = self._rlc
-        self._instructions[0x08] = None
-        self._instructions[0x09] = self._dad
-        self._instructions[0x0A] = self._ldax
-        self._instructions[0x0B] = self._dcx
-        self._instructions[0x0C] = self._inr
-        self._instructions[0x0D] = self._dcr
-        self._instructions[0x0E] = self._mvi
-        self._instructions[0x0F] = self._rrc
-
-        self._instructions[0x10] = None
-        self._instructions[0x11] = self._lxi
-        self._instructions[0x12] = self._stax
-        self._instructions[0x13] = self._inx
-        self._instructions[0x14] = self._inr
-        self._instructions[0x15] = self._dcr
-        self._instructions[0x16] = self._mvi
-        self._instructions[0x17] = self._ral
-        self._instructions[0x18] = None
-        self._instructions[0x19] = self._dad
-        self._instructions[0x1A] = self._ldax
-        self._instructions[0x1B] = self._dcx
-        self._instructions[0x1C] = self._inr
-        self._instructions[0x1D] = self._dcr
-        self._instructions[0x1E] = self._mvi
-        self._instructions[0x1F] = self._rar
-
-        self._instructions[0x20] = None
-        self._instructions[0x21] = self._lxi
-        self._instructions[0x22] = self._shld
-        self._instructions[0x23] = self._inx
-        self._instructions[0x24] = self._inr
-        self._instructions[0x25] = self._dcr
-        self._instructions[0x26] = self._mvi
-        self._instructions[0x27] = self._daa
-        self._instructions[0x28] = None
-        self._instructions[0x29] = self._dad
-        self._instructions[0x2A] = self._lhld
-        self._instructions[0x2B] = self._dcx
-        self._instructions[0x2C] = self._inr
-        self._instructions[0x2D] = self._dcr
-        self._instructions[0x2E] = self._mvi
-        self._instructions[0x2F] = self._cma
-
-        self._instructions[0x30] = None
-        self._instructions[0x31] = self._lxi
-        self._instructions[0x32] = self._sta
-        self._instructions[0x33] = self._inx
-        self._instructions[0x34] = self._inr
-        self._instructions[0x35] = self._dcr
-        self._instructions[0x36] = self._mvi
-        self._instructions[0x37] = self._stc
-        self._instructions[0x38] = None
-        self._instructions[0x39] = self._dad
-        self._instructions[0x3A] = self._lda
-        self._instructions[0x3B] = self._dcx
-        self._instructions[0x3C] = self._inr
-        self._instructions[0x3D] = self._dcr
-        self._instructions[0x3E] = self._mvi
-        self._instructions[0x3F] = self._cmc
-
-        self._instructions[0x40] = self._mov
-        self._instructions[0x41] = self._mov
-        self._instructions[0x42] = self._mov
-        self._instructions[0x43] = self._mov
-        self._instructions[0x44] = self._mov
-        self._instructions[0x45] = self._mov
-        self._instructions[0x46] = self._mov
-        self._instructions[0x47] = self._mov
-        self._instructions[0x48] = self._mov
-        self._instructions[0x49] = self._mov
-        self._instructions[0x4A] = self._mov
-        self._instructions[0x4B] = self._mov
-        self._instructions[0x4C] = self._mov
-        self._instructions[0x4D] = self._mov
-        self._instructions[0x4E] = self._mov
-        self._instructions[0x4F] = self._mov
-
-        self._instructions[0x50] = self._mov
-        self._instructions[0x51] = self._mov
-        self._instructions[0x52] = self._mov
-        self._instructions[0x53] = self._mov
-        self._instructions[0x54] = self._mov
-        self._instructions[0x55] = self._mov
-        self._instructions[0x56] = self._mov
-        self._instructions[0x57] = self._mov
-        self._instructions[0x58] = self._mov
-        self._instructions[0x59] = self._mov
-        self._instructions[0x5A] = self._mov
-        self._instructions[0x5B] = self._mov
-        self._instructions[0x5C] = self._mov
-        self._instructions[0x5D] = self._mov
-        self._instructions[0x5E] = self._mov
-        self._instructions[0x5F] = self._mov
-
-        self._instructions[0x60] = self._mov
-        self._instructions[0x61] = self._mov
-        self._instructions[0x62] = self._mov
-        self._instructions[0x63] = self._mov
-        self._instructions[0x64] = self._mov
-        self._instructions[0x65] = self._mov
-        self._instructions[0x66] = self._mov
-        self._instructions[0x67] = self._mov
-        self._instructions[0x68] = self._mov
-        self._instructions[0x69] = self._mov
-        self._instructions[0x6A] = self._mov
-        self._instructions[0x6B] = self._mov
-        self._instructions[0x6C] = self._mov
-        self._instructions[0x6D] = self._mov
-        self._instructions[0x6E] = self._mov
-        self._instructions[0x6F] = self._mov
-
-        self._instructions[0x70] = self._mov
-        self._instructions[0x71] = self._mov
-        self._instructions[0x72] = self._mov
-        self._instructions[0x73] = self._mov
-        self._instructions[0x74] = self._mov
-        self._instructions[0x75] = self._mov
-        self._instructions[0x76] = None
-        self._instructions[0x77] = self._mov
-        self._instructions[0x78] = self._mov
-        self._instructions[0x79] = self._mov
-        self._instructions[0x7A] = self._mov
-        self._instructions[0x7B] = self._mov
-        self._instructions[0x7C] = self._mov
-        self._instructions[0x7D] = self._mov
-        self._instructions[0x7E] = self._mov
-        self._instructions[0x7F] = self._mov
-
-        self._instructions[0x80] = self._alu
-        self._instructions[0x81] = self._alu
-        self._instructions[0x82] = self._alu
-        self._instructions[0x83] = self._alu
-        self._instructions[0x84] = self._alu
-        self._instructions[0x85] = self._alu
-        self._instructions[0x86] = self._alu
-        self._instructions[0x87] = self._alu
-        self._instructions[0x88] = self._alu
-        self._instructions[0x89] = self._alu
-        self._instructions[0x8A] = self._alu
-        self._instructions[0x8B] = self._alu
-        self._instructions[0x8C] = self._alu
-        self._instructions[0x8D] = self._alu
-        self._instructions[0x8E] = self._alu
-        self._instructions[0x8F] = self._alu
-
-        self._instructions[0x90] = self._alu
-        self._instructions[0x91] = self._alu
-        self._instructions[0x92] = self._alu
-        self._instructions[0x93] = self._alu
-        self._instructions[0x94] = self._alu
-        self._instructions[0x95] = self._alu
-        self._instructions[0x96] = self._alu
-        self._instructions[0x97] = self._alu
-        self._instructions[0x98] = self._alu
-        self._instructions[0x99] = self._alu
-        self._instructions[0x9A] = self._alu
-        self._instructions[0x9B] = self._alu
-        self._instructions[0x9C] = self._alu
-        self._instructions[0x9D] = self._alu
-        self._instructions[0x9E] = self._alu
-        self._instructions[0x9F] = self._alu
-
-        self._instructions[0xA0] = self._alu
-        self._instructions[0xA1] = self._alu
-        self._instructions[0xA2] = self._alu
-        self._instructions[0xA3] = self._alu
-        self._instructions[0xA4] = self._alu
-        self._instructions[0xA5] = self._alu
-        self._instructions[0xA6] = self._alu
-        self._instructions[0xA7] = self._alu
-        self._instructions[0xA8] = self._alu
-        self._instructions[0xA9] = self._alu
-        self._instructions[0xAA] = self._alu
-        self._instructions[0xAB] = self._alu
-        self._instructions[0xAC] = self._alu
-        self._instructions[0xAD] = self._alu
-        self._instructions[0xAE] = self._alu
-        self._instructions[0xAF] = self._alu
-
-        self._instructions[0xB0] = self._alu
-        self._instructions[0xB1] = self._alu
-        self._instructions[0xB2] = self._alu
-        self._instructions[0xB3] = self._alu
-        self._instructions[0xB4] = self._alu
-        self._instructions[0xB5] = self._alu
-        self._instructions[0xB6] = self._alu
-        self._instructions[0xB7] = self._alu
-        self._instructions[0xB8] = self._alu
-        self._instructions[0xB9] = self._alu
-        self._instructions[0xBA] = self._alu
-        self._instructions[0xBB] = self._alu
-        self._instructions[0xBC] = self._alu
-        self._instructions[0xBD] = self._alu
-        self._instructions[0xBE] = self._alu
-        self._instructions[0xBF] = self._alu
-
-        self._instructions[0xC0] = self._ret_cond
-        self._instructions[0xC1] = self._pop
-        self._instructions[0xC2] = self._jmp_cond
-        self._instructions[0xC3] = self._jmp
-        self._instructions[0xC4] = self._call_cond
-        self._instructions[0xC5] = self._push
-        self._instructions[0xC6] = self._alu_immediate
-        self._instructions[0xC7] = self._rst
-        self._instructions[0xC8] = self._ret_cond
-        self._instructions[0xC9] = self._ret
-        self._instructions[0xCA] = self._jmp_cond
-        self._instructions[0xCB] = None
-        self._instructions[0xCC] = self._call_cond
-        self._instructions[0xCD] = self._call
-        self._instructions[0xCE] = self._alu_immediate
-        self._instructions[0xCF] = self._rst
-
-        self._instructions[0xD0] = self._ret_cond
-        self._instructions[0xD1] = self._pop
-        self._instructions[0xD2] = self._jmp_cond
-        self._instructions[0xD3] = self._out
-        self._instructions[0xD4] = self._call_cond
-        self._instructions[0xD5] = self._push
-        self._instructions[0xD6] = self._alu_immediate
-        self._instructions[0xD7] = self._rst
-        self._instructions[0xD8] = self._ret_cond
-        self._instructions[0xD9] = None
-        self._instructions[0xDA] = self._jmp_cond
-        self._instructions[0xDB] = self._in
-        self._instructions[0xDC] = self._call_cond
-        self._instructions[0xDD] = None
-        self._instructions[0xDE] = self._alu_immediate
-        self._instructions[0xDF] = self._rst
-
-        self._instructions[0xE0] = self._ret_cond
-        self._instructions[0xE1] = self._pop
-        self._instructions[0xE2] = self._jmp_cond
-        self._instructions[0xE3] = self._xthl
-        self._instructions[0xE4] = self._call_cond
-        self._instructions[0xE5] = self._push
-        self._instructions[0xE6] = self._alu_immediate
-        self._instructions[0xE7] = self._rst
-        self._instructions[0xE8] = self._ret_cond
-        self._instructions[0xE9] = self._pchl
-        self._instructions[0xEA] = self._jmp_cond
-        self._instructions[0xEB] = self._xchg
-        self._instructions[0xEC] = self._call_cond
-        self._instructions[0xED] = None
-        self._instructions[0xEE] = self._alu_immediate
-        self._instructions[0xEF] = self._rst
-
-        self._instructions[0xF0] = self._ret_cond
-        self._instructions[0xF1] = self._pop
-        self._instructions[0xF2] = self._jmp_cond
-        self._instructions[0xF3] = self._di
-        self._instructions[0xF4] = self._call_cond
-        self._instructions[0xF5] = self._push
-        self._instructions[0xF6] = self._alu_immediate
-        self._instructions[0xF7] = self._rst
-        self._instructions[0xF8] = self._ret_cond
-        self._instructions[0xF9] = self._sphl
-        self._instructions[0xFA] = self._jmp_cond
-        self._instructions[0xFB] = self._ei
-        self._instructions[0xFC] = self._call_cond
-        self._instructions[0xFD] = None
-        self._instructions[0xFE] = self._alu_immediate
-        self._instructions[0xFF] = self._rst
+        """
+        Build the instruction tables. Each opcode gets its own handler, with operands (registers, 
+        register pairs, conditions) decoded once at table build time, so that the handlers do not need
+        to decode the instruction during execution. Undocumented opcodes are left as None.
+
+        Two tables are built: a lean one, which handlers do not perform any logging, and a tracing one,
+        which handlers log every instruction. See update_logging() for the table selection.
+        """
+        instructions = [None] * 0x100
+
+        for reg_pair in range(4):
+            instructions[0x01 | (reg_pair << 4)] = self._make_lxi(reg_pair)
+            instructions[0x03 | (reg_pair << 4)] = self._make_inx(reg_pair)
+            instructions[0x09 | (reg_pair << 4)] = self._make_dad(reg_pair)
+            instructions[0x0B | (reg_pair << 4)] = self._make_dcx(reg_pair)
+            instructions[0xC1 | (reg_pair << 4)] = self._make_pop(reg_pair)
+            instructions[0xC5 | (reg_pair << 4)] = self._make_push(reg_pair)
+
+        for reg_pair in range(2):
+            instructions[0x02 | (reg_pair << 4)] = self._make_stax(reg_pair)
+            instructions[0x0A | (reg_pair << 4)] = self._make_ldax(reg_pair)
+
+        for reg in range(8):
+            instructions[0x04 | (reg << 3)] = self._make_inr(reg)
+            instructions[0x05 | (reg << 3)] = self._make_dcr(reg)
+            instructions[0x06 | (reg << 3)] = self._make_mvi(reg)
+
+        for dst in range(8):
+            for src in range(8):
+                if dst == 6 and src == 6:
+                    continue        # 0x76 is HLT, which is not supported
+                instructions[0x40 | (dst << 3) | src] = self._make_mov(dst, src)
+
+        for op in range(8):
+            for reg in range(8):
+                instructions[0x80 | (op << 3) | reg] = self._make_alu(op, reg)
+
+            instructions[0xC6 | (op << 3)] = self._make_alu_immediate(op)
+
+        for op in range(8):
+            instructions[0xC0 | (op << 3)] = self._make_ret_cond(op)
+            instructions[0xC2 | (op << 3)] = self._make_jmp_cond(op)
+            instructions[0xC4 | (op << 3)] = self._make_call_cond(op)
+            instructions[0xC7 | (op << 3)] = self._make_rst(op)
+
+        instructions[0x00] = self._nop
+        instructions[0x07] = self._rlc
+        instructions[0x0F] = self._rrc
+        instructions[0x17] = self._ral
+        instructions[0x1F] = self._rar
+        instructions[0x22] = self._shld
+        instructions[0x27] = self._daa
+        instructions[0x2A] = self._lhld
+        instructions[0x2F] = self._cma
+        instructions[0x32] = self._sta
+        instructions[0x37] = self._stc
+        instructions[0x3A] = self._lda
+        instructions[0x3F] = self._cmc
+
+        instructions[0xC3] = self._jmp
+        instructions[0xC9] = self._ret
+        instructions[0xCD] = self._call
+        instructions[0xD3] = self._out
+        instructions[0xDB] = self._in
+        instructions[0xE3] = self._xthl
+        instructions[0xE9] = self._pchl
+        instructions[0xEB] = self._xchg
+        instructions[0xF3] = self._di
+        instructions[0xF9] = self._sphl
+        instructions[0xFB] = self._ei
+
+        self._lean_instructions = instructions
+        self._traced_instructions = [self._make_traced(opcode, handler) if handler else None 
+                                     for opcode, handler in enumerate(instructions)]
+        self.update_logging()
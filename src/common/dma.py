@@ -1,5 +1,6 @@
 from common.utils import *
 from common.interfaces import *
+from common.state import pack_optional, unpack_optional
 
 DMA_CH0_START   = 0
 DMA_CH0_COUNT   = 1
@@ -114,6 +115,10 @@ class DMA:
                 raise MemoryError(f"Writing DMA register {offset} is not supported")
 
 
+    def is_channel_enabled(self, channel):
+        return self._channels[channel]['enabled']
+
+
     def _get_transfer_settings(self, channel):
         if not self._channels[channel]['enabled']:
             raise RuntimeError(f"DMA Channel {channel} is not configured for data transfer")
@@ -145,3 +150,25 @@ class DMA:
 
         self._machine.write_memory_burst(start_addr, data)
 
+
+    def save_state(self):
+        data = pack_optional(self._autoload, self._tc_stop, self._extended_write, self._rotating_priority,
+                             self._waiting_high_byte)
+        for channel in self._channels:
+            data += pack_optional(channel['enabled'], channel['start_addr'], channel['count'],
+                                  channel['read'], channel['write'])
+        return data
+
+
+    def load_state(self, data):
+        values = unpack_optional(data)
+        (self._autoload, self._tc_stop, self._extended_write, self._rotating_priority,
+         self._waiting_high_byte) = (bool(value) for value in values[0:5])
+
+        for i, channel in enumerate(self._channels):
+            enabled, start_addr, count, read, write = values[5 + i*5 : 10 + i*5]
+            channel['enabled'] = bool(enabled)
+            channel['start_addr'] = start_addr
+            channel['count'] = count
+            channel['read'] = bool(read)
+            channel['write'] = bool(write)
@@ -1,6 +1,45 @@
+import os
+import copy
 import logging
+import struct
 from common.machine import Machine
 from common.cpu import CPU
+from common.translator import BlockTranslator
+from common.state import STATE_MAGIC, STATE_VERSION, pack_chunk, unpack_chunks
+
+_tape_images = {}   # Parsed tape images cache: file name -> (modification time, start address, data)
+
+def read_tape_image(fname):
+    """
+    Parse the tape file (.rk/.rku, or .pki/.gam with a sync byte), and return the start address and
+    the data bytes. Parsed images are cached until the file is modified, as configurations load the same
+    images every start.
+    """
+    fname = os.path.abspath(fname)
+    mtime = os.stat(fname).st_mtime_ns
+    cached = _tape_images.get(fname)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    with open(fname, "rb") as f:
+        data = f.read()
+
+    offset = 0      
+    if fname.upper().endswith(".PKI") or fname.upper().endswith(".GAM"):
+        offset += 1         # Skip the sync byte
+
+    addr = (data[offset] << 8) | data[offset + 1]
+    endaddr = (data[offset+2] << 8) | data[offset + 3]
+    offset += 4
+
+    size = max(endaddr - addr + 1, 0)
+    if offset + size > len(data):
+        raise ValueError(f"Tape file {fname} is truncated: {size} bytes expected, {len(data) - offset} found")
+
+    data = data[offset : offset + size]
+    _tape_images[fname] = (mtime, addr, data)
+    return addr, data
+
 
 class Emulator:
     """
@@ -13,12 +52,43 @@ class Emulator:
 
         In order to speed up data loading into the computer, this emulator class provides a feature to load
         a tape data from disk directly to the emulater computer memory.
+
+        Optionally, the Emulator may run the code using the basic block translator (see BlockTranslator
+        class for details), which is significantly faster than interpreting instructions one by one. The
+        translated code does not cross breakpoint addresses, so breakpoints work the same way in both modes.
+        Single steps are always executed by the CPU interpreter.
+
+        Most of the time an interactive machine sits in a loop, polling the keyboard port and waiting for
+        a key press. If the idle detection is enabled, the Emulator takes a snapshot of the CPU registers and
+        the flat memory at the current address, and checks whether the machine returns to exactly the same
+        state at the same address, with no writes through the Machine in between (device memory such as the
+        video RAM, I/O ports, intercepted stack operations, see Machine.get_write_count()). Such a loop
+        (possibly blinking the cursor with a delay counter) has no side effects, and will spin the same way
+        until the input changes. When this is confirmed a few times, the rest of the cycles budget is
+        skipped, and the is_idle() function reports the state, so that the caller may sleep until the next
+        input event. Following runs are skipped almost immediately, until the caller reports an input change
+        with the wake() function.
+
+        Changes made by the emulated code are detected automatically, as well as pending interrupts. But
+        inputs changed outside of the emulation (e.g. a key pressed on the host keyboard, or a device value
+        changed by a test) are not visible to the detection, so the caller must call wake() after changing
+        them. The detection requires flat memory to be enabled (see Machine.enable_flat_memory()).
     """
+
+    IDLE_CONFIRMATIONS = 2          # Number of identical state matches needed to consider the machine idle
+    IDLE_PROBE_CYCLES = 10000000    # Number of cycles to wait for the machine to get back to the probe state
+
     def __init__(self, machine):
         self._machine = machine
         self._cpu = CPU(self._machine)
         self._breakpoints = {}
+        self._stop_addrs = set()    # Addresses the translated code shall not cross (breakpoints, current run target)
         self._startaddr = 0x0000
+        self._translator = None
+        self._idle_detection = False
+        self._idle = False
+        self._idle_probe = -1
+        self._stop_requested = False
 
     def set_start_addr(self, addr):
         self._startaddr = addr
@@ -26,8 +96,117 @@ class Emulator:
     def add_breakpoint(self, addr, fn):
         if addr not in self._breakpoints:
             self._breakpoints[addr] = []    
+            self._add_stop_addr(addr)
         self._breakpoints[addr].append(fn)
 
+    def _add_stop_addr(self, addr):
+        if addr not in self._stop_addrs:
+            self._stop_addrs.add(addr)
+            if self._translator:
+                self._translator.invalidate_addr(addr)
+
+    def _remove_stop_addr(self, addr):
+        if addr in self._stop_addrs and addr not in self._breakpoints:
+            self._stop_addrs.discard(addr)
+            if self._translator:
+                self._translator.invalidate_addr(addr)
+
+    def enable_block_translation(self, enabled=True):
+        """
+        Enable the block translator. The translator runs only the code located in the flat memory image
+        (other code is interpreted), so the machine flat memory mode is enabled as well. Disabling the flat
+        memory afterwards makes the translator fall back to the interpreter for every instruction.
+        """
+        if enabled:
+            self._machine.enable_flat_memory()
+            self._translator = BlockTranslator(self._cpu, self._stop_addrs)
+        else:
+            self._translator = None
+
+    def enable_idle_detection(self, enabled=True):
+        self._idle_detection = enabled
+        self.wake()
+
+    def is_idle(self):
+        """ Returns True if the last run was cut short, as the machine was spinning in an idle loop """
+        return self._idle
+
+    def _get_registers(self):
+        cpu = self._cpu
+        return (cpu._a, cpu._b, cpu._c, cpu._d, cpu._e, cpu._h, cpu._l, cpu._sp,
+                cpu._sign, cpu._zero, cpu._half_carry, cpu._parity, cpu._carry,
+                cpu._enable_interrupts, tuple(cpu._interrupt_instructions))
+
+    def wake(self):
+        """
+        Notify the emulator that the machine input has changed (e.g. a key was pressed), so the idle
+        state is no longer valid.
+        """
+        self._idle = False
+        self._idle_probe = -1
+
+    def _start_idle_probe(self):
+        # Idle state is meaningful only if the RAM is visible through the flat memory image
+        cpu = self._cpu
+        if not self._idle_detection or not any(cpu._write_pages):
+            self.wake()
+            return -1
+
+        # The probe may be kept for several runs, as wait loops with a blinking cursor or a delay counter
+        # have quite a long period. Take a new snapshot if the code went away from the probe address, or
+        # there was no match for too long.
+        if (self._idle_probe < 0 or not self._idle_probe_hit
+                or cpu._cycles - self._idle_start > self.IDLE_PROBE_CYCLES):
+            self._idle_probe = cpu._pc
+            self._idle_registers = self._get_registers()
+            self._idle_memory = None        # Taken on the first match (see _check_idle())
+            self._idle_writes = self._machine.get_write_count()
+            self._idle_start = cpu._cycles
+            self._idle_matches = self.IDLE_CONFIRMATIONS
+
+        self._idle_probe_hit = False
+        return self._idle_probe
+
+    def _check_idle(self, limit):
+        # Called when the CPU gets back to the probe address. The machine may get back to the probe state
+        # right at the run boundary (e.g. a translated loop runs until the end of the run). If the machine
+        # was idle, and nothing woke it up, a single match is enough to skip the run entirely.
+        cpu = self._cpu
+        if cpu._cycles == self._idle_start:
+            return False
+
+        # Writes through the machine (e.g. to the video memory, or I/O ports) are the machine output, so the
+        # loop is not idle. Such writes are not a part of the probe state, so a new probe is taken on the
+        # next run (e.g. after a one-off output the machine may get back to the polling loop).
+        if self._machine.get_write_count() != self._idle_writes:
+            return False
+
+        self._idle_probe_hit = True
+        if self._get_registers() != self._idle_registers:
+            return False
+
+        # Registers match, and there were no writes through the machine, so the only possible side effects
+        # are the flat memory changes. The memory snapshot is taken on the first match only, so that loops
+        # that never get back to the probe registers without an output (e.g. a software blinking cursor)
+        # do not pay for copying and comparing the memory.
+        if self._idle_memory is None:
+            self._idle_memory = bytes(cpu._memory)
+            self._idle_start = cpu._cycles
+            return False
+
+        if cpu._memory != self._idle_memory:
+            return False
+
+        self._idle_start = cpu._cycles
+        self._idle_matches -= 1
+        if self._idle_matches > 0:
+            return False
+
+        # The machine spins in the same loop, fast forward to the end of the run (or the next event)
+        cpu._cycles = limit + 1
+        self._idle = True
+        return True
+
     def _handle_breakpoints(self):
         # Run the breakpoint function if condition is met
         br_list = self._breakpoints.get(self._cpu._pc, [])
@@ -37,36 +216,162 @@ class Emulator:
     def step(self):
         self._handle_breakpoints()
         self._cpu.step()
+        self._machine.get_scheduler().run_events(self._cpu._cycles)
+
+    def stop(self):
+        """
+        Stop the current run. This is intended to be called from a scheduled event callback (e.g. the
+        frame refresh event), so the run stops right at the event time.
+        """
+        self._stop_requested = True
 
     def run(self, num_cycles=0):
-        stop_at = self._cpu._cycles + num_cycles
-        while num_cycles == 0 or self._cpu._cycles <= stop_at:
-            self.step()
+        self.run_until(max_cycles=num_cycles if num_cycles != 0 else None)
+
+    def run_until(self, pc=None, max_cycles=None, predicate=None):
+        """
+        Run the emulation until the CPU reaches the pc address, or the predicate function returns True.
+        The emulation also stops when more than max_cycles cycles are executed. Without any of the
+        conditions the emulation runs forever.
+
+        Returns True if the emulation was stopped by the address or predicate, or False if stopped by
+        the cycles limit. Note that in the block translation mode the predicate is checked only between
+        translated blocks.
+        """
+        # The run target is a stop address for this run only, so that translated blocks are not split at
+        # every address the emulator was ever asked to run to
+        if pc is None or pc in self._stop_addrs:
+            return self._run_until(pc, max_cycles, predicate)
+
+        self._add_stop_addr(pc)
+        try:
+            return self._run_until(pc, max_cycles, predicate)
+        finally:
+            self._remove_stop_addr(pc)
+
+    def _run_until(self, pc, max_cycles, predicate):
+        cpu = self._cpu
+        stop_at = cpu._cycles + max_cycles if max_cycles is not None else float('inf')
+
+        probe = self._start_idle_probe()
+        run_slice = self._run_translated if self._translator else self._run_interpreted
+        scheduler = self._machine.get_scheduler()
+        self._stop_requested = False
+
+        while True:
+            # Run exactly until the next scheduled event, so that devices act on time
+            limit = min(stop_at, scheduler.get_next_event_cycles() - 1)
+            self._idle = False
+            if run_slice(pc, limit, predicate, probe if limit != float('inf') else -1):
+                return True
+
+            scheduler.run_events(cpu._cycles)
+            if cpu._cycles > stop_at or self._stop_requested:
+                return cpu._pc == pc
+
+    def _run_interpreted(self, pc, limit, predicate, probe):
+        cpu = self._cpu
+        breakpoints = self._breakpoints
+        handle_breakpoints = self._handle_breakpoints
+        step = cpu.step
+        while cpu._cycles <= limit:
+            if cpu._pc == pc or (predicate is not None and predicate()):
+                return True
+
+            if cpu._pc == probe and self._check_idle(limit):
+                break
+
+            if cpu._pc in breakpoints:
+                handle_breakpoints()
+
+            step()
+
+        return False
+
+    def _run_translated(self, pc, limit, predicate, probe):
+        cpu = self._cpu
+        breakpoints = self._breakpoints
+        handle_breakpoints = self._handle_breakpoints
+        step = cpu.step
+        run_block = self._translator.run_block
+        while cpu._cycles <= limit:
+            if cpu._pc == pc or (predicate is not None and predicate()):
+                return True
+
+            if cpu._pc == probe and self._check_idle(limit):
+                break
+
+            if cpu._pc in breakpoints:
+                handle_breakpoints()
+
+            # Pending interrupts, code that can't be translated, and traced code are executed by the interpreter
+            if cpu._tracing or (cpu._enable_interrupts and cpu._interrupt_instructions):
+                step()
+            elif not run_block(limit):
+                step()
+
+        return False
 
     def reset(self):
         self._machine.reset()
         self._cpu._pc = self._startaddr
 
+    def save_state(self):
+        """
+        Save the CPU, memories, and devices state into a versioned binary snapshot (see common.state
+        module for the format description).
+        """
+        return (STATE_MAGIC + struct.pack('<H', STATE_VERSION)
+                + pack_chunk("CPU", self._cpu.save_state())
+                + pack_chunk("Machine", self._machine.save_state()))
+
+    def load_state(self, data):
+        """
+        Restore the snapshot made with save_state(). The emulator must be set up with the same machine
+        configuration. Breakpoints and scheduled events are not a part of the snapshot, and remain
+        as is (scheduled events keep their time relative to the CPU cycles counter).
+        """
+        if data[0:4] != STATE_MAGIC:
+            raise ValueError("Not an emulator state snapshot")
+        version, = struct.unpack_from('<H', data, 4)
+        if version != STATE_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+
+        chunks = dict(unpack_chunks(data, 6))
+        cycles = self._cpu._cycles
+        self._cpu.load_state(chunks["CPU"])
+        self._machine.load_state(chunks["Machine"])
+
+        self._machine.get_scheduler().shift(self._cpu._cycles - cycles)
+        self.wake()
+
+    def fork(self):
+        """
+        Create an independent copy of the running emulator, e.g. to try several inputs from the same
+        machine state. The copy shares immutable data with the original (ROMs, font glyphs), and quasi
+        disk pages until they are modified. The forked quasi disk is not backed by the disk file.
+
+        Breakpoint and scheduled event callbacks that are bound methods of the copied objects are bound
+        to the copies, while other callables (e.g. lambdas) are shared with the original emulator.
+        """
+        # Translated blocks are compiled against the original CPU and memory, the fork translates its own
+        translator = self._translator
+        self._translator = None
+        try:
+            child = copy.deepcopy(self)
+        finally:
+            self._translator = translator
+
+        child.enable_block_translation(translator is not None)
+        return child
+
 
     def load_memory(self, fname):
         if not fname:
             return
         
-        with open(fname, "rb") as f:
-            data = f.read()
-
-        offset = 0      
-        if fname.upper().endswith(".PKI") or fname.upper().endswith(".GAM"):
-            offset += 1         # Skip the sync byte
-
-        addr = (data[offset] << 8) | data[offset + 1]
-        endaddr = (data[offset+2] << 8) | data[offset + 3]
-        offset += 4
-        
-        while addr <= endaddr:
-            self._machine.write_memory_byte(addr, data[offset])
-            addr += 1
-            offset += 1
+        addr, data = read_tape_image(fname)
+        self._machine.write_memory_burst(addr, data)
         
 
 
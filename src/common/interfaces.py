@@ -1,3 +1,4 @@
+from functools import partial
 from common.utils import *
 
 """
@@ -22,8 +23,28 @@ from common.utils import *
 
     Byte operations are typically implemented by a peripheral devices, while other operation types
     (word, stack, burst) are mostly related to memory-type devices.
+
+    The adapters resolve the peripheral functions once on construction, rather than checking the device
+    capabilities on every access. Operations not supported by the peripheral are bound to a function
+    that raises an error. 
+
+    Regular adapter functions validate that the address is within the device range. The Machine resolves
+    the device with its dispatch tables, that already guarantee the address range, and uses *_trusted
+    functions that skip the validation.
+
+    Writes to a device are treated as the machine output by the emulator idle detection (see Emulator class).
+    A device, which may be written just to select inputs to read (e.g. keyboard matrix columns), exposes
+    is_input_scanning(offset) function, that tells whether the last write at the offset was such a write,
+    so that a keyboard polling loop may still be detected as idle. The adapters expose the scans_input
+    attribute, and the is_input_scanning_trusted() function for such devices.
 """
 
+MEMORY_OPERATIONS = ("read_byte", "read_word", "read_stack", "read_burst",
+                     "write_byte", "write_word", "write_stack", "write_burst")
+IO_OPERATIONS = ("read_byte", "write_byte")
+
+
+
 class IODevice:
     """
         IODevice class binds a device with a particular I/O port. This class is responsible to
@@ -43,33 +64,56 @@ class IODevice:
         else:
             self._ioendaddr = startaddr
 
+        for name in IO_OPERATIONS:
+            handler = getattr(device, name, None)
+            setattr(self, f"_{name}", handler if handler else partial(self._unsupported, name))
+
+        self.scans_input = hasattr(device, "is_input_scanning")
+
+
+    def _unsupported(self, operation, offset, *args):
+        raise IOError(f"Operation {operation} is not supported by the IO device at 0x{self._iostartaddr:02x}")
+
 
     def get_addr_range(self):
         return self._iostartaddr, self._ioendaddr
 
 
+    def get_device(self):
+        return self._device
+
+
     def validate_io_addr(self, addr):
         if addr < self._iostartaddr or addr > self._ioendaddr:
             raise IOError(f"Incorrect IO address {addr:x}")
 
 
     def _get_offset(self, addr):
-        self.validate_io_addr(addr)
         if not self._invert:
             return addr - self._iostartaddr
         else:
             return self._ioendaddr - addr
 
     def read_io(self, addr):
-        return self._device.read_byte(self._get_offset(addr))
+        self.validate_io_addr(addr)
+        return self._read_byte(self._get_offset(addr))
 
 
     def write_io(self, addr, value):
-        self._device.write_byte(self._get_offset(addr), value)
+        self.validate_io_addr(addr)
+        self._write_byte(self._get_offset(addr), value)
+
+
+    def read_io_trusted(self, addr):
+        return self._read_byte(self._get_offset(addr))
+
+
+    def write_io_trusted(self, addr, value):
+        self._write_byte(self._get_offset(addr), value)
 
 
-    def update(self):
-        pass
+    def is_input_scanning_trusted(self, addr):
+        return self._device.is_input_scanning(self._get_offset(addr))
 
 
 
@@ -104,11 +148,25 @@ class MemoryDevice:
         else:
             self._endaddr = startaddr + device.get_size() - 1
 
+        for name in MEMORY_OPERATIONS:
+            handler = getattr(device, name, None)
+            setattr(self, f"_{name}", handler if handler else partial(self._unsupported, name))
+
+        self.scans_input = hasattr(device, "is_input_scanning")
+
+
+    def _unsupported(self, operation, offset, *args):
+        raise MemoryError(f"Operation {operation} at address 0x{self._startaddr + offset:04x} is not supported")
+
 
     def get_addr_range(self):
         return self._startaddr, self._endaddr
 
 
+    def get_device(self):
+        return self._device
+
+
     def validate_addr(self, addr):
         if addr < self._startaddr or addr > self._endaddr:
             raise MemoryError(f"Address 0x{addr:04x} is out of memory range 0x{self._startaddr:04x}-0x{self._endaddr:04x}")
@@ -116,63 +174,69 @@ class MemoryDevice:
 
     def read_byte(self, addr):
         self.validate_addr(addr)
-        if not hasattr(self._device, "read_byte"):
-            raise MemoryError(f"Reading byte at address 0x{addr:04x} is not supported")
-        return self._device.read_byte(addr - self._startaddr)
+        return self._read_byte(addr - self._startaddr)
 
 
     def read_word(self, addr):
         self.validate_addr(addr)
-        if not hasattr(self._device, "read_word"):
-            raise MemoryError(f"Reading word at address 0x{addr:04x} is not supported")
-        return self._device.read_word(addr - self._startaddr)
+        return self._read_word(addr - self._startaddr)
 
 
     def read_stack(self, addr):
         self.validate_addr(addr)
-        if not hasattr(self._device, "read_stack"):
-            raise MemoryError(f"Reading stack address 0x{addr:04x} is not supported")
-        return self._device.read_stack(addr - self._startaddr)
+        return self._read_stack(addr - self._startaddr)
 
 
     def read_burst(self, addr, count):
-        endaddr = addr + count - 1
         self.validate_addr(addr)
-        self.validate_addr(endaddr)
-        if not hasattr(self._device, "read_burst"):
-            raise MemoryError(f"Burst reading address range 0x{addr:04x}-0x{endaddr:04x} is not supported")
-        return self._device.read_burst(addr - self._startaddr, count)
+        self.validate_addr(addr + count - 1)
+        return self._read_burst(addr - self._startaddr, count)
 
 
     def write_byte(self, addr, value):
         self.validate_addr(addr)
-        if not hasattr(self._device, "write_byte"):
-            raise MemoryError(f"Writing byte ataddress 0x{addr:04x} is not supported")
-        self._device.write_byte(addr - self._startaddr, value)
+        self._write_byte(addr - self._startaddr, value)
 
 
     def write_word(self, addr, value):
         self.validate_addr(addr)
-        if not hasattr(self._device, "write_word"):
-            raise MemoryError(f"Writing word at address 0x{addr:04x} is not supported")
-        self._device.write_word(addr - self._startaddr, value)
+        self._write_word(addr - self._startaddr, value)
 
 
     def write_stack(self, addr, value):
         self.validate_addr(addr)
-        if not hasattr(self._device, "write_stack"):
-            raise MemoryError(f"Writing stack address 0x{addr:04x} is not supported")
-        self._device.write_stack(addr - self._startaddr, value)
+        self._write_stack(addr - self._startaddr, value)
 
 
     def write_burst(self, addr, data):
-        endaddr = addr + len(data) - 1
         self.validate_addr(addr)
-        self.validate_addr(endaddr)
-        if not hasattr(self._device, "write_burst"):
-            raise MemoryError(f"Burst writing address range 0x{addr:04x}-0x{endaddr:04x} is not supported")
-        self._device.write_burst(addr - self._startaddr, data)
+        self.validate_addr(addr + len(data) - 1)
+        self._write_burst(addr - self._startaddr, data)
+
+
+    def read_byte_trusted(self, addr):
+        return self._read_byte(addr - self._startaddr)
+
+
+    def read_word_trusted(self, addr):
+        return self._read_word(addr - self._startaddr)
+
+
+    def read_stack_trusted(self, addr):
+        return self._read_stack(addr - self._startaddr)
+
+
+    def write_byte_trusted(self, addr, value):
+        self._write_byte(addr - self._startaddr, value)
+
+
+    def write_word_trusted(self, addr, value):
+        self._write_word(addr - self._startaddr, value)
+
+
+    def write_stack_trusted(self, addr, value):
+        self._write_stack(addr - self._startaddr, value)
 
 
-    def update(self):
-        pass
+    def is_input_scanning_trusted(self, addr):
+        return self._device.is_input_scanning(addr - self._startaddr)
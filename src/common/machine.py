@@ -1,25 +1,176 @@
+import copy
 import logging
 from common.utils import *
+from common.interfaces import MemoryDevice
+from common.ram import RAM
+from common.rom import ROM
+from common.scheduler import Scheduler
+from common.state import pack_chunk, unpack_chunks
 
 logger = logging.getLogger('machine')
 
 class MemoryMgr:
+    """
+        MemoryMgr keeps track of memories installed in the Machine, and resolves which memory 
+        responds to a particular address.
+
+        In order to avoid scanning the memories list on every memory access, the manager maintains
+        a 64k dispatch table, where each entry references the memory that handles the address (or None
+        if no memory is installed at this address). The table is rebuilt every time the memory 
+        configuration changes. If memory ranges overlap, the memory registered first takes precedence.
+
+        Optionally the manager can expose plain RAM and ROM memories as a flat 64k memory image. In this
+        mode RAM buffers are relocated into the flat image, and ROM data is copied there. Two 256-byte
+        page tables tell which pages can be read or written directly in the flat image (ROM pages are
+        read only), while other pages (e.g. memory mapped devices) must go through the regular memory 
+        device handlers. The page tables are twice as large as needed, so that slightly out of range
+        addresses (e.g. SP wrapping below zero) are safely resolved as non-direct pages.
+
+        The manager also keeps write watches - callbacks notified on writes to a memory range. Pages that
+        contain a watched range are marked in the watch page table, and excluded from the flat memory
+        direct writes, so that writes to these pages go through the Machine, which notifies the watches.
+    """
     def __init__(self):
         self._memories = []
+        self._lookup = [None] * 0x10000
+
+        self._flat_enabled = False
+        self._flat = bytearray(0x10000)
+        self._read_pages = bytearray(0x200)
+        self._write_pages = bytearray(0x200)
+
+        self._watches = []      # (startaddr, endaddr, callback) tuples
+        self._watch_pages = bytearray(0x200)
 
     def add_memory(self, memory):
         startaddr, endaddr = memory.get_addr_range()
         self._memories.append((startaddr, endaddr, memory))
+        self._rebuild_lookup_table()
+
+    def __deepcopy__(self, memo):
+        # The lookup table is rebuilt rather than copied. Flat memory image and page tables may be
+        # already copied as CPU attributes, so they are taken from the memo, and RAMs are bound to them.
+        mgr = MemoryMgr.__new__(MemoryMgr)
+        memo[id(self)] = mgr
+        mgr._memories = copy.deepcopy(self._memories, memo)
+        mgr._flat_enabled = self._flat_enabled
+        mgr._flat = copy.deepcopy(self._flat, memo)
+        mgr._read_pages = copy.deepcopy(self._read_pages, memo)
+        mgr._write_pages = copy.deepcopy(self._write_pages, memo)
+        mgr._watches = copy.deepcopy(self._watches, memo)
+        mgr._watch_pages = copy.deepcopy(self._watch_pages, memo)
+        mgr._rebuild_lookup_table()
+        return mgr
+
+    def remove_memory(self, memory):
+        # The RAM data is moved out of the flat memory image first, as a memory shadowed by the removed one
+        # may be mapped to the same flat memory range
+        if isinstance(memory, MemoryDevice) and type(memory.get_device()) is RAM:
+            memory.get_device().unbind_buffer()
+
+        self._memories = [mem for mem in self._memories if mem[2] is not memory]
+        self._rebuild_lookup_table()
+
+    def get_devices(self):
+        """ Devices of the registered memories, in the order of registration """
+        return [memory.get_device() for _, _, memory in self._memories]
+
+    def enable_flat_memory(self, enabled):
+        self._flat_enabled = enabled
+        self._rebuild_flat_memory()
+
+    def get_flat_memory(self):
+        return self._flat, self._read_pages, self._write_pages
+
+    def get_watch_pages(self):
+        return self._watch_pages
+
+    def add_write_watch(self, startaddr, endaddr, callback):
+        self._watches.append((startaddr, endaddr, callback))
+        self._rebuild_watch_pages()
+
+    def remove_write_watch(self, callback):
+        self._watches = [watch for watch in self._watches if watch[2] != callback]
+        self._rebuild_watch_pages()
+
+    def _rebuild_watch_pages(self):
+        # The table is updated in place, as it may be already referenced by the Machine
+        self._watch_pages[:] = bytes(len(self._watch_pages))
+        for startaddr, endaddr, _ in self._watches:
+            for page in range(startaddr >> 8, (min(endaddr, 0xffff) >> 8) + 1):
+                self._watch_pages[page] = 1
+
+        self._rebuild_flat_memory()
+
+    def notify_write(self, addr, count):
+        """ Notify watches about count bytes written at addr. Each watch is told only its part of the range """
+        endaddr = addr + count - 1
+        for startaddr, watchend, callback in self._watches:
+            if addr <= watchend and endaddr >= startaddr:
+                start = max(addr, startaddr)
+                callback(start, min(endaddr, watchend) - start + 1)
+
+    def _rebuild_lookup_table(self):
+        self._lookup = [None] * 0x10000
+
+        # Fill the table in the reverse order, so that memories registered earlier override later ones
+        for startaddr, endaddr, memory in reversed(self._memories):
+            endaddr = min(endaddr, 0xffff)
+            self._lookup[startaddr : endaddr + 1] = [memory] * (endaddr - startaddr + 1)
+
+        self._rebuild_flat_memory()
+
+    def _rebuild_flat_memory(self):
+        # Page tables are updated in place, as they may be already referenced by the CPU
+        self._read_pages[:] = bytes(len(self._read_pages))
+        self._write_pages[:] = bytes(len(self._write_pages))
+
+        if not self._flat_enabled:
+            return
+
+        for startaddr, endaddr, memory in self._memories:
+            if type(memory) is not MemoryDevice or endaddr > 0xffff:
+                continue
+
+            # Only memories that are not shadowed by other memories can be mapped to the flat image
+            if self._lookup[startaddr : endaddr + 1].count(memory) != endaddr - startaddr + 1:
+                continue
+
+            device = memory.get_device()
+            if type(device) is RAM:
+                device.bind_buffer(memoryview(self._flat)[startaddr : endaddr + 1])
+                writable = True
+            elif type(device) is ROM:
+                self._flat[startaddr : endaddr + 1] = device.read_burst(0, endaddr - startaddr + 1)
+                writable = False
+            else:
+                continue
+
+            # Only pages entirely covered by the memory can be accessed directly. Watched pages can be read
+            # directly, but writes must go through the Machine
+            for page in range((startaddr + 0xff) >> 8, (endaddr + 1) >> 8):
+                self._read_pages[page] = 1
+                self._write_pages[page] = 1 if writable and not self._watch_pages[page] else 0
 
     def get_memory_for_addr(self, addr):
-        for mem in self._memories:
-            if addr >= mem[0] and addr <= mem[1]:
-                return mem[2]
-        return None
+        if addr < 0 or addr > 0xffff:
+            return None
+        return self._lookup[addr]
 
-    def update(self):
-        for mem in self._memories:
-            mem[2].update()
+    def get_span_end(self, addr):
+        """
+        Return the last address of the continuous range starting at addr, that is handled by the same
+        memory (or not handled by any memory). The range may end earlier than necessary, if a shadowed
+        memory starts within the range.
+        """
+        memory = self.get_memory_for_addr(addr)
+        end = 0xffff
+        for startaddr, endaddr, mem in self._memories:
+            if mem is memory:
+                end = min(end, endaddr)
+            elif startaddr > addr:
+                end = min(end, startaddr - 1)
+        return end
 
 
 
@@ -29,14 +180,44 @@ class Machine:
         the computer in a specific configuration. It handles all the relationships
         between the components, such as memories, I/O devices, and other devices
         not logically connected, but still a part of the system (e.g. a 1 second timer).    
+
+        Devices that act on a time basis schedule their actions at CPU cycle counts using the machine
+        scheduler (see Scheduler class), rather than polling the host clock.
+
+        Devices may also opt into the update() calls. A device that declares UPDATE_PERIOD (in CPU cycles)
+        is updated periodically using the scheduler. A device that exposes is_dirty() function is updated
+        on Machine.update() call, but only if it reports changes. Each device is subscribed only once, even
+        if it is registered at several addresses. Other devices are never updated, so that Machine.update()
+        costs nothing when there is no device activity.
+
+        Components that need to react on memory changes (e.g. displays, text capture tools, or watchpoints)
+        may register a write watch for a memory range, instead of scanning the memory periodically (see
+        add_write_watch() function).
     """
     def __init__(self):
         self._memories = MemoryMgr()
         self._io = {}
         self._other = []
+        self._devices = []          # Unique registered devices
+        self._dirty_devices = []    # Devices updated when they report changes
         self._cpu = None
         self._strict = False
 
+        # Stack operations may be intercepted by the machine (e.g. quasi disk). This page table tells
+        # which pages the CPU may access directly for stack operations.
+        self._stack_direct = True
+        self._stack_pages = bytearray(0x200)
+
+        # Pages that contain watched memory ranges (see add_write_watch())
+        self._watch_pages = self._memories.get_watch_pages()
+
+        # Number of writes through the machine (device memory, I/O ports, intercepted stack operations).
+        # These writes are not visible in the flat memory image, so the emulator idle detection uses the
+        # counter to detect the machine output.
+        self._write_count = 0
+
+        self._scheduler = Scheduler()
+
     def set_strict_validation(self, strict = False):
         self._strict = strict
 
@@ -45,27 +226,155 @@ class Machine:
 
     def add_memory(self, memory):
         self._memories.add_memory(memory)
+        self._update_stack_pages()
+        self._register_device(memory.get_device())
+
+    def remove_memory(self, memory):
+        self._memories.remove_memory(memory)
+        self._update_stack_pages()
+        self._unregister_device(memory.get_device())
+
+    def _register_device(self, device):
+        if any(device is dev for dev in self._devices):
+            return
+        self._devices.append(device)
+
+        period = getattr(device, "UPDATE_PERIOD", 0)
+        if period:
+            self.schedule_event(period, device.update, period)
+        elif hasattr(device, "is_dirty"):
+            self._dirty_devices.append(device)
+
+    def _unregister_device(self, device):
+        # The device may be still registered at other addresses
+        if any(dev is device for dev in self._memories.get_devices()):
+            return
+        if any(io.get_device() is device for io in self._io.values()) or any(device is dev for dev in self._other):
+            return
+
+        self._devices = [dev for dev in self._devices if dev is not device]
+        self._dirty_devices = [dev for dev in self._dirty_devices if dev is not device]
+        if getattr(device, "UPDATE_PERIOD", 0):
+            self._scheduler.remove_event(device.update)
+
+    def enable_flat_memory(self, enabled=True):
+        """
+        Enable the flat memory mode, where plain RAM and ROM memories are exposed to the CPU as a single
+        64k memory image, allowing the CPU to read and write these memories without going through the
+        Machine and MemoryDevice layers. Memory mapped devices are still accessed via their handlers.
+        """
+        self._memories.enable_flat_memory(enabled)
+        self._update_stack_pages()
+
+    def get_memory_map(self):
+        """
+        Returns the flat memory image, and read, write, and stack page tables. Non-zero page table
+        entry means the corresponding 256-byte page can be accessed directly in the flat image.
+        """
+        flat, read_pages, write_pages = self._memories.get_flat_memory()
+        return flat, read_pages, write_pages, self._stack_pages
+
+    def add_write_watch(self, startaddr, endaddr, callback):
+        """
+        Call callback(addr, count) after every write to the startaddr-endaddr memory range, made by the CPU
+        or by a device (e.g. DMA or a tape image loading). The callback receives only the part of the
+        written range that falls into the watched range. Pages of the watched range are excluded from
+        the flat memory direct writes, so watching a busy memory area slows down the CPU writes to it.
+
+        Note: restoring memory state (load_state()) is not reported to the watches.
+        """
+        self._memories.add_write_watch(startaddr, endaddr, callback)
+        self._update_stack_pages()
+
+    def remove_write_watch(self, callback):
+        self._memories.remove_write_watch(callback)
+        self._update_stack_pages()
+
+    def set_stack_direct_access(self, enabled):
+        """
+        Allow or disallow direct CPU stack operations in the flat memory image. Machines that intercept
+        stack operations shall disable direct access while the interception is active.
+        """
+        self._stack_direct = enabled
+        self._update_stack_pages()
+
+    def _update_stack_pages(self):
+        _, _, write_pages = self._memories.get_flat_memory()
+        if self._stack_direct:
+            self._stack_pages[:] = write_pages
+        else:
+            self._stack_pages[:] = bytes(len(self._stack_pages))
 
     def add_io(self, io):
         start, end = io.get_addr_range()
         for addr in range(start, end+1):
             self._io[addr] = io
+        self._register_device(io.get_device())
 
     def add_other_device(self, device):
         self._other.append(device)
+        self._register_device(device)
 
-    def update(self):
-        """ 
-        Updates the state of all devices in the system, allowing them to 
-        act on a time-based manner
+    def _get_stateful_devices(self):
+        # Devices that support snapshots, in the order of registration. Same device may be
+        # registered several times (e.g. at a few I/O ports), but it is saved only once.
+        devices = self._memories.get_devices()
+        devices += [io.get_device() for io in self._io.values()]
+        devices += self._other
+
+        result = []
+        for device in devices:
+            if hasattr(device, "save_state") and not any(device is dev for dev in result):
+                result.append(device)
+        return result
+
+    def save_state(self):
+        """
+        Returns the state of all memories and devices that support snapshots, as a sequence of chunks
+        named after the device class
         """
-        self._memories.update()
+        return b"".join(pack_chunk(type(device).__name__, device.save_state())
+                        for device in self._get_stateful_devices())
+
+    def load_state(self, data):
+        """
+        Restore memories and devices state saved with save_state(). The machine must be configured with
+        the same set of devices as the one that saved the state.
+        """
+        devices = self._get_stateful_devices()
+        chunks = unpack_chunks(data)
+        if [name for name, _ in chunks] != [type(device).__name__ for device in devices]:
+            raise ValueError("Saved state does not match the machine configuration")
+
+        for device, (_, chunk) in zip(devices, chunks):
+            device.load_state(chunk)
+
+    def get_scheduler(self):
+        return self._scheduler
 
-        for _, io in self._io.items():
-            io.update()
+    def get_write_count(self):
+        """ Number of writes through the machine, excluding input scanning writes (see idle detection) """
+        return self._write_count
 
-        for dev in self._other:
-            dev.update()
+    def get_cycles(self):
+        """ Current CPU cycles counter value, used as the machine time """
+        return self._cpu._cycles if self._cpu else 0
+
+    def schedule_event(self, delay, callback, period=0):
+        """
+        Schedule the callback in delay CPU cycles from now. If period is set, the callback is called
+        every period cycles afterwards.
+        """
+        self._scheduler.add_event(self.get_cycles() + delay, callback, period)
+
+    def update(self):
+        """ 
+        Updates devices that report changes (see is_dirty() device function), allowing them to act
+        on the changes (e.g. flush data to the disk)
+        """
+        for device in self._dirty_devices:
+            if device.is_dirty():
+                device.update()
 
     def _get_memory(self, addr):
         mem = self._memories.get_memory_for_addr(addr)
@@ -96,13 +405,13 @@ class Machine:
         mem = self._get_memory(addr)
         if not mem:
             return 0xff
-        return mem.read_byte(addr)
+        return mem.read_byte_trusted(addr)
 
     def read_memory_word(self, addr):
         mem = self._get_memory(addr)
         if not mem:
             return 0xffff
-        return mem.read_word(addr)
+        return mem.read_word_trusted(addr)
 
     def read_memory_burst(self, addr, count):
         mem = self._get_memory(addr)
@@ -113,39 +422,62 @@ class Machine:
     def write_memory_byte(self, addr, value):
         mem = self._get_memory(addr)
         if mem:
-            mem.write_byte(addr, value)
+            mem.write_byte_trusted(addr, value)
+            if not mem.scans_input or not mem.is_input_scanning_trusted(addr):
+                self._write_count += 1
+            if self._watch_pages[addr >> 8]:
+                self._memories.notify_write(addr, 1)
 
     def write_memory_word(self, addr, value):
         mem = self._get_memory(addr)
         if mem:
-            mem.write_word(addr, value)
+            mem.write_word_trusted(addr, value)
+            if not mem.scans_input or not mem.is_input_scanning_trusted(addr):
+                self._write_count += 1
+            if self._watch_pages[addr >> 8] or self._watch_pages[(addr + 1) >> 8]:
+                self._memories.notify_write(addr, 2)
 
     def write_memory_burst(self, addr, data):
-        mem = self._get_memory(addr)
-        if mem:
-            mem.write_burst(addr, data)
+        # The data may span several memories (e.g. a tape image loaded across adjacent RAMs), so it is
+        # split into runs that are handled by a single memory each
+        endaddr = min(addr + len(data) - 1, 0xffff)
+        while addr <= endaddr:
+            mem = self._get_memory(addr)
+            spanend = min(self._memories.get_span_end(addr), endaddr)
+            if mem:
+                mem.write_burst(addr, data[:spanend - addr + 1])
+                self._write_count += 1
+                if any(self._watch_pages[addr >> 8 : (spanend >> 8) + 1]):
+                    self._memories.notify_write(addr, spanend - addr + 1)
+            data = data[spanend - addr + 1:]
+            addr = spanend + 1
 
     def write_stack(self, addr, value):
         mem = self._get_memory(addr)
         if mem:
-            mem.write_stack(addr, value)
+            mem.write_stack_trusted(addr, value)
+            self._write_count += 1
+            if self._watch_pages[addr >> 8] or self._watch_pages[(addr + 1) >> 8]:
+                self._memories.notify_write(addr, 2)
 
     def read_stack(self, addr):
         mem = self._get_memory(addr)
         if not mem:
             return 0xffff
-        return mem.read_stack(addr)
+        return mem.read_stack_trusted(addr)
 
     def read_io(self, addr):
         io = self._get_io(addr)
         if not io:
             return 0xff
-        return io.read_io(addr)
+        return io.read_io_trusted(addr)
         
     def write_io(self, addr, value):
         io = self._get_io(addr)
         if io:
-            io.write_io(addr, value)
+            io.write_io_trusted(addr, value)
+            if not io.scans_input or not io.is_input_scanning_trusted(addr):
+                self._write_count += 1
 
     def schedule_interrupt(self):
         # Typically the machine would have i8259 interrupt controller
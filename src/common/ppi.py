@@ -23,10 +23,12 @@ class PPI:
         The class is supposed to be used with handler functions that are called to read or write data on
         the selected port. This allows building simple 'schematics' based on the physical connection of the
         signal lines.
-    """
-
-
 
+        Writes to the PPI are treated as the machine output by the emulator idle detection, unless the
+        written port is used for the input scanning (e.g. the keyboard matrix columns port, see
+        set_input_scanning_port()), or the write did not change any output line (e.g. a polling loop that
+        writes the same Port C value over and over). See is_input_scanning() function.
+    """
     def __init__(self):
         self._portA_mode_input = True
         self._portB_mode_input = True
@@ -39,6 +41,9 @@ class PPI:
         self._portC_value = 0
         self._portC_bit_handlers = [None for _ in range(8)]
 
+        self._input_scanning_ports = set()
+        self._output_changed = False
+
 
     def get_size(self):
         return 4    # The chip offers 4 registers - 3 ports, and configuration register
@@ -59,17 +64,42 @@ class PPI:
     def set_portC_bit_handler(self, bit, func):
         self._portC_bit_handlers[bit] = func
 
+
+    def set_input_scanning_port(self, port):
+        """
+        Mark the port as used for the input scanning (e.g. selecting keyboard matrix columns), rather than
+        for the machine output
+        """
+        self._input_scanning_ports.add(port)
+
+
+    def is_input_scanning(self, offset):
+        """
+        Returns True if the last write at the offset only scanned inputs, or did not change any output line
+        (used by the idle detection, see interfaces module)
+        """
+        return offset in self._input_scanning_ports or not self._output_changed
+
+
+    def _get_portC_output_mask(self):
+        return (0x00 if self._portCu_mode_input else 0xf0) | (0x00 if self._portCl_mode_input else 0x0f)
+
     
     def _configure(self, mode):
         assert is_bit_set(mode, 7)
         assert not is_bit_set(mode, 6) and not is_bit_set(mode, 5)
         assert not is_bit_set(mode, 2)
 
+        modes = (self._portA_mode_input, self._portB_mode_input, self._portCu_mode_input, self._portCl_mode_input)
+
         self._portA_mode_input = is_bit_set(mode, 4)
         self._portCu_mode_input = is_bit_set(mode, 3)
         self._portB_mode_input = is_bit_set(mode, 1)
         self._portCl_mode_input = is_bit_set(mode, 0)
 
+        self._output_changed = modes != (self._portA_mode_input, self._portB_mode_input,
+                                         self._portCu_mode_input, self._portCl_mode_input)
+
 
     def _handle_bsr(self, value):
         assert not is_bit_set(value, 7)
@@ -77,9 +107,12 @@ class PPI:
         bit_number = (value >> 1) & 0x07
         bit_value = is_bit_set(value, 0)
 
+        self._output_changed = False
         if (bit_number < 4 and not self._portCl_mode_input) or (bit_number >= 4 and not self._portCu_mode_input):
             # Update the port value variable
-            self._portC_value = set_bit_value(self._portC_value, bit_number, bit_value)
+            value = set_bit_value(self._portC_value, bit_number, bit_value)
+            self._output_changed = value != self._portC_value
+            self._portC_value = value
 
             # Call handler if registered
             if self._portC_bit_handlers[bit_number]:
@@ -155,6 +188,8 @@ class PPI:
 
 
     def write_byte(self, offset, value):
+        self._output_changed = True
+
         if offset == PPI_PORT_A and not self._portA_mode_input:
             self._portA_handler(value)
 
@@ -162,6 +197,8 @@ class PPI:
             self._portB_handler(value)
 
         elif offset == PPI_PORT_C:
+            self._output_changed = (value ^ self._portC_value) & self._get_portC_output_mask() != 0
+            self._portC_value = value
             self._handle_portC_output(value)
             self._handle_portC_bits_output(value)
 
@@ -173,3 +210,14 @@ class PPI:
         else:
             raise MemoryError(f"PPI port {offset} is not configured for writing")
 
+
+    def save_state(self):
+        # Port handlers are the machine wiring, not the state, so only the configuration and output are saved
+        return bytes([self._portA_mode_input, self._portB_mode_input, self._portCu_mode_input,
+                      self._portCl_mode_input, self._portC_value])
+
+
+    def load_state(self, data):
+        (self._portA_mode_input, self._portB_mode_input, self._portCu_mode_input,
+         self._portCl_mode_input) = (bool(value) for value in data[0:4])
+        self._portC_value = data[4]
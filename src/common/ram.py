@@ -1,3 +1,4 @@
+import copy
 from common.utils import *
 
 class RAM:
@@ -7,6 +8,10 @@ class RAM:
         operations are synonims for regular read and write operations as this
         memory type does not distinguish between memory and stack access.
 
+        The data is stored in a bytearray (1 byte per cell, rather than a pointer per cell in a list).
+        Burst reads return memoryview slices of the data without copying, so the result reflects
+        subsequent writes to the memory, and must be copied if it needs to be kept.
+
         Note: this class maintains only the data buffer. Binding to a particular
         memory address is MemoryDevice's class responsibility
     """
@@ -19,7 +24,37 @@ class RAM:
 
 
     def set_size(self, size):
-        self._ram = [0] * size
+        self._ram = bytearray(size)
+
+
+    def bind_buffer(self, buffer):
+        """
+        Move RAM data to an externally owned buffer (e.g. Machine flat memory image), so that the
+        buffer owner can access RAM data directly. The buffer size must match the RAM size.
+        """
+        assert len(buffer) == len(self._ram)
+        buffer[:] = self._ram
+        self._ram = buffer
+
+
+    def unbind_buffer(self):
+        """
+        Move RAM data back from the external buffer to the RAM's own storage
+        """
+        if isinstance(self._ram, memoryview):
+            self._ram = bytearray(self._ram)
+
+
+    def __deepcopy__(self, memo):
+        # Data bound to an external buffer is copied to the RAM's own storage, the owner of the copied
+        # RAM will bind it again if needed
+        ram = copy.copy(self)
+        memo[id(self)] = ram
+        for name, value in self.__dict__.items():
+            if name != "_ram":
+                setattr(ram, name, copy.deepcopy(value, memo))
+        ram._ram = bytearray(self._ram)
+        return ram
 
 
     def _check_value(self, value, max):
@@ -36,7 +71,7 @@ class RAM:
 
 
     def read_burst(self, offset, count):
-        return self._ram[offset : offset + count]
+        return memoryview(self._ram)[offset : offset + count]
 
 
     def write_byte(self, offset, value):
@@ -60,6 +95,19 @@ class RAM:
 
 
     def write_burst(self, offset, data):
-        self._ram[offset : offset + len(data)] = data
+        # Slice assignment would resize the buffer, if the data does not fit the memory
+        if offset < 0 or offset + len(data) > len(self._ram):
+            raise MemoryError(f"Burst write of {len(data)} bytes at offset 0x{offset:04x} is out of memory range")
+        self._ram[offset : offset + len(data)] = bytes(data)    # bytes() validates the values range
+
+
+    def save_state(self):
+        return bytes(self._ram)
+
+
+    def load_state(self, data):
+        if len(data) != len(self._ram):
+            raise ValueError(f"RAM size mismatch: {len(data)} bytes in the state, {len(self._ram)} expected")
+        self._ram[:] = data
 
 
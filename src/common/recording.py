@@ -0,0 +1,177 @@
+import gzip
+import struct
+
+from common.surface import DisplaySurface
+
+"""
+    Screen recording
+
+    Character displays (see Display and RK86Display get_cells() function) can be recorded as a log of
+    changed cells, rather than as a sequence of images. Only chars that changed since the previous frame
+    are stored, and unchanged frames are not stored at all, so recordings of long runs stay tiny. The log
+    can be replayed as char code frames (e.g. to compare screens in tests), or rendered to images using
+    the display font.
+
+    The recording file is gzip compressed, and starts with a magic string and a format version, followed
+    by a sequence of records. Each record starts with a record type byte:
+    - 'S' - screen size: width and height in chars (16-bit each). The next frame is stored entirely.
+    - 'F' - frame: machine time in CPU cycles (64-bit), number of runs (16-bit), and the runs. Each run
+      is a cell offset, and a number of cells (16-bit each), followed by the char codes.
+"""
+
+RECORDING_MAGIC = b"UT88REC"
+RECORDING_VERSION = 1
+
+RECORD_SIZE = b"S"
+RECORD_FRAME = b"F"
+
+RUN_MERGE_GAP = 4   # Runs separated by a few unchanged cells are merged, as a run header takes 4 bytes
+
+def get_changed_runs(prev, cells, width):
+    """
+    Return the list of (offset, data) runs of cells changed since the previous frame. Rows are compared
+    first, and only changed rows are scanned cell by cell.
+    """
+    runs = []
+    for start in range(0, len(cells), width):
+        row = cells[start : start + width]
+        prev_row = prev[start : start + width]
+        if row == prev_row:
+            continue
+
+        changed = [x for x in range(len(row)) if row[x] != prev_row[x]]
+        first = last = changed[0]
+        for x in changed[1:]:
+            if x - last > RUN_MERGE_GAP:
+                runs.append((start + first, row[first : last + 1]))
+                first = x
+            last = x
+        runs.append((start + first, row[first : last + 1]))
+
+    return runs
+
+
+
+class ScreenRecorder:
+    """
+        Records display frames to a file as a log of changed cells (see the file format above). Frames
+        are added with add_frame() function (e.g. periodically, using the machine scheduler).
+    """
+    def __init__(self, filename):
+        self._file = gzip.open(filename, "wb")
+        self._file.write(RECORDING_MAGIC + struct.pack('<B', RECORDING_VERSION))
+
+        self._frame = None
+        self._size = None
+        self._frames = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def get_frames_count(self):
+        """ Number of frames stored (unchanged frames are not stored) """
+        return self._frames
+
+
+    def add_frame(self, cells, width, height, cycles):
+        """ Add the frame, if it is different from the previous one. Returns True if the frame was stored """
+        if not width or not height:
+            return False    # The display is not configured yet
+
+        if (width, height) != self._size:
+            self._file.write(RECORD_SIZE + struct.pack('<HH', width, height))
+            self._size = (width, height)
+            runs = [(0, cells)]
+        elif cells == self._frame:
+            return False
+        else:
+            runs = get_changed_runs(self._frame, cells, width)
+
+        self._file.write(RECORD_FRAME + struct.pack('<QH', cycles, len(runs)))
+        for offset, data in runs:
+            self._file.write(struct.pack('<HH', offset, len(data)) + data)
+
+        self._frame = bytes(cells)
+        self._frames += 1
+        return True
+
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+
+class ScreenPlayer:
+    """
+        Replays a recording made with ScreenRecorder. The frames() generator yields frames as
+        (cycles, cells, width, height) tuples, where cells is a full frame char codes buffer.
+    """
+    def __init__(self, filename):
+        with gzip.open(filename, "rb") as f:
+            self._data = f.read()
+
+        if self._data[0 : len(RECORDING_MAGIC)] != RECORDING_MAGIC:
+            raise ValueError(f"{filename} is not a screen recording")
+        if self._data[len(RECORDING_MAGIC)] != RECORDING_VERSION:
+            raise ValueError(f"Unsupported screen recording version {self._data[len(RECORDING_MAGIC)]}")
+
+
+    def frames(self):
+        data = self._data
+        offset = len(RECORDING_MAGIC) + 1
+        frame = None
+        width = height = 0
+
+        while offset < len(data):
+            record = data[offset : offset + 1]
+            offset += 1
+
+            if record == RECORD_SIZE:
+                width, height = struct.unpack_from('<HH', data, offset)
+                offset += 4
+                frame = bytearray(b" " * (width * height))
+
+            elif record == RECORD_FRAME and frame is not None:
+                cycles, count = struct.unpack_from('<QH', data, offset)
+                offset += 10
+                for _ in range(count):
+                    start, size = struct.unpack_from('<HH', data, offset)
+                    offset += 4
+                    if offset + size > len(data) or start + size > len(frame):
+                        raise ValueError("Truncated screen recording")
+                    frame[start : start + size] = data[offset : offset + size]
+                    offset += size
+
+                yield cycles, bytes(frame), width, height
+
+            else:
+                raise ValueError(f"Incorrect screen recording record at offset {offset - 1}")
+
+
+    def save_images(self, font_file, filename_pattern, alternate_font=False):
+        """
+        Render every frame with the display font, and save it as an image. The file name pattern is
+        formatted with the frame index (e.g. 'frame{:05}.png'). Returns the number of saved images.
+        """
+        surface = None
+        count = 0
+        for _, cells, width, height in self.frames():
+            if not surface:
+                surface = DisplaySurface(font_file, width, height)
+                surface.select_font(alternate_font)
+            elif surface.get_size() != (width, height):
+                surface.set_size(width, height)
+
+            surface.draw_cells(cells)
+            surface.save_image(filename_pattern.format(count))
+            count += 1
+
+        return count
@@ -1,3 +1,4 @@
+import mmap
 from common.utils import *
 
 class ROM:
@@ -5,20 +6,31 @@ class ROM:
         This class represent a read only memory, filled with a predefined data
         loaded from the file. The ROM supports only read operations, and allows
         reading the data in bytes or words.
+
+        The data is stored as immutable bytes, or optionally mapped read only from the file, so that
+        machines on the same host share the ROM pages. Burst reads return memoryview slices of the data
+        without copying.
         
         Note: this class maintains only the data buffer. Binding to a particular
         memory address is MemoryDevice's class responsibility
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, mapped=False):
         with open(filename, mode='rb') as f:
-            self._rom = [x for x in f.read()]
+            if mapped:
+                self._rom = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._rom = f.read()
 
 
     def get_size(self):
         return len(self._rom)
 
 
+    def __deepcopy__(self, memo):
+        return self     # ROM data never changes, so copies can share it
+
+
     def read_byte(self, offset):
         return self._rom[offset]
 
@@ -28,4 +40,4 @@ class ROM:
 
 
     def read_burst(self, offset, count):
-        return self._rom[offset : offset + count]
+        return memoryview(self._rom)[offset : offset + count]
@@ -0,0 +1,58 @@
+import heapq
+
+class Scheduler:
+    """
+        Cycle based event scheduler
+
+        Some devices need to act at a certain time, rather than as a reaction to the CPU access (e.g.
+        a timer generating an interrupt every second, or a blinking cursor). Instead of polling the host
+        wall clock, such devices register a callback at an absolute CPU cycles counter value. The Emulator
+        runs the CPU exactly until the next scheduled event, and then calls all the callbacks that are due.
+        This makes the device timing deterministic, and independent from the host speed.
+
+        An event may be periodic, in this case it is rescheduled after each call for the next period.
+        Events scheduled for the same cycle are called in the order they were added.
+    """
+
+    def __init__(self):
+        self._events = []   # Heap of [cycles, seq, callback, period] records
+        self._seq = 0
+
+
+    def add_event(self, cycles, callback, period=0):
+        """ Schedule the callback at the given cycles counter value, and then every period cycles (if set) """
+        heapq.heappush(self._events, [cycles, self._seq, callback, period])
+        self._seq += 1
+
+
+    def remove_event(self, callback):
+        """ Remove all events with the given callback """
+        self._events = [event for event in self._events if event[2] != callback]
+        heapq.heapify(self._events)
+
+
+    def get_next_event_cycles(self):
+        """ Cycles counter value of the nearest event, or infinity if there are no events """
+        if not self._events:
+            return float('inf')
+        return self._events[0][0]
+
+
+    def shift(self, delta):
+        """ Move all events by delta cycles (e.g. when the CPU cycles counter is restored from a snapshot) """
+        for event in self._events:
+            event[0] += delta
+
+
+    def run_events(self, cycles):
+        """ Call all the callbacks scheduled at or before the given cycles counter value """
+        events = self._events
+        while events and events[0][0] <= cycles:
+            event = heapq.heappop(events)
+            if event[3]:
+                event[0] += event[3]
+                event[1] = self._seq
+                self._seq += 1
+                heapq.heappush(events, event)
+
+            event[2]()
@@ -0,0 +1,50 @@
+import struct
+
+"""
+    Machine state serialization helpers
+
+    The emulator state snapshot is a binary blob, that starts with a magic string and a format version,
+    followed by a sequence of named chunks. Each chunk is stored as a name length byte, the name itself,
+    a 32-bit data length, and the chunk data. The chunks are produced by the components that have a state
+    worth saving (CPU, memories, peripherals), and each component is responsible for its own chunk data
+    layout.
+
+    Components that support snapshots expose 2 functions:
+    - save_state() returns component state as bytes
+    - load_state(data) restores the component state from bytes previously returned by save_state()
+"""
+
+STATE_MAGIC = b"UT88"
+STATE_VERSION = 1
+
+def pack_chunk(name, data):
+    name = name.encode('ascii')
+    return struct.pack('<B', len(name)) + name + struct.pack('<I', len(data)) + data
+
+
+def unpack_chunks(data, offset=0):
+    """ Parse the chunk sequence, and return a list of (name, data) tuples """
+    data = memoryview(data)
+    chunks = []
+    while offset < len(data):
+        name_len = data[offset]
+        name = bytes(data[offset + 1 : offset + 1 + name_len]).decode('ascii')
+        offset += 1 + name_len
+        data_len, = struct.unpack_from('<I', data, offset)
+        offset += 4
+        if offset + data_len > len(data):
+            raise ValueError(f"Truncated state chunk '{name}'")
+        chunks.append((name, data[offset : offset + data_len]))
+        offset += data_len
+
+    return chunks
+
+
+def pack_optional(*values):
+    """ Pack a list of optional integers (None is stored as -1) """
+    return struct.pack(f'<{len(values)}i', *(-1 if value is None else int(value) for value in values))
+
+
+def unpack_optional(data):
+    """ Unpack integers packed with pack_optional() """
+    return [None if value == -1 else value for value in struct.unpack(f'<{len(data) // 4}i', data)]
@@ -1,9 +1,37 @@
 import os
+import copy
+import hashlib
+import numpy
 import pygame
 
 CHAR_WIDTH = 12
 CHAR_HEIGHT = 16
 
+FONT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ut88")   # Glyph atlas disk cache
+
+# Cyrillic letters at 0x60-0x7e char codes (KOI-7 N2 encoding used by UT-88 and Radio-86RK fonts)
+CYRILLIC_CHARS = "ЮАБЦДЕФГХИЙКЛМНОПЯРСТУЖВЬЫЗШЭЩЧ"
+
+def chars_to_text(data, width, height):
+    """
+    Convert a display char codes buffer to text lines. The MSB (char inversion) is ignored, pseudo
+    graphics symbols are converted to spaces.
+    """
+    lines = []
+    for row in range(height):
+        line = ""
+        for ch in data[row * width : (row + 1) * width]:
+            ch &= 0x7f
+            if 0x20 <= ch < 0x60:
+                line += chr(ch)
+            elif 0x60 <= ch < 0x7f:
+                line += CYRILLIC_CHARS[ch - 0x60]
+            else:
+                line += " "
+        lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
 class DisplaySurface:
     """
         DisplaySurface is an utility class that represents a monocrome display surface, capable of
@@ -14,6 +42,9 @@ class DisplaySurface:
         switch font to an alternate in runtime. The font shall be presented as a 1k array, where each
         8 bytes represent a single character (bits are inverted). The character code must be within 
         0-127 range. The alternate font is loaded from the second 1k of the font file.
+
+        The surface does not require a window, and can be used as an off-screen frame buffer (e.g. to
+        take screenshots of a headless display). See draw_cells(), get_pixels(), and save_image().
     """
 
     def __init__(self, font_file, width=64, height=28):
@@ -24,9 +55,17 @@ class DisplaySurface:
     def set_size(self, width, height):
         size = (CHAR_WIDTH*width, CHAR_HEIGHT*height)
         self._display = pygame.Surface(size)
+        self._width = width
+        self._height = height
+        self._cells = None      # Chars drawn with draw_cells()
         return size
 
 
+    def get_size(self):
+        """ Return the surface size in chars """
+        return self._width, self._height
+
+
     def load_font_file(self, font_file):
         with open(font_file, mode='rb') as f:
             self._font_data = f.read()
@@ -34,36 +73,34 @@ class DisplaySurface:
         self.select_font(False)
 
 
-    def _get_bitmap(self, ch, alternate=False):
-        offset = ch * 8 + (0x400 if alternate else 0)
-        return self._font_data[offset : offset + 8]
-
-
-    def _create_char(self, bitmap, invert):
-        white = (255, 255, 255)
-        char = pygame.Surface((CHAR_WIDTH, CHAR_HEIGHT))
-
-        for row in range(8):
-            for col in range(6):
-                bitvalue = bitmap[row] & (0x20 >> col) != 0
+    def select_font(self, alternate=False):
+        """
+        Build the glyph atlas - a single image with all 256 chars in a row (128 regular chars, followed
+        by 128 inverted ones), and reference the chars as the atlas subsurfaces.
+        """
+        font = self._font_data[0x400:0x800] if alternate else self._font_data[0:0x400]
+        pixels = get_atlas_pixels(font)
 
-                if invert:
-                    bitvalue = not bitvalue
+        width = CHAR_WIDTH * 256
+        atlas = pygame.image.frombuffer(pixels, (width, CHAR_HEIGHT), "P")
+        atlas.set_palette([(i, i, i) for i in range(256)])
 
-                if not bitvalue:
-                    char.set_at((col*2, row*2), white)
-                    char.set_at((col*2, row*2+1), white)
-                    char.set_at((col*2+1, row*2), white)
-                    char.set_at((col*2+1, row*2+1), white)
+        # Blitting a palette image is slow, so convert the atlas to the regular RGB surface
+        self._atlas = pygame.Surface((width, CHAR_HEIGHT))
+        self._atlas.blit(atlas, (0, 0))
 
-        return char
+        self._chars = [self._atlas.subsurface((ch * CHAR_WIDTH, 0, CHAR_WIDTH, CHAR_HEIGHT)) for ch in range(256)]
+        self._cells = None
 
+    
+    def __deepcopy__(self, memo):
+        # Font data and char images are never modified, and can be shared between copies
+        surface = copy.copy(self)
+        surface._display = self._display.copy()
+        memo[id(self)] = surface
+        return surface
 
-    def select_font(self, alternate=False):
-        self._chars = [self._create_char(self._get_bitmap(c, alternate), False) for c in range(128)]
-        self._chars.extend([self._create_char(self._get_bitmap(c, alternate), True) for c in range(128)])
 
-    
     def update_char(self, col, row, ch):
         self._display.blit(self._chars[ch], (col*CHAR_WIDTH, row*CHAR_HEIGHT))
 
@@ -71,3 +108,79 @@ class DisplaySurface:
     def blit(self, screen):
         screen.blit(self._display, (0, 0))
 
+
+    def blit_area(self, screen, col, row, width=1, height=1):
+        """ Blit only the given chars area on the screen, and return the screen rect """
+        rect = pygame.Rect(col * CHAR_WIDTH, row * CHAR_HEIGHT, width * CHAR_WIDTH, height * CHAR_HEIGHT)
+        screen.blit(self._display, rect, rect)
+        return rect
+
+
+    def draw_cells(self, cells):
+        """
+        Draw the whole chars grid from the char codes buffer (row by row). Only chars changed since the
+        previous call are drawn.
+        """
+        prev = self._cells
+        width = self._width
+        for offset, ch in enumerate(cells):
+            if prev is None or prev[offset] != ch:
+                self.update_char(offset % width, offset // width, ch)
+        self._cells = bytes(cells)
+
+
+    def get_pixels(self):
+        """ Return the surface pixels as a NumPy RGB array of (height, width, 3) shape """
+        width, height = self._display.get_size()
+        pixels = pygame.image.tobytes(self._display, "RGB")
+        return numpy.frombuffer(pixels, dtype=numpy.uint8).reshape(height, width, 3)
+
+
+    def save_image(self, filename):
+        """ Save the surface as an image, the format is selected by the file extension (e.g. PNG) """
+        pygame.image.save(self._display, filename)
+
+
+
+def build_atlas_pixels(font):
+    """
+    Unpack the 1k font (128 chars, 8 bytes each, 6 bits per row) into the glyph atlas pixels: 8-bit
+    pixels (0 - black, 0xff - white), CHAR_HEIGHT rows of 256 chars CHAR_WIDTH pixels wide. Pixels
+    are scaled 2x, chars 0x80-0xff are inverted 0x00-0x7f chars.
+    """
+    bitmaps = numpy.frombuffer(font, dtype=numpy.uint8).reshape(128, 8)
+    bits = (bitmaps[:, :, None] >> numpy.arange(5, -1, -1, dtype=numpy.uint8)) & 1
+    lit = numpy.concatenate([bits == 0, bits != 0])                     # 256 chars x 8 rows x 6 cols
+    lit = lit.repeat(2, axis=1).repeat(2, axis=2)                       # 2x scaling
+    atlas = lit.transpose(1, 0, 2).reshape(CHAR_HEIGHT, 256 * CHAR_WIDTH)
+    return (atlas.astype(numpy.uint8) * 0xff).tobytes()
+
+
+def get_atlas_pixels(font):
+    """
+    Return the glyph atlas pixels for the font (see build_atlas_pixels()). Atlases are cached on disk
+    in the FONT_CACHE_DIR, keyed by the font data hash.
+    """
+    fname = os.path.join(FONT_CACHE_DIR, f"{hashlib.sha1(font).hexdigest()}.atlas")
+    size = CHAR_HEIGHT * 256 * CHAR_WIDTH
+    try:
+        with open(fname, "rb") as f:
+            pixels = f.read()
+        if len(pixels) == size:
+            return pixels
+    except OSError:
+        pass
+
+    pixels = build_atlas_pixels(font)
+
+    # The cache is just an optimization, so a read only or missing home directory is not an error
+    try:
+        os.makedirs(FONT_CACHE_DIR, exist_ok=True)
+        tmpname = f"{fname}.{os.getpid()}.tmp"
+        with open(tmpname, "wb") as f:
+            f.write(pixels)
+        os.replace(tmpname, fname)
+    except OSError:
+        pass
+
+    return pixels
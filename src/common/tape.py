@@ -1,4 +1,5 @@
 import logging
+import struct
 
 logger = logging.getLogger('tape')
 
@@ -144,3 +145,13 @@ class TapeRecorder:
 
     def write_byte(self, offset, value):
         self.write_bit((value & 0x01) != 0)
+
+
+    def save_state(self):
+        # The tape position is defined by the remaining buffer data, and the current byte bits counter
+        return struct.pack('<HHQ', self._byte, self._bits, self._counter) + bytes(self._buffer)
+
+
+    def load_state(self, data):
+        self._byte, self._bits, self._counter = struct.unpack_from('<HHQ', data)
+        self._buffer = bytearray(data[struct.calcsize('<HHQ'):])
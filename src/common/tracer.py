@@ -0,0 +1,120 @@
+import sys
+from array import array
+from collections import namedtuple
+
+from common.cpu import MNEMONICS
+
+TraceRecord = namedtuple("TraceRecord", "cycles pc opcode operand a bc de hl sp flags")
+
+class TraceRecorder:
+    """
+        Binary execution trace recorder
+
+        Text logging of every executed instruction is way too slow to be kept enabled for a long time
+        (e.g. while reproducing a bug in a long CP/M session). The trace recorder is a cheap alternative:
+        the CPU appends a compact binary record for each executed instruction into a preallocated ring
+        buffer, so that only the last N records are kept. The records can be decoded into a human readable
+        form on demand, for example when an exception happens, or at a breakpoint.
+
+        Each record is packed into 3 unsigned 64-bit values:
+        - cycles counter
+        - PC (bits 0-15), opcode (bits 16-23), operand (bits 24-39), flags (bits 40-47), A (bits 48-55)
+        - BC (bits 0-15), DE (bits 16-31), HL (bits 32-47), SP (bits 48-63)
+
+        Registers and flags are recorded before the instruction is executed. Flags are packed the same
+        way as in the PSW register (S Z 0 A 0 P 1 C).
+
+        The recorder is attached to the CPU with the CPU.set_trace_recorder() function.
+    """
+
+    RECORD_SIZE = 3
+
+    def __init__(self, size=65536):
+        self._size = size
+        self._data = array('Q', [0] * (size * self.RECORD_SIZE))
+        self._pos = 0
+        self._count = 0
+
+
+    def get_size(self):
+        return self._size
+
+
+    def get_count(self):
+        """ Number of records available in the buffer """
+        return self._count
+
+
+    def clear(self):
+        self._pos = 0
+        self._count = 0
+
+
+    def record(self, cpu, pc, operand):
+        """ Append the record of the instruction at the pc address, which is about to be executed """
+        flags = 0x02
+        if cpu._sign: flags |= 0x80
+        if cpu._zero: flags |= 0x40
+        if cpu._half_carry: flags |= 0x10
+        if cpu._parity: flags |= 0x04
+        if cpu._carry: flags |= 0x01
+
+        data = self._data
+        pos = self._pos
+        data[pos] = cpu._cycles
+        data[pos + 1] = (pc & 0xffff) | (cpu._current_inst << 16) | (operand << 24) | (flags << 40) | (cpu._a << 48)
+        data[pos + 2] = ((cpu._b << 8) | cpu._c | (cpu._d << 24) | (cpu._e << 16)
+                         | (cpu._h << 40) | (cpu._l << 32) | ((cpu._sp & 0xffff) << 48))
+
+        pos += self.RECORD_SIZE
+        self._pos = pos if pos < len(data) else 0
+        if self._count < self._size:
+            self._count += 1
+
+
+    def get_records(self, count=None):
+        """ Get the last count records (or all available records), oldest first """
+        if count is None or count > self._count:
+            count = self._count
+
+        records = []
+        data = self._data
+        index = self._pos // self.RECORD_SIZE - count
+        for i in range(count):
+            pos = ((index + i) % self._size) * self.RECORD_SIZE
+            cycles, word1, word2 = data[pos], data[pos + 1], data[pos + 2]
+            records.append(TraceRecord(cycles, word1 & 0xffff, (word1 >> 16) & 0xff, (word1 >> 24) & 0xffff,
+                                       (word1 >> 48) & 0xff, word2 & 0xffff, (word2 >> 16) & 0xffff,
+                                       (word2 >> 32) & 0xffff, word2 >> 48, (word1 >> 40) & 0xff))
+
+        return records
+
+
+    def format_records(self, count=None):
+        """ Decode the last count records into text lines, using the CPU instruction log mnemonics """
+        lines = []
+        for rec in self.get_records(count):
+            template = MNEMONICS[rec.opcode]
+            if "{d16" in template:
+                op1, op2 = rec.operand & 0xff, rec.operand >> 8
+                line = f"{rec.pc:04x}  {rec.opcode:02x} {op1:02x} {op2:02x}   {template.format(d16=rec.operand)}"
+            elif "{d8" in template:
+                line = f"{rec.pc:04x}  {rec.opcode:02x} {rec.operand:02x}      {template.format(d8=rec.operand)}"
+            else:
+                line = f"{rec.pc:04x}  {rec.opcode:02x}         {template}"
+
+            flags = f"{'Z' if rec.flags & 0x40 else '-'}{'S' if rec.flags & 0x80 else '-'}"
+            flags += f"{'C' if rec.flags & 0x01 else '-'}{'A' if rec.flags & 0x10 else '-'}"
+            flags += f"{'P' if rec.flags & 0x04 else '-'}"
+
+            state = f"A={rec.a:02x} BC={rec.bc:04x} DE={rec.de:04x} HL={rec.hl:04x} SP={rec.sp:04x} {flags}"
+            lines.append(f"{rec.cycles:10}  {line:35} {state}")
+
+        return lines
+
+
+    def dump(self, count=None, stream=None):
+        """ Write the last count records to the stream (stderr by default) """
+        stream = stream or sys.stderr
+        for line in self.format_records(count):
+            stream.write(line + "\n")
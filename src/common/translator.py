@@ -0,0 +1,686 @@
+import re
+import logging
+
+from common.utils import *
+from common.cpu import REG_PAIR_SYMB, SZP_FLAGS, HALF_CARRY_ADD, HALF_CARRY_SUB, DAA_RESULTS
+
+logger = logging.getLogger('translator')
+
+# Local variable names used by the generated code for CPU registers, and flags
+REG_LOCALS = ["b", "c", "d", "e", "h", "l", None, "a"]
+REG_PAIR_LOCALS = [("b", "c"), ("d", "e"), ("h", "l"), None]
+
+# Local variable name, and matching CPU attribute for every register and flag
+STATE_LOCALS = {
+    "a": "_a", "b": "_b", "c": "_c", "d": "_d", "e": "_e", "h": "_h", "l": "_l", "sp": "_sp",
+    "fs": "_sign", "fz": "_zero", "fh": "_half_carry", "fp": "_parity", "fc": "_carry"
+}
+
+# Condition expressions of conditional jumps, calls, and returns, indexed by the condition code
+CONDITION_EXPRS = ["not fz", "fz", "not fc", "fc", "not fp", "fp", "not fs", "fs"]
+
+# Instruction lengths. Undocumented opcodes are marked with 0 and are never translated
+INSTRUCTION_LENGTHS = [
+    1, 3, 1, 1, 1, 1, 2, 1, 0, 1, 1, 1, 1, 1, 2, 1,
+    0, 3, 1, 1, 1, 1, 2, 1, 0, 1, 1, 1, 1, 1, 2, 1,
+    0, 3, 3, 1, 1, 1, 2, 1, 0, 1, 3, 1, 1, 1, 2, 1,
+    0, 3, 3, 1, 1, 1, 2, 1, 0, 1, 3, 1, 1, 1, 2, 1,
+    1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+    1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+    1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+    1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+    1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+    1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+    1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+    1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+    1, 1, 3, 3, 3, 1, 2, 1, 1, 1, 3, 0, 3, 3, 2, 1,
+    1, 1, 3, 2, 3, 1, 2, 1, 1, 0, 3, 2, 3, 0, 2, 1,
+    1, 1, 3, 1, 3, 1, 2, 1, 1, 1, 3, 1, 3, 0, 2, 1,
+    1, 1, 3, 1, 3, 1, 2, 1, 1, 1, 3, 1, 3, 0, 2, 1,
+]
+
+
+class TranslatedBlock:
+    """
+        A piece of straight-line i8080 code translated to a Python function.
+
+        The block keeps a copy of the code bytes it was translated from. Before running the block the
+        code bytes are compared with the current memory contents, so that the block gets retranslated
+        if the code was changed (e.g. loaded from tape, or modified by the program itself). The code pages
+        are also checked to be still directly readable, as the memory map may be changed (e.g. a memory
+        removed, or flat memory disabled), leaving stale bytes in the flat memory image.
+    """
+    def __init__(self, start, code, func, source):
+        self.start = start
+        self.end = start + len(code)
+        self.code = code
+        self.pages = range(start >> 8, ((self.end - 1) >> 8) + 1)
+        self.func = func
+        self.source = source
+
+
+    def is_valid(self, memory, read_pages):
+        for page in self.pages:
+            if not read_pages[page]:
+                return False
+
+        return memory[self.start : self.end] == self.code
+
+
+
+class BlockTranslator:
+    """
+        Basic block translator (a Python-level JIT) for the i8080 CPU.
+
+        This is an alternative execution engine, working next to the CPU.step() interpreter. Instead of
+        decoding and executing instructions one by one, the translator decodes a straight-line piece of
+        code (up to the next jump, call, return, or other control transfer instruction), generates Python
+        source for the whole block, compiles it once, and caches it by the block start address. The
+        generated code keeps registers and flags in local variables, and accesses plain RAM and ROM
+        directly in the Machine flat memory image (devices are still accessed through the Machine).
+
+        Translation notes:
+        - Only code located in directly accessible flat memory pages is translated. If the code can't be
+          translated (e.g. flat memory is not enabled, or the opcode is not supported), the caller is
+          expected to fall back to CPU.step()
+        - A block never crosses a stop address (e.g. a breakpoint), so that the caller can run the
+          breakpoint handlers before the instruction at that address gets executed
+        - Blocks are validated against the memory contents and the memory map before execution, and
+          retranslated if the code has changed, or the code pages are no longer directly accessible.
+          Memory writes inside a block that hit the block's own code terminate the block right after the
+          writing instruction, so that self-modifying code works as expected
+        - Blocks that end with a conditional jump to their own start (tight loops) keep iterating inside
+          the generated function until the loop exits, cycles limit is reached, or an interrupt is pending
+        - Instruction logging is not performed for translated code
+    """
+
+    MAX_BLOCK_INSTRUCTIONS = 32
+
+    def __init__(self, cpu, stop_addrs=None):
+        self._cpu = cpu
+        self._machine = cpu._machine
+        self._memory = cpu._memory
+        self._read_pages = cpu._read_pages
+        self._blocks = {}
+        self._stop_addrs = stop_addrs if stop_addrs is not None else set()
+
+
+    def set_stop_addresses(self, stop_addrs):
+        """
+        Set addresses the translated blocks shall not cross. The collection is referenced (not copied),
+        so invalidate() or invalidate_addr() must be called after it is changed.
+        """
+        self._stop_addrs = stop_addrs
+        self.invalidate()
+
+
+    def invalidate(self):
+        """ Drop all translated blocks """
+        self._blocks.clear()
+
+
+    def invalidate_addr(self, addr):
+        """ Drop translated blocks that start, end, or cross the address (e.g. a stop address was changed) """
+        for start in [start for start, block in self._blocks.items() if start <= addr <= block.end]:
+            del self._blocks[start]
+
+
+    def get_block(self, addr):
+        """
+        Get the translated block starting at the given address, translating it if needed. Returns None
+        if the code at the address can't be translated.
+        """
+        block = self._blocks.get(addr)
+        if block is not None and block.is_valid(self._memory, self._read_pages):
+            return block
+
+        block = self._translate(addr)
+        if block is None:
+            self._blocks.pop(addr, None)
+            return None
+
+        self._blocks[addr] = block
+        return block
+
+
+    def run_block(self, limit):
+        """
+        Run the block at the current CPU PC address. Tight loops will not iterate past the limit cycles
+        count. Returns False if no block could be translated at this address.
+        """
+        block = self.get_block(self._cpu._pc)
+        if block is None:
+            return False
+
+        block.func(self._cpu, limit)
+        return True
+
+
+    def _decode(self, start):
+        """ Decode instructions of the block. Returns a list of (addr, opcode, operand) tuples """
+        instructions = []
+        addr = start
+        while len(instructions) < self.MAX_BLOCK_INSTRUCTIONS:
+            if addr != start and addr in self._stop_addrs:
+                break
+
+            if addr > 0xffff or not self._read_pages[addr >> 8]:
+                break
+
+            opcode = self._memory[addr]
+            length = INSTRUCTION_LENGTHS[opcode]
+            if length == 0 or addr + length > 0x10000:
+                break
+
+            for offset in range(1, length):
+                if not self._read_pages[(addr + offset) >> 8]:
+                    return instructions
+
+            if length == 1:
+                operand = None
+            elif length == 2:
+                operand = self._memory[addr + 1]
+            else:
+                operand = self._memory[addr + 1] | (self._memory[addr + 2] << 8)
+
+            instructions.append((addr, opcode, operand))
+            addr += length
+
+            if _is_block_terminator(opcode):
+                break
+
+        return instructions
+
+
+    def _translate(self, start):
+        instructions = self._decode(start)
+        if not instructions:
+            return None
+
+        last_addr, last_opcode, last_operand = instructions[-1]
+        end = last_addr + INSTRUCTION_LENGTHS[last_opcode]
+        loop = last_opcode & 0xc7 == 0xc2 and last_operand == start and start not in self._stop_addrs
+
+        generator = _BlockGenerator(start, end, loop)
+        for addr, opcode, operand in instructions:
+            if not generator.add_instruction(addr, opcode, operand):
+                break
+
+        source = generator.get_source()
+        logger.debug(f"Translated block 0x{start:04x}-0x{generator.end - 1:04x}:\n{source}")
+
+        namespace = {}
+        exec(compile(source, f"<block 0x{start:04x}>", "exec"), namespace)
+        func = namespace["make_block"](self._memory, self._cpu._read_pages, self._cpu._write_pages,
+                                       self._cpu._stack_pages, self._machine,
+                                       SZP_FLAGS, HALF_CARRY_ADD, HALF_CARRY_SUB, DAA_RESULTS)
+
+        code = bytes(self._memory[start : generator.end])
+        return TranslatedBlock(start, code, func, source)
+
+
+
+def _is_block_terminator(opcode):
+    """ Instructions that transfer control, or change interrupts state terminate the block """
+    if opcode in (0xc3, 0xc9, 0xcd, 0xe9, 0xf3, 0xfb):     # JMP, RET, CALL, PCHL, DI, EI
+        return True
+    if opcode & 0xc7 in (0xc0, 0xc2, 0xc4, 0xc7):           # Rcc, Jcc, Ccc, RST
+        return True
+    return False
+
+
+
+class _BlockGenerator:
+    """
+        Python source generator for a single translated block.
+
+        Each add_instruction() call appends Python code emulating the instruction. Exits from the block
+        are emitted with a placeholder for storing local registers back to the CPU, which is resolved
+        when the final source is built (only registers actually used by the block are loaded and stored).
+    """
+
+    STORE_PLACEHOLDER = "@STORE@"
+
+    def __init__(self, start, end, loop):
+        self.start = start
+        self.end = end              # End address of the code range considered by the block
+        self._loop = loop           # The block is a loop, ending with a conditional jump to its start
+        self._lines = []
+        self._cycles = 0            # Cycles of the instructions emitted so far
+        self._terminated = False
+
+
+    def _emit(self, *lines, indent=0):
+        for line in lines:
+            self._lines.append("    " * indent + line)
+
+
+    def _emit_exit(self, pc_expr, cycles, indent=0):
+        self._emit(self.STORE_PLACEHOLDER, indent=indent)
+        self._emit(f"cpu._pc = {pc_expr}", indent=indent)
+        if self._loop:
+            self._emit(f"cpu._cycles = cycles + {cycles}", indent=indent)
+        else:
+            self._emit(f"cpu._cycles += {cycles}", indent=indent)
+        self._emit("return", indent=indent)
+
+
+    def _emit_code_write_check(self, addr_expr, next_addr, cycles, word=False):
+        # Writing to the block's own code terminates the block right after the writing instruction
+        low = self.start - 1 if word else self.start
+        self._emit(f"if {low} <= {addr_expr} < {self.end}:")
+        self._emit_exit(f"0x{next_addr:04x}", cycles, indent=1)
+
+
+    def _emit_read_byte(self, target, addr_expr):
+        self._emit(f"t = {addr_expr}",
+                   f"{target} = mem[t] if rpages[t >> 8] else machine.read_memory_byte(t)")
+
+
+    def _emit_write_byte(self, addr_expr, value_expr, next_addr, cycles):
+        self._emit(f"t = {addr_expr}",
+                   f"if wpages[t >> 8]:",
+                   f"    mem[t] = {value_expr}",
+                   f"else:",
+                   f"    machine.write_memory_byte(t, {value_expr})")
+        self._emit_code_write_check("t", next_addr, cycles)
+
+
+    def _emit_read_word(self, target, addr_expr):
+        self._emit(f"t = {addr_expr}",
+                   f"if rpages[t >> 8] and rpages[(t + 1) >> 8]:",
+                   f"    {target} = mem[t] | (mem[t + 1] << 8)",
+                   f"else:",
+                   f"    {target} = machine.read_memory_word(t)")
+
+
+    def _emit_write_word(self, addr_expr, value_expr, next_addr, cycles):
+        self._emit(f"t = {addr_expr}",
+                   f"v = {value_expr}",
+                   f"if wpages[t >> 8] and wpages[(t + 1) >> 8]:",
+                   f"    mem[t] = v & 0xff",
+                   f"    mem[t + 1] = v >> 8",
+                   f"else:",
+                   f"    machine.write_memory_word(t, v)")
+        self._emit_code_write_check("t", next_addr, cycles, word=True)
+
+
+    def _emit_read_stack(self, target):
+        self._emit(f"if spages[sp >> 8] and spages[(sp + 1) >> 8]:",
+                   f"    {target} = mem[sp] | (mem[sp + 1] << 8)",
+                   f"else:",
+                   f"    {target} = machine.read_stack(sp)")
+
+
+    def _emit_write_stack(self, value_expr, next_addr, cycles):
+        self._emit(f"v = {value_expr}",
+                   f"if spages[sp >> 8] and spages[(sp + 1) >> 8]:",
+                   f"    mem[sp] = v & 0xff",
+                   f"    mem[sp + 1] = v >> 8",
+                   f"else:",
+                   f"    machine.write_stack(sp, v)")
+        self._emit_code_write_check("sp", next_addr, cycles, word=True)
+
+
+    def _emit_push(self, value_expr, next_addr, cycles):
+        self._emit("sp -= 2")
+        self._emit_write_stack(value_expr, next_addr, cycles)
+
+
+    def _emit_pop(self, target):
+        self._emit_read_stack(target)
+        self._emit("sp += 2")
+
+
+    def _emit_alu(self, op, value_expr):
+        if op == 0:     # ADD
+            self._emit(f"v = {value_expr}",
+                       f"r = a + v",
+                       f"fc = r > 0xff",
+                       f"fh = hc_add[((a & 0x0f) << 4) | (v & 0x0f)]",
+                       f"a = r & 0xff",
+                       f"fs, fz, fp = szp[a]")
+        elif op == 1:   # ADC
+            self._emit(f"v = {value_expr}",
+                       f"cy = 1 if fc else 0",
+                       f"r = a + v + cy",
+                       f"fc = r > 0xff",
+                       f"fh = hc_add[(cy << 8) | ((a & 0x0f) << 4) | (v & 0x0f)]",
+                       f"a = r & 0xff",
+                       f"fs, fz, fp = szp[a]")
+        elif op == 2:   # SUB
+            self._emit(f"v = {value_expr}",
+                       f"r = a - v",
+                       f"fc = r < 0",
+                       f"fh = hc_sub[((a & 0x0f) << 4) | (v & 0x0f)]",
+                       f"a = r & 0xff",
+                       f"fs, fz, fp = szp[a]")
+        elif op == 3:   # SBB
+            self._emit(f"v = {value_expr}",
+                       f"cy = 1 if fc else 0",
+                       f"r = a - v - cy",
+                       f"fc = r < 0",
+                       f"fh = hc_sub[(cy << 8) | ((a & 0x0f) << 4) | (v & 0x0f)]",
+                       f"a = r & 0xff",
+                       f"fs, fz, fp = szp[a]")
+        elif op == 7:   # CMP
+            self._emit(f"v = {value_expr}",
+                       f"r = a - v",
+                       f"fc = r < 0",
+                       f"fh = hc_sub[((a & 0x0f) << 4) | (v & 0x0f)]",
+                       f"fs, fz, fp = szp[r & 0xff]")
+        else:           # ANA, XRA, ORA
+            operator = ["&", "^", "|"][op - 4]
+            self._emit(f"a {operator}= {value_expr}",
+                       f"fc = False",
+                       f"fh = False",
+                       f"fs, fz, fp = szp[a]")
+
+
+    def _emit_loop_or_exit(self, cond, target, next_addr, cycles):
+        """ Conditional jump at the end of the block. Jump to the block start turns into a loop """
+        if self._loop and target == self.start:
+            self._emit(f"cycles += {self._cycles + cycles}",
+                       f"if {cond} and cycles <= limit and not (cpu._enable_interrupts and cpu._interrupt_instructions):",
+                       f"    continue")
+            self._emit(self.STORE_PLACEHOLDER,
+                       f"cpu._pc = 0x{target:04x} if {cond} else 0x{next_addr:04x}",
+                       f"cpu._cycles = cycles",
+                       f"return")
+        else:
+            self._emit(f"if {cond}:")
+            self._emit_exit(f"0x{target:04x}", self._cycles + cycles, indent=1)
+            self._emit_exit(f"0x{next_addr:04x}", self._cycles + cycles)
+
+
+    def add_instruction(self, addr, opcode, operand):
+        """
+        Emit the code for the instruction. Returns False if the block was terminated by this instruction
+        """
+        next_addr = addr + INSTRUCTION_LENGTHS[opcode]
+        cycles = None       # Cycles of a non-terminating instruction
+        hl = "((h << 8) | l)"
+
+        if opcode == 0x00:                                      # NOP
+            cycles = 4
+
+        elif opcode & 0xc0 == 0x40:                             # MOV
+            dst = (opcode >> 3) & 0x07
+            src = opcode & 0x07
+            cycles = 7 if src == 6 or dst == 6 else 5
+            if src == 6:
+                self._emit_read_byte(REG_LOCALS[dst], hl)
+            elif dst == 6:
+                self._emit_write_byte(hl, REG_LOCALS[src], next_addr, self._cycles + cycles)
+            elif src != dst:
+                self._emit(f"{REG_LOCALS[dst]} = {REG_LOCALS[src]}")
+
+        elif opcode & 0xc7 == 0x06:                             # MVI
+            reg = (opcode >> 3) & 0x07
+            cycles = 10 if reg == 6 else 7
+            if reg == 6:
+                self._emit_write_byte(hl, f"0x{operand:02x}", next_addr, self._cycles + cycles)
+            else:
+                self._emit(f"{REG_LOCALS[reg]} = 0x{operand:02x}")
+
+        elif opcode & 0xcf == 0x01:                             # LXI
+            reg_pair = (opcode >> 4) & 0x03
+            cycles = 10
+            if reg_pair == 3:
+                self._emit(f"sp = 0x{operand:04x}")
+            else:
+                high, low = REG_PAIR_LOCALS[reg_pair]
+                self._emit(f"{high} = 0x{operand >> 8:02x}", f"{low} = 0x{operand & 0xff:02x}")
+
+        elif opcode == 0x3a:                                    # LDA
+            cycles = 13
+            self._emit_read_byte("a", f"0x{operand:04x}")
+
+        elif opcode == 0x32:                                    # STA
+            cycles = 13
+            self._emit_write_byte(f"0x{operand:04x}", "a", next_addr, self._cycles + cycles)
+
+        elif opcode in (0x0a, 0x1a):                            # LDAX
+            high, low = REG_PAIR_LOCALS[(opcode >> 4) & 0x01]
+            cycles = 7
+            self._emit_read_byte("a", f"(({high} << 8) | {low})")
+
+        elif opcode in (0x02, 0x12):                            # STAX
+            high, low = REG_PAIR_LOCALS[(opcode >> 4) & 0x01]
+            cycles = 7
+            self._emit_write_byte(f"(({high} << 8) | {low})", "a", next_addr, self._cycles + cycles)
+
+        elif opcode == 0x2a:                                    # LHLD
+            cycles = 16
+            self._emit_read_word("v", f"0x{operand:04x}")
+            self._emit("h = v >> 8", "l = v & 0xff")
+
+        elif opcode == 0x22:                                    # SHLD
+            cycles = 16
+            self._emit_write_word(f"0x{operand:04x}", hl, next_addr, self._cycles + cycles)
+
+        elif opcode == 0xeb:                                    # XCHG
+            cycles = 5
+            self._emit("d, e, h, l = h, l, d, e")
+
+        elif opcode == 0xe3:                                    # XTHL
+            cycles = 18
+            self._emit_read_stack("r")
+            self._emit(f"m = {hl}", "h = r >> 8", "l = r & 0xff")
+            self._emit_write_stack("m", next_addr, self._cycles + cycles)
+
+        elif opcode & 0xcf == 0xc5:                             # PUSH
+            reg_pair = (opcode >> 4) & 0x03
+            cycles = 11
+            if reg_pair == 3:
+                value = ("(a << 8) | 0x02 | (0x80 if fs else 0) | (0x40 if fz else 0) | "
+                         "(0x10 if fh else 0) | (0x04 if fp else 0) | (0x01 if fc else 0)")
+            else:
+                high, low = REG_PAIR_LOCALS[reg_pair]
+                value = f"({high} << 8) | {low}"
+            self._emit_push(value, next_addr, self._cycles + cycles)
+
+        elif opcode & 0xcf == 0xc1:                             # POP
+            reg_pair = (opcode >> 4) & 0x03
+            cycles = 10
+            self._emit_pop("v")
+            if reg_pair == 3:
+                self._emit("a = v >> 8",
+                           "fs = (v & 0x80) != 0",
+                           "fz = (v & 0x40) != 0",
+                           "fh = (v & 0x10) != 0",
+                           "fp = (v & 0x04) != 0",
+                           "fc = (v & 0x01) != 0")
+            else:
+                high, low = REG_PAIR_LOCALS[reg_pair]
+                self._emit(f"{high} = v >> 8", f"{low} = v & 0xff")
+
+        elif opcode == 0xdb:                                    # IN
+            cycles = 10
+            self._emit(f"a = machine.read_io(0x{operand:02x})")
+
+        elif opcode == 0xd3:                                    # OUT
+            cycles = 10
+            self._emit(f"machine.write_io(0x{operand:02x}, a)")
+
+        elif opcode == 0xc3:                                    # JMP
+            self._emit_exit(f"0x{operand:04x}", self._cycles + 10)
+
+        elif opcode & 0xc7 == 0xc2:                             # Jcc
+            cond = CONDITION_EXPRS[(opcode >> 3) & 0x07]
+            self._emit_loop_or_exit(cond, operand, next_addr, 10)
+
+        elif opcode == 0xcd:                                    # CALL
+            self._emit_push(f"0x{next_addr:04x}", operand, self._cycles + 17)
+            self._emit_exit(f"0x{operand:04x}", self._cycles + 17)
+
+        elif opcode & 0xc7 == 0xc4:                             # Ccc
+            cond = CONDITION_EXPRS[(opcode >> 3) & 0x07]
+            self._emit(f"if {cond}:")
+            inner = _BlockGenerator(self.start, self.end, self._loop)
+            inner._emit_push(f"0x{next_addr:04x}", operand, self._cycles + 17)
+            inner._emit_exit(f"0x{operand:04x}", self._cycles + 17)
+            self._emit(*inner._lines, indent=1)
+            self._emit_exit(f"0x{next_addr:04x}", self._cycles + 11)
+
+        elif opcode == 0xc9:                                    # RET
+            self._emit_pop("v")
+            self._emit_exit("v", self._cycles + 10)
+
+        elif opcode & 0xc7 == 0xc0:                             # Rcc
+            cond = CONDITION_EXPRS[(opcode >> 3) & 0x07]
+            self._emit(f"if {cond}:")
+            inner = _BlockGenerator(self.start, self.end, self._loop)
+            inner._emit_pop("v")
+            inner._emit_exit("v", self._cycles + 11)
+            self._emit(*inner._lines, indent=1)
+            self._emit_exit(f"0x{next_addr:04x}", self._cycles + 5)
+
+        elif opcode & 0xc7 == 0xc7:                             # RST
+            rst = (opcode >> 3) & 0x07
+            self._emit_push(f"0x{next_addr:04x}", rst << 3, self._cycles + 11)
+            self._emit_exit(f"0x{rst << 3:04x}", self._cycles + 11)
+
+        elif opcode == 0xe9:                                    # PCHL
+            self._emit_exit(hl, self._cycles + 5)
+
+        elif opcode == 0xf9:                                    # SPHL
+            cycles = 5
+            self._emit(f"sp = {hl}")
+
+        elif opcode in (0xf3, 0xfb):                            # DI, EI
+            self._emit(f"cpu._enable_interrupts = {opcode == 0xfb}")
+            self._emit_exit(f"0x{next_addr:04x}", self._cycles + 4)
+
+        elif opcode & 0xc0 == 0x80:                             # ALU operations with registers
+            op = (opcode >> 3) & 0x07
+            reg = opcode & 0x07
+            cycles = 7 if reg == 6 else 4
+            if reg == 6:
+                self._emit_read_byte("m", hl)
+                self._emit_alu(op, "m")
+            else:
+                self._emit_alu(op, REG_LOCALS[reg])
+
+        elif opcode & 0xc7 == 0xc6:                             # ALU operations with immediate value
+            cycles = 7
+            self._emit_alu((opcode >> 3) & 0x07, f"0x{operand:02x}")
+
+        elif opcode & 0xc7 in (0x04, 0x05):                     # INR, DCR
+            reg = (opcode >> 3) & 0x07
+            increment = opcode & 0x07 == 0x04
+            cycles = 10 if reg == 6 else 5
+            target = "m" if reg == 6 else REG_LOCALS[reg]
+            if reg == 6:
+                self._emit_read_byte("m", hl)
+            self._emit(f"{target} = ({target} {'+' if increment else '-'} 1) & 0xff",
+                       f"fs, fz, fp = szp[{target}]",
+                       f"fh = ({target} & 0xf) == 0x0" if increment else f"fh = {target} == 0x0f")
+            if reg == 6:
+                self._emit_write_byte("t", "m", next_addr, self._cycles + cycles)
+
+        elif opcode & 0xc7 == 0x03:                             # INX, DCX
+            reg_pair = (opcode >> 4) & 0x03
+            sign = "+" if opcode & 0x08 == 0 else "-"
+            cycles = 5
+            if reg_pair == 3:
+                self._emit(f"sp = (sp {sign} 1) & 0xffff")
+            else:
+                high, low = REG_PAIR_LOCALS[reg_pair]
+                self._emit(f"v = ((({high} << 8) | {low}) {sign} 1) & 0xffff",
+                           f"{high} = v >> 8",
+                           f"{low} = v & 0xff")
+
+        elif opcode & 0xcf == 0x09:                             # DAD
+            reg_pair = (opcode >> 4) & 0x03
+            cycles = 10
+            if reg_pair == 3:
+                value = "sp"
+            else:
+                high, low = REG_PAIR_LOCALS[reg_pair]
+                value = f"(({high} << 8) | {low})"
+            self._emit(f"r = {hl} + {value}",
+                       f"h = (r >> 8) & 0xff",
+                       f"l = r & 0xff",
+                       f"fc = r >= 0x10000")
+
+        elif opcode == 0x27:                                    # DAA
+            cycles = 4
+            self._emit("a, fc, fh = daa[a | (0x100 if fc else 0) | (0x200 if fh else 0)]",
+                       "fs, fz, fp = szp[a]")
+
+        elif opcode == 0x07:                                    # RLC
+            cycles = 4
+            self._emit("fc = (a & 0x80) != 0", "a = ((a << 1) & 0xff) | (a >> 7)")
+
+        elif opcode == 0x0f:                                    # RRC
+            cycles = 4
+            self._emit("fc = (a & 0x01) != 0", "a = (a >> 1) | ((a << 7) & 0xff)")
+
+        elif opcode == 0x17:                                    # RAL
+            cycles = 4
+            self._emit("v = a", "a = ((a << 1) & 0xff) | (1 if fc else 0)", "fc = (v & 0x80) != 0")
+
+        elif opcode == 0x1f:                                    # RAR
+            cycles = 4
+            self._emit("v = a", "a = (a >> 1) | (0x80 if fc else 0)", "fc = (v & 0x01) != 0")
+
+        elif opcode == 0x37:                                    # STC
+            cycles = 4
+            self._emit("fc = True")
+
+        elif opcode == 0x3f:                                    # CMC
+            cycles = 4
+            self._emit("fc = not fc")
+
+        elif opcode == 0x2f:                                    # CMA
+            cycles = 4
+            self._emit("a = (~a) & 0xff")
+
+        else:
+            raise InvalidInstruction(f"Opcode 0x{opcode:02x} can't be translated")
+
+        if cycles is None:
+            self._terminated = True
+            return False
+
+        self._cycles += cycles
+
+        # Constant address writes into the block's own code must terminate the block
+        if opcode in (0x32, 0x22) and self.start - 1 <= operand < self.end:
+            self._emit_exit(f"0x{next_addr:04x}", self._cycles)
+            self._terminated = True
+            self.end = next_addr
+            return False
+
+        return True
+
+
+    def get_source(self):
+        if not self._terminated:
+            self._emit_exit(f"0x{self.end:04x}", self._cycles)
+
+        body = "\n".join(self._lines)
+        used = [name for name in STATE_LOCALS if re.search(rf"\b{name}\b", body)]
+
+        load = "; ".join(f"{name} = cpu.{STATE_LOCALS[name]}" for name in used) or "pass"
+        store = "; ".join(f"cpu.{STATE_LOCALS[name]} = {name}" for name in used) or "pass"
+
+        lines = ["def make_block(mem, rpages, wpages, spages, machine, szp, hc_add, hc_sub, daa):",
+                 "    def block(cpu, limit):",
+                 f"        {load}"]
+        indent = "        "
+        if self._loop:
+            lines.append("        cycles = cpu._cycles")
+            lines.append("        while True:")
+            indent = "            "
+
+        for line in self._lines:
+            stripped = line.lstrip(" ")
+            line_indent = line[: len(line) - len(stripped)]
+            if stripped == self.STORE_PLACEHOLDER:
+                stripped = store
+            lines.append(indent + line_indent + stripped)
+
+        lines.append("    return block")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,187 @@
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+
+"""
+    Emulation process
+
+    By default the emulator runs the CPU emulation and the screen rendering in the same loop, so every
+    rendered frame steals time from the emulation (and vice versa). The EmulationProcess class runs the
+    emulation in a separate worker process, so that the emulation and rendering run on different CPU
+    cores.
+
+    The worker creates a headless machine configuration, and runs the emulation at the real CPU speed
+    (or in the turbo mode). The UI process does not create a machine, it creates just a display-only
+    frontend of the configuration (see RemoteFrontend class in main.py) to render the screen data
+    published by the worker.
+
+    Processes exchange data via a shared memory block (see SharedState class):
+    - The UI process publishes the emulated keyboard state (e.g. pressed key matrix values)
+    - The worker publishes the screen data (e.g. video RAM contents), and the CPU cycles counter
+    The data layout is defined by the configuration and its frontend (see RemoteFrontend.get_key_state() and
+    Configuration.get_screen_data()). Less frequent commands (reset, load a tape file, toggle turbo mode,
+    quit) are sent to the worker via a queue.
+"""
+
+HEADER_FORMAT = '<IIIIQ'    # Screen data seq, screen data size, key state seq, key state size, CPU cycles
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+SCREEN_SEQ_OFFSET = 0
+SCREEN_SIZE_OFFSET = 4
+KEY_SEQ_OFFSET = 8
+KEY_SIZE_OFFSET = 12
+CYCLES_OFFSET = 16
+
+KEY_STATE_SIZE = 16         # Max size of the keyboard state
+SCREEN_DATA_SIZE = 0x2000   # Max size of the screen data
+
+KEY_STATE_OFFSET = HEADER_SIZE
+SCREEN_DATA_OFFSET = KEY_STATE_OFFSET + KEY_STATE_SIZE
+
+STOP_TIMEOUT = 5            # Seconds to wait for the worker to save its state and exit
+
+
+class SharedState:
+    """
+        Shared memory block to exchange the keyboard state and the screen data between processes.
+
+        Each of the 2 data areas has a single writer process. Every write increments the area sequence
+        counter twice - before and after the data is updated, so that the counter is odd while the write is
+        in progress. The reader compares the counter before and after copying the data, and discards the
+        torn data (a consistent copy will be taken on the next poll). The sequence counter also allows the
+        reader to detect that the data has not changed since the previous read.
+
+        The block is created if no name is specified, otherwise the existing block is attached.
+    """
+    def __init__(self, name=None):
+        size = HEADER_SIZE + KEY_STATE_SIZE + SCREEN_DATA_SIZE
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=size)
+        self._buf = self._shm.buf
+
+        if self._owner:
+            struct.pack_into(HEADER_FORMAT, self._buf, 0, 0, 0, 0, 0, 0)
+
+        self._screen_seq = 0
+        self._key_seq = 0
+
+
+    @property
+    def name(self):
+        return self._shm.name
+
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+    def _write(self, seq_offset, size_offset, data_offset, max_size, data):
+        if len(data) > max_size:
+            raise ValueError(f"Shared data size {len(data)} exceeds {max_size} bytes")
+
+        seq, = struct.unpack_from('<I', self._buf, seq_offset)
+        struct.pack_into('<I', self._buf, seq_offset, (seq + 1) & 0xffffffff)
+        struct.pack_into('<I', self._buf, size_offset, len(data))
+        self._buf[data_offset : data_offset + len(data)] = data
+        struct.pack_into('<I', self._buf, seq_offset, (seq + 2) & 0xffffffff)
+
+
+    def _read(self, seq_offset, size_offset, data_offset, last_seq):
+        seq, = struct.unpack_from('<I', self._buf, seq_offset)
+        if seq & 1 or seq == last_seq:
+            return seq, None    # Write in progress, or no new data
+
+        size, = struct.unpack_from('<I', self._buf, size_offset)
+        data = bytes(self._buf[data_offset : data_offset + size])
+
+        if struct.unpack_from('<I', self._buf, seq_offset)[0] != seq:
+            return last_seq, None   # The data was changed while copying
+
+        return seq, data
+
+
+    def write_screen_data(self, data):
+        self._write(SCREEN_SEQ_OFFSET, SCREEN_SIZE_OFFSET, SCREEN_DATA_OFFSET, SCREEN_DATA_SIZE, data)
+
+
+    def read_screen_data(self):
+        """ Return the screen data, or None if it has not changed since the previous call """
+        self._screen_seq, data = self._read(SCREEN_SEQ_OFFSET, SCREEN_SIZE_OFFSET, SCREEN_DATA_OFFSET,
+                                            self._screen_seq)
+        return data
+
+
+    def write_key_state(self, data):
+        self._write(KEY_SEQ_OFFSET, KEY_SIZE_OFFSET, KEY_STATE_OFFSET, KEY_STATE_SIZE, data)
+
+
+    def read_key_state(self):
+        """ Return the keyboard state, or None if it has not changed since the previous call """
+        self._key_seq, data = self._read(KEY_SEQ_OFFSET, KEY_SIZE_OFFSET, KEY_STATE_OFFSET, self._key_seq)
+        return data
+
+
+    def set_cycles(self, cycles):
+        struct.pack_into('<Q', self._buf, CYCLES_OFFSET, cycles)
+
+
+    def get_cycles(self):
+        return struct.unpack_from('<Q', self._buf, CYCLES_OFFSET)[0]
+
+
+
+def _run_worker(args, shm_name, commands):
+    from main import create_configuration
+
+    shared = SharedState(shm_name)
+    try:
+        configuration = create_configuration(args, headless=True)
+        configuration.run_worker(shared, commands)
+    finally:
+        shared.close()
+
+
+
+class EmulationProcess:
+    """
+        Starts the worker process that runs the emulation for the configuration described by the main.py
+        command line arguments.
+    """
+    def __init__(self, args):
+        # Spawn a fresh interpreter, so that the worker does not inherit the UI process SDL state
+        context = multiprocessing.get_context("spawn")
+
+        self._shared = SharedState()
+        self._commands = context.Queue()
+        self._process = context.Process(target=_run_worker, args=(args, self._shared.name, self._commands),
+                                        daemon=True)
+        self._process.start()
+
+
+    @property
+    def shared(self):
+        return self._shared
+
+
+    def send_command(self, command, *params):
+        self._commands.put((command, *params))
+
+
+    def is_alive(self):
+        return self._process.is_alive()
+
+
+    def stop(self):
+        """ Ask the worker to save the machine state and exit, and release the shared memory """
+        if self._process.is_alive():
+            self.send_command("quit")
+            self._process.join(STOP_TIMEOUT)
+
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+        self._shared.close()
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import importlib.util
+import multiprocessing
+
+"""
+    Test farm runner
+
+    Many scenarios (e.g. running a program under CP/M, or typing a command in UT-88 OS) start with booting
+    the same machine configuration, which takes seconds of emulated time. The farm boots each configuration
+    only once, and saves the machine state snapshot. Scenarios are then distributed across a pool of worker
+    processes. For every scenario a worker creates a fresh headless machine configuration (no display
+    and SDL initialization), restores the booted snapshot, and runs the scenario function.
+
+    Scenarios are described in a Python module with a SCENARIOS list of (name, configuration, function)
+    tuples, where configuration is one of the main.py configuration names (basic, video, ut88os, cpm64,
+    radio86rk). The scenario function receives the booted Configuration object, and reports a failure by
+    raising an exception (e.g. AssertionError). Typically the scenario types keys with the configuration's
+    emulate_key_press() function, runs the machine with run_cycles(), and checks get_screen_text() or
+    the machine memory. If no scenarios module is specified, a built-in set of smoke scenarios is executed.
+
+    Each boot and each scenario runs in its own temporary directory, with a copy of the quasi disk file, so
+    that scenarios do not affect each other, and do not change the user's quasi disk image.
+
+    Usage: python farm.py [-s scenarios.py] [-p processes] [-j]
+"""
+
+BOOT_MAX_CYCLES = 50000000  # Boot the configuration until it is idle waiting for input, or this many cycles
+SMOKE_CYCLES = 2000000      # One emulated second at 2MHz
+
+QUASI_DISK_FILE = "QuasiDisk.bin"
+
+
+def _create_configuration(name, jit):
+    from main import CONFIGURATIONS
+
+    configuration = CONFIGURATIONS[name](headless=True)
+    if jit:
+        configuration.enable_block_translation()
+    return configuration
+
+
+@contextlib.contextmanager
+def _sandbox():
+    """ Run in a temporary directory with a copy of the quasi disk file (if there is one) """
+    quasi_disk_file = os.path.abspath(QUASI_DISK_FILE)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if os.path.exists(quasi_disk_file):
+            shutil.copy(quasi_disk_file, tmpdir)
+        os.chdir(tmpdir)
+
+        try:
+            yield
+        finally:
+            os.chdir(cwd)
+
+
+def _boot(name, jit):
+    with _sandbox():
+        configuration = _create_configuration(name, jit)
+        start = time.perf_counter()
+        configuration.boot(BOOT_MAX_CYCLES)
+        emulator = configuration.emulator
+        return name, emulator.save_state(), emulator._cpu._cycles, time.perf_counter() - start
+
+
+def _load_scenarios(fname):
+    if not fname:
+        return SMOKE_SCENARIOS
+
+    spec = importlib.util.spec_from_file_location("farm_scenarios", fname)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.SCENARIOS
+
+
+def _run_scenario(scenarios_file, index, snapshot, jit):
+    name, configuration_name, function = _load_scenarios(scenarios_file)[index]
+
+    with _sandbox():
+        configuration = _create_configuration(configuration_name, jit)
+        emulator = configuration.emulator
+        emulator.load_state(snapshot)
+
+        cycles = emulator._cpu._cycles
+        start = time.perf_counter()
+        try:
+            function(configuration)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+        return name, error, emulator._cpu._cycles - cycles, time.perf_counter() - start
+
+
+def _smoke_scenario(configuration):
+    configuration.run_cycles(SMOKE_CYCLES)
+
+
+SMOKE_SCENARIOS = [(f"{name}_idle", name, _smoke_scenario)
+                   for name in ["basic", "video", "ut88os", "cpm64", "radio86rk"]]
+
+
+def run_farm(scenarios_file=None, processes=None, jit=False):
+    """
+    Boot configurations used by the scenarios, run the scenarios in a process pool, and print
+    per-scenario results. Returns True if all scenarios passed.
+    """
+    scenarios = _load_scenarios(scenarios_file)
+    configurations = sorted(set(scenario[1] for scenario in scenarios))
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        snapshots = {}
+        for name, snapshot, cycles, wall in pool.starmap(_boot, [(name, jit) for name in configurations]):
+            print(f"Booted {name:<12} {cycles:>12} cycles {wall:8.3f}s")
+            snapshots[name] = snapshot
+
+        tasks = [(scenarios_file, index, snapshots[scenario[1]], jit) for index, scenario in enumerate(scenarios)]
+        results = pool.starmap(_run_scenario, tasks)
+
+    failed = 0
+    total_cycles = 0
+    total_wall = 0
+    for name, error, cycles, wall in results:
+        print(f"{'FAIL' if error else 'PASS'} {name:<32} {cycles:>12} cycles {wall:8.3f}s")
+        if error:
+            print(f"     {error}")
+            failed += 1
+        total_cycles += cycles
+        total_wall += wall
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(results) - failed} passed, {failed} failed, {total_cycles} cycles, "
+          f"{total_wall:.3f}s scenarios time, {elapsed:.3f}s elapsed")
+
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog='UT-88 Test Farm',
+                    description='Run emulator scenarios from pre-booted machine snapshots in parallel')
+
+    parser.add_argument('-s', '--scenarios', help="python module with the SCENARIOS list (built-in smoke scenarios by default)")
+    parser.add_argument('-p', '--processes', help="number of worker processes (number of CPUs by default)", type=int)
+    parser.add_argument('-j', '--jit', help="run translated code blocks instead of interpreting instructions", action='store_true')
+    args = parser.parse_args()
+
+    sys.exit(0 if run_farm(args.scenarios, args.processes, args.jit) else 1)
+
+
+if __name__ == '__main__':
+    main()
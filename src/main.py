@@ -1,5 +1,12 @@
 import os
+import sys
+import time
+import queue
 import logging
+
+# Keep stdout clean for the headless mode screen dumps
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
 import pygame
 import argparse
 from tkinter import filedialog
@@ -10,9 +17,13 @@ from common.interfaces import MemoryDevice, IODevice
 from common.ram import RAM
 from common.rom import ROM
 from common.dma import DMA
-from common.ppi import PPI
+from common.ppi import PPI, PPI_PORT_A
 from common.tape import TapeRecorder
 from common.utils import NestedLogger
+from common.state import pack_chunk, unpack_chunks
+from common.tracer import TraceRecorder
+from common.recording import ScreenRecorder
+from emulation_process import EmulationProcess
 from ut88.lcd import LCD
 from ut88.hexkbd import HexKeyboard
 from ut88.timer import Timer
@@ -22,7 +33,7 @@ from ut88.quasidisk import QuasiDisk
 from ut88.machine import UT88Machine
 from ut88.bios_emulator import *
 from radio86rk.keyboard import RK86Keyboard
-from radio86rk.display import RK86Display
+from radio86rk.display import RK86Display, CURSOR_BLINK_PERIOD
 
 resources_dir = os.path.join(os.path.dirname(__file__), "..", "resources")
 tapes_dir = os.path.join(os.path.dirname(__file__), "..", "tapes")
@@ -48,21 +59,316 @@ def save_pki():
     return filedialog.asksaveasfilename(filetypes=filetypes, defaultextension="pki")
 
 
+FRAME_CYCLES = 20000        # CPU cycles emulated between screen refreshes
+IDLE_WAIT_TIMEOUT = 100    # ms to wait for an input event while the emulated machine is idle
+
+UT88_CPU_FREQUENCY = 2000000       # UT-88 CPU clock, Hz
+RK86_CPU_FREQUENCY = 1780000       # Radio-86RK CPU clock, Hz
+MAX_CATCH_UP_TIME = 0.25            # Max emulated time (seconds) to catch up when the host falls behind
+TURBO_RENDER_PERIOD = 0.1          # Turbo mode: wall time (seconds) to emulate between screen refreshes
+FRAME_TIME = 1 / 60                # Host frame duration (seconds)
+SPEED_MEASURE_PERIOD = 1           # How often (seconds) the emulated CPU speed is updated in the caption
+
+RECORDING_FPS = 25              # Screen recording frames per second of the emulated time
+
+KEY_PRESS_CYCLES = 100000       # Headless mode: how long each key of the input script is held
+HEADLESS_MAX_CYCLES = 20000000  # Headless mode: max cycles to wait for the machine to get idle after a key
+
 def beep():
     print("\a")     # Make a ding sound
 
 def breakpoint():
     logging.disable(logging.NOTSET)
 
-class Configuration:
-    def __init__(self):
-        self._screen = pygame.display.set_mode(self.get_screen_size())
+def render_legend(legend):
+    """ Render the legend text, return the list of (text surface, rect) pairs """
+    green = (0, 255, 0)
+    font = pygame.font.SysFont('Courier New', 24)
+
+    # Render each line of the legend separately (font.render() does not support multiline text)
+    legendtext = []
+    y = 0
+    for line in legend.split('\n'):
+        text = font.render(line, True, green)
+        rect = text.get_rect().move(0, 80 + y)
+        legendtext.append((text, rect))
+        y += 24 # Font height
+
+    return legendtext
+
+class Frontend:
+    """
+    Screen rendering and hot keys handling, shared by the configurations and by the display-only frontends
+    of the UI process (see RemoteFrontend class)
+    """
+    def use_alternalte_font(self):
+        pass
+
+
+    def has_tape_recorder(self):
+        return False
+
+
+    def get_hotkey_commands(self):
+        """
+        Poll the emulator hot keys, and return the list of commands to be executed on the machine (see
+        execute_command())
+        """
+        keys = pygame.key.get_pressed()
+        alt_pressed = pygame.key.get_mods() & (pygame.KMOD_ALT | pygame.KMOD_META)
+
+        commands = []
+        if keys[pygame.K_ESCAPE]:
+            commands.append(("reset",))
+        if keys[pygame.K_m] and alt_pressed:
+            commands.append(("load_memory", open_pki()))
+        if self.has_tape_recorder() and keys[pygame.K_l] and alt_pressed:
+            commands.append(("load_tape", open_pki()))
+        if self.has_tape_recorder() and keys[pygame.K_s] and alt_pressed:
+            commands.append(("save_tape", save_pki()))
+        return commands
+
+
+    def _is_turbo_toggle(self, event):
+        # Alt-T toggles the turbo mode
+        alt_pressed = pygame.key.get_mods() & (pygame.KMOD_ALT | pygame.KMOD_META)
+        return event.type == pygame.KEYDOWN and event.key == pygame.K_t and alt_pressed
+
+
+    def _render(self):
+        # The frontend reports the changed screen areas, or None if the whole screen is redrawn
+        rects = self.update(pygame.display.get_surface())
+
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+
+
+    def _update_caption(self, cycles):
+        now = time.perf_counter()
+        if now - self._measure_time < SPEED_MEASURE_PERIOD:
+            return
+
+        mhz = (cycles - self._measure_cycles) / (now - self._measure_time) / 1000000
+        self._measure_time = now
+        self._measure_cycles = cycles
+
+        turbo = ", turbo" if self._turbo else ""
+        pygame.display.set_caption(f"UT-88 Emulator (FPS={self._clock.get_fps():.0f}, {mhz:.2f} MHz{turbo})")
+
+
+    def handle_event(self, event):
+        pass
+
+
+    def invalidate_screen(self):
+        pass
+
+
+class RemoteFrontend(Frontend):
+    """
+    The UI side of the emulation running in a separate process (see EmulationProcess class). The frontend
+    owns just the display and the keyboard devices of the configuration, not the machine. It renders the
+    screen data published by the emulation process, and publishes the keyboard state back.
+    """
+    SCREEN_SIZE = None
+
+    def __init__(self, turbo=False):
+        self._screen = pygame.display.set_mode(self.SCREEN_SIZE)
         self._clock = pygame.time.Clock()
+        self._turbo = turbo
+
+
+    def has_tape_recorder(self):
+        # Every configuration has a tape recorder, tape commands are executed by the emulation process
+        return True
+
+
+    def get_key_state(self):
+        """ Return the emulated keyboard state as bytes (see Configuration.set_key_state()) """
+        return b""
+
+
+    def set_screen_data(self, data):
+        """ Apply the screen data received from the worker process (see Configuration.get_screen_data()) """
+        pass
+
+
+    def run(self, process):
+        """
+        Run the UI for the emulation running in a separate process: pass the input to the emulation
+        process, and render the screen data it publishes.
+        """
+        shared = process.shared
+        self._measure_time = time.perf_counter()
+        self._measure_cycles = shared.get_cycles()
+
+        key_state = None
+        while True:
+            if not process.is_alive():
+                process.stop()
+                exit(1)
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    process.stop()
+                    exit()
+                if event.type == pygame.WINDOWEXPOSED:
+                    self.invalidate_screen()
+
+                if self._is_turbo_toggle(event):
+                    self._turbo = not self._turbo
+                    process.send_command("turbo", self._turbo)
+                    continue
+
+                self.handle_event(event)
+
+            for command in self.get_hotkey_commands():
+                process.send_command(*command)
+
+            state = self.get_key_state()
+            if state != key_state:
+                key_state = state
+                shared.write_key_state(state)
+
+            data = shared.read_screen_data()
+            if data is not None:
+                self.set_screen_data(data)
+
+            self._render()
+            self._clock.tick(60)
+            self._update_caption(shared.get_cycles())
+
+
+class BasicFrontend(RemoteFrontend):
+    SCREEN_SIZE = (450, 294)
+
+    def __init__(self, turbo=False):
+        RemoteFrontend.__init__(self, turbo)
+        self._lcd = LCD()
+        self._kbd = HexKeyboard()
+        self._legendtext = render_legend(BASIC_CONFIGURATION_LEGEND)
+
+
+    def update(self, screen):
+        screen.fill(pygame.Color('black'))
+        self._lcd.update_screen(screen)
+        self._kbd.update()
+
+        for text, rect in self._legendtext:
+            screen.blit(text, rect)
+
+
+    def get_key_state(self):
+        return bytes([self._kbd.get_state()])
+
+
+    def set_screen_data(self, data):
+        self._lcd.load_state(data)
+
+
+class VideoFrontend(RemoteFrontend):
+    SCREEN_SIZE = (64*12, 28*16)
+
+    def __init__(self, turbo=False):
+        RemoteFrontend.__init__(self, turbo)
+        self._display = Display()
+        self._keyboard = Keyboard()
+
+
+    def use_alternalte_font(self):
+        self._display.select_font(True)
+
+
+    def update(self, screen):
+        return self._display.update_screen(screen)
+
+
+    def invalidate_screen(self):
+        self._display.invalidate()
+
+
+    def handle_event(self, event):
+        self._keyboard.handle_key_event(event)
+
+
+    def get_key_state(self):
+        return self._keyboard.get_state()
+
+
+    def set_screen_data(self, data):
+        # Redraw only changed chars
+        current = self._display.save_state()[0x800:]
+        for offset, (old, new) in enumerate(zip(current, data)):
+            if old != new:
+                self._display.write_byte(0x800 + offset, new)
+
+
+class RK86Frontend(RemoteFrontend):
+    SCREEN_SIZE = (78*12, 30*16)
+
+    def __init__(self, turbo=False):
+        RemoteFrontend.__init__(self, turbo)
+
+        # The display reads the video memory over the DMA, so the video memory received from the emulation
+        # process is stored in a memory-only machine
+        self._machine = Machine()
+        self._machine.add_memory(MemoryDevice(RAM(), 0x0000, 0xffff))
+        self._dma = DMA(self._machine)
+        self._display = RK86Display(self._dma)
+        self._keyboard = RK86Keyboard()
+
+
+    def use_alternalte_font(self):
+        self._display.select_font(True)
+
+
+    def update(self, screen):
+        return self._display.update_screen(screen)
+
+
+    def invalidate_screen(self):
+        self._display.invalidate()
+
+
+    def handle_event(self, event):
+        self._keyboard.handle_key_event(event)
+
+
+    def get_key_state(self):
+        return self._keyboard.get_state()
+
+
+    def set_screen_data(self, data):
+        for name, chunk in unpack_chunks(data):
+            match name:
+                case "Display":
+                    self._display.load_state(chunk)
+                case "DMA":
+                    self._dma.load_state(chunk)
+                case "Video":
+                    start = self._dma.get_register_value(2, False)
+                    self._machine.write_memory_burst(start, bytes(chunk))
+
+
+class Configuration(Frontend):
+    FRONTEND = None     # Display-only frontend used when the emulation runs in a separate process
+
+    def __init__(self, headless=False):
+        # Headless configuration does not initialize the display, and does not render the screen
+        self._headless = headless
+        if not headless:
+            self._screen = pygame.display.set_mode(self.get_screen_size())
+            self._clock = pygame.time.Clock()
 
         self._machine = UT88Machine()
+        self._machine.enable_flat_memory()
         self._emulator = Emulator(self._machine)
+        self._emulator.enable_idle_detection()
 
         self._emulator.set_start_addr(self.get_start_address())
+        self._recorder = None
 
         self.create_memories()
         self.create_peripherals()
@@ -73,10 +379,18 @@ class Configuration:
         self._logger = NestedLogger()
         self._emulator.add_breakpoint(self.get_start_address(), lambda: self._logger.reset())
         self._suppressed_logs = []
+        self._trace_recorder = None
+        self._snapshot_file = None
+        self._screenshot_file = None
+        self._screen_recorder = None
+        self._turbo = False
 
         self.configure_logging()
         self.setup_special_breakpoints()
 
+        # Each frame the emulation is stopped to process input events, and refresh the screen
+        self._machine.schedule_event(FRAME_CYCLES, self._emulator.stop, FRAME_CYCLES)
+
 
     def create_memories(self):
         pass
@@ -98,37 +412,307 @@ class Configuration:
         return 0x0000
 
 
-    def use_alternalte_font(self):
+    def get_screen_size(self):
+        return self.FRONTEND.SCREEN_SIZE
+
+
+    def has_tape_recorder(self):
+        return self._recorder is not None
+
+
+    def set_snapshot_file(self, fname):
+        self._snapshot_file = fname
+
+
+    def set_screenshot_file(self, fname):
+        """ Save the screen image (e.g. PNG) to the file when the emulation ends """
+        self._screenshot_file = fname
+
+
+    def enable_screen_recording(self, fname):
+        """ Record the screen changes to the file (see ScreenRecorder class) until the emulation ends """
+        self.get_display()      # Fail early if the configuration does not support recording
+        self._screen_recorder = ScreenRecorder(fname)
+        period = self.get_cpu_frequency() // RECORDING_FPS
+        self._machine.schedule_event(period, self._record_frame, period)
+
+
+    def _record_frame(self):
+        self._screen_recorder.add_frame(*self.get_display().get_cells(), self._emulator._cpu._cycles)
+
+
+    def get_display(self):
+        """ Return the character display device that supports screenshots and recording """
+        raise ValueError(f"Screenshots and recording are not supported by the {type(self).__name__}")
+
+
+    def get_cpu_frequency(self):
+        return UT88_CPU_FREQUENCY
+
+
+    def enable_turbo(self, enabled=True):
+        """ Turbo mode runs the emulation as fast as the host can, instead of the real CPU speed """
+        self._turbo = enabled
+        self._sync_speed()
+
+
+    def _sync_speed(self):
+        # Start tracking the real CPU speed from the current moment
+        self._speed_base_time = time.perf_counter()
+        self._speed_base_cycles = self._emulator._cpu._cycles
+
+
+    def _run_frame(self):
+        """
+        Run the emulation for one host frame. In the normal mode the machine runs exactly as many cycles
+        as the real CPU would run by this moment (catching up if the previous frame was late). In the turbo
+        mode the machine runs as many cycles as possible within the TURBO_RENDER_PERIOD, so that the
+        screen is rendered only every few emulated frames.
+        """
+        emulator = self._emulator
+        cpu = emulator._cpu
+
+        # An idle machine just waits for input, and runs at the real speed even in the turbo mode, so that
+        # the emulated time (e.g. timer interrupts, cursor blinking) goes on
+        if self._turbo and not emulator.is_idle():
+            deadline = time.perf_counter() + TURBO_RENDER_PERIOD
+            while not emulator.is_idle() and time.perf_counter() < deadline:
+                emulator.run_until()
+
+            self._sync_speed()
+            return
+
+        frequency = self.get_cpu_frequency()
+        now = time.perf_counter()
+        target = self._speed_base_cycles + int((now - self._speed_base_time) * frequency)
+
+        # Do not try to catch up too much if the host can't keep up the real speed, just fall behind
+        max_lag = int(MAX_CATCH_UP_TIME * frequency)
+        if target - cpu._cycles > max_lag:
+            target = cpu._cycles + max_lag
+            self._speed_base_time = now
+            self._speed_base_cycles = target
+
+        while cpu._cycles < target:
+            emulator.run_until(max_cycles=target - cpu._cycles)
+
+
+    @property
+    def emulator(self):
+        return self._emulator
+
+
+    @property
+    def machine(self):
+        return self._machine
+
+
+    def boot(self, max_cycles):
+        """ Run the machine from the start address, until it is idle waiting for input """
+        self._emulator.reset()
+        while not self._emulator.is_idle() and self._emulator._cpu._cycles < max_cycles:
+            self._emulator.run_until()
+
+
+    def emulate_key_press(self, ch):
+        """ Press a key that corresponds to the char (newline is the Return key), or release keys if None """
         pass
 
-    def run(self):
+
+    def get_screen_text(self):
+        """ Return the displayed contents as text """
+        return ""
+
+
+    def set_key_state(self, data):
+        """ Apply the keyboard state received from the UI process (see RemoteFrontend.get_key_state()) """
+        pass
+
+
+    def get_screen_data(self):
+        """ Return the data, that is enough for the UI process to render the screen, as bytes """
+        return b""
+
+
+    def run_cycles(self, cycles):
+        """ Run the machine for the given number of cycles, regardless of frame stops """
+        stop_at = self._emulator._cpu._cycles + cycles
+        while self._emulator._cpu._cycles < stop_at:
+            self._emulator.run_until(max_cycles=stop_at - self._emulator._cpu._cycles)
+            self._machine.update()
+
+
+    def _run_until_idle(self, max_cycles):
+        stop_at = self._emulator._cpu._cycles + max_cycles
+        while not self._emulator.is_idle() and self._emulator._cpu._cycles < stop_at:
+            self._emulator.run_until()
+            self._machine.update()
+
+
+    def run_headless(self, text, max_cycles=HEADLESS_MAX_CYCLES):
+        """
+        Run the machine without a display: type the text using the emulated keyboard, waiting for the
+        machine to process every key, and then print the screen contents as text.
+        """
+        self._start()
+        self._run_until_idle(max_cycles)
+
+        for ch in text:
+            self.emulate_key_press(ch)
+            self._emulator.wake()
+            self.run_cycles(KEY_PRESS_CYCLES)
+
+            self.emulate_key_press(None)
+            self._emulator.wake()
+            self._run_until_idle(max_cycles)
+
+        self._stop()
+        print(self.get_screen_text())
+
+
+    def _start(self):
         self._emulator.reset()
 
+        # Continue from the previously saved machine state, if any
+        if self._snapshot_file and os.path.exists(self._snapshot_file):
+            with open(self._snapshot_file, "rb") as f:
+                self._emulator.load_state(f.read())
+
+        self._sync_speed()
+
+
+    def _save_snapshot(self):
+        if self._snapshot_file:
+            with open(self._snapshot_file, "wb") as f:
+                f.write(self._emulator.save_state())
+
+
+    def _stop(self):
+        # The emulation ends: save the machine state, the final screen, and finish the screen recording
+        self._save_snapshot()
+
+        if self._screenshot_file:
+            self.get_display().save_screenshot(self._screenshot_file)
+
+        if self._screen_recorder:
+            self._record_frame()
+            self._screen_recorder.close()
+
+
+    def execute_command(self, command, *params):
+        match command:
+            case "reset":
+                self._emulator.reset()
+            case "load_memory":
+                self._emulator.load_memory(params[0])
+                self._sync_speed()
+            case "load_tape":
+                self._recorder.load_from_file(params[0])
+            case "save_tape":
+                self._recorder.dump_to_file(params[0])
+            case "turbo":
+                self.enable_turbo(params[0])
+
+        self._emulator.wake()
+
+
+    def run(self):
+        self._start()
+        self._measure_time = self._speed_base_time
+        self._measure_cycles = self._speed_base_cycles
+
         while True:
-            for event in pygame.event.get():
+            events = pygame.event.get()
+            if not events and self._emulator.is_idle():
+                # The machine just waits for input, sleep until the next event instead of spinning
+                events = [pygame.event.wait(IDLE_WAIT_TIMEOUT)]
+
+            if events and events[0].type != pygame.NOEVENT:
+                self._emulator.wake()
+
+            for event in events:
+                if event.type == pygame.NOEVENT:
+                    continue
                 if event.type == pygame.QUIT:
+                    self._stop()
                     exit()
+                if event.type == pygame.WINDOWEXPOSED:
+                    self.invalidate_screen()
+
+                if self._is_turbo_toggle(event):
+                    self.enable_turbo(not self._turbo)
+                    continue
 
                 self.handle_event(event)
             
-            self._emulator.run(20000)
+            try:
+                self._run_frame()
+            except Exception:
+                if self._trace_recorder:
+                    self._trace_recorder.dump(100)
+                raise
+
+            for command in self.get_hotkey_commands():
+                self.execute_command(*command)
+
+            self._machine.update()
+            self._render()
+
+            if self._turbo:
+                self._clock.tick()
+            else:
+                self._clock.tick(60)
+            self._update_caption(self._emulator._cpu._cycles)
 
-            if pygame.key.get_pressed()[pygame.K_ESCAPE]:
-                self._emulator.reset()
 
-            alt_pressed = pygame.key.get_mods() & (pygame.KMOD_ALT | pygame.KMOD_META) 
-            if pygame.key.get_pressed()[pygame.K_m] and alt_pressed:
-                self._emulator.load_memory(open_pki())
+    def run_worker(self, shared, commands):
+        """
+        Run the emulation in a worker process (see EmulationProcess class). The UI process sends commands
+        over the commands queue, and shares the keyboard state. The worker publishes the screen data and
+        the CPU cycles counter in the shared memory.
+        """
+        self._start()
+
+        key_state = None
+        screen_data = None
+        while True:
+            frame_start = time.perf_counter()
+
+            while True:
+                try:
+                    command = commands.get_nowait()
+                except queue.Empty:
+                    break
+
+                if command[0] == "quit":
+                    self._stop()
+                    return
+                self.execute_command(*command)
+
+            state = shared.read_key_state()
+            if state is not None and state != key_state:
+                key_state = state
+                self.set_key_state(state)
+                self._emulator.wake()
+
+            try:
+                self._run_frame()
+            except Exception:
+                if self._trace_recorder:
+                    self._trace_recorder.dump(100)
+                raise
 
             self._machine.update()
 
-            surface = pygame.display.get_surface()
-            surface.fill(pygame.Color('black'))
-            self.update(surface)
+            data = self.get_screen_data()
+            if data != screen_data:
+                screen_data = data
+                shared.write_screen_data(data)
+            shared.set_cycles(self._emulator._cpu._cycles)
 
-            pygame.display.flip()
-            self._clock.tick(60)
-            pygame.display.set_caption(f"UT-88 Emulator (FPS={self._clock.get_fps()})")
+            # Leave the rest of the frame time to the host, unless running in the turbo mode
+            if not self._turbo or self._emulator.is_idle():
+                time.sleep(max(0, frame_start + FRAME_TIME - time.perf_counter()))
 
 
     def suppress_logging(self, startaddr, endaddr, msg):
@@ -156,6 +740,7 @@ class Configuration:
 
         if enable:
             logging.basicConfig(level=logging.DEBUG)
+            self._emulator._cpu.update_logging()
 
             for startaddr, endaddr, msg in self._suppressed_logs:
                 enter = LoggerEnterFunctor(self._logger, msg)
@@ -169,26 +754,22 @@ class Configuration:
         pass
 
 
-    def handle_event(self, event):
-        pass
+    def enable_block_translation(self):
+        self._emulator.enable_block_translation()
+
+
+    def enable_trace_recording(self, size):
+        self._trace_recorder = TraceRecorder(size)
+        self._emulator._cpu.set_trace_recorder(self._trace_recorder)
 
 
 class BasicConfiguration(Configuration):
-    def __init__(self):
-        Configuration.__init__(self)
- 
-        # Create legend text
-        green = (0, 255, 0)
-        font = pygame.font.SysFont('Courier New', 24)
+    FRONTEND = BasicFrontend
 
-        # Render each line of the legend separately (font.render() does not support multiline text)
-        self._legendtext = []
-        y = 0
-        for line in BASIC_CONFIGURATION_LEGEND.split('\n'):
-            text = font.render(line, True, green)
-            rect = text.get_rect().move(0, 80 + y)
-            self._legendtext.append((text, rect))
-            y += 24 # Font height
+    def __init__(self, headless=False):
+        Configuration.__init__(self, headless)
+ 
+        self._legendtext = [] if headless else render_legend(BASIC_CONFIGURATION_LEGEND)
 
 
     def create_memories(self):
@@ -198,12 +779,11 @@ class BasicConfiguration(Configuration):
 
 
     def create_peripherals(self):
-        self._lcd = LCD()
+        self._lcd = LCD(self._headless)
         self._machine.add_memory(MemoryDevice(self._lcd, 0x9000))
         self._kbd = HexKeyboard()
         self._machine.add_io(IODevice(self._kbd, 0xa0))
         self._timer = Timer(self._machine)
-        self._machine.add_other_device(self._timer)
         self._recorder = TapeRecorder()
         self._machine.add_io(IODevice(self._recorder, 0xa1))
 
@@ -223,18 +803,8 @@ class BasicConfiguration(Configuration):
         self.suppress_logging(0x09ec, 0x09f8, "MULT")
 
 
-    def get_screen_size(self):
-        return (450, 294)
-
-
     def update(self, screen):
-        alt_pressed = pygame.key.get_mods() & (pygame.KMOD_ALT | pygame.KMOD_META) 
-        if pygame.key.get_pressed()[pygame.K_l] and alt_pressed:
-            self._recorder.load_from_file(open_pki())
-        if pygame.key.get_pressed()[pygame.K_s] and alt_pressed:
-            self._recorder.dump_to_file(save_pki())
-
-
+        screen.fill(pygame.Color('black'))
         self._lcd.update_screen(screen)
         self._kbd.update()
 
@@ -242,9 +812,30 @@ class BasicConfiguration(Configuration):
             screen.blit(text, rect)
 
 
+    def emulate_key_press(self, ch):
+        if ch is None:
+            self._kbd.release_key()
+        else:
+            self._kbd.press_key(ch)
+
+
+    def get_screen_text(self):
+        return self._lcd.get_text()
+
+
+    def set_key_state(self, data):
+        self._kbd.set_state(data[0])
+
+
+    def get_screen_data(self):
+        return self._lcd.save_state()
+
+
 class VideoConfiguration(Configuration):
-    def __init__(self):
-        Configuration.__init__(self)
+    FRONTEND = VideoFrontend
+
+    def __init__(self, headless=False):
+        Configuration.__init__(self, headless)
 
 
     def create_memories(self):
@@ -263,9 +854,10 @@ class VideoConfiguration(Configuration):
         ppi.set_portA_handler(self._keyboard.write_columns)
         ppi.set_portB_handler(self._keyboard.read_rows)
         ppi.set_portC_handler(self._keyboard.read_mod_keys)
+        ppi.set_input_scanning_port(PPI_PORT_A)
         self._machine.add_io(IODevice(ppi, 0x04, invertaddr=True))
 
-        self._display = Display()
+        self._display = Display(self._headless)
         self._machine.add_memory(MemoryDevice(self._display, 0xe000))
 
 
@@ -273,6 +865,10 @@ class VideoConfiguration(Configuration):
         self._display.select_font(True)
 
 
+    def get_display(self):
+        return self._display
+
+
     def configure_logging(self):
         self.suppress_logging(0xf849, 0xf84c, "Initial memset")
         self.suppress_logging(0xfd92, 0xfd95, "Beep")
@@ -314,32 +910,46 @@ class VideoConfiguration(Configuration):
         return 0xf800
 
 
-    def get_screen_size(self):
-        return (64*12, 28*16)
-
-
     def update(self, screen):
-        alt_pressed = pygame.key.get_mods() & (pygame.KMOD_ALT | pygame.KMOD_META) 
-        if pygame.key.get_pressed()[pygame.K_l] and alt_pressed:
-            self._recorder.load_from_file(open_pki())
-        if pygame.key.get_pressed()[pygame.K_s] and alt_pressed:
-            self._recorder.dump_to_file(save_pki())
+        return self._display.update_screen(screen)
 
-        self._display.update_screen(screen)
+
+    def invalidate_screen(self):
+        self._display.invalidate()
 
 
     def handle_event(self, event):
         self._keyboard.handle_key_event(event)
 
 
+    def emulate_key_press(self, ch):
+        if ch == '\n':
+            self._keyboard.emulate_special_key_press(pygame.K_RETURN)
+        else:
+            self._keyboard.emulate_key_press(ch if ch is None else ch.upper())
+
+
+    def get_screen_text(self):
+        return self._display.get_text()
+
+
+    def set_key_state(self, data):
+        self._keyboard.set_state(data)
+
+
+    def get_screen_data(self):
+        # Char codes are enough, inversion attributes are stored in the char codes MSB as well
+        return self._display.save_state()[0x800:]
+
+
     def enable_bios_emulation(self):
         setup_bios_put_char_emulation(self._emulator)
 
 
 
 class QuasiDiskConfiguration(VideoConfiguration):
-    def __init__(self):
-        VideoConfiguration.__init__(self)
+    def __init__(self, headless=False):
+        VideoConfiguration.__init__(self, headless)
 
 
     def create_memories(self):
@@ -408,8 +1018,8 @@ class QuasiDiskConfiguration(VideoConfiguration):
 
 
 class UT88OSConfiguration(VideoConfiguration):
-    def __init__(self):
-        VideoConfiguration.__init__(self)
+    def __init__(self, headless=False):
+        VideoConfiguration.__init__(self, headless)
 
 
     def create_memories(self):
@@ -466,8 +1076,14 @@ class UT88OSConfiguration(VideoConfiguration):
 
 
 class Radio86RKConfiguration(Configuration):
-    def __init__(self):
-        Configuration.__init__(self)
+    FRONTEND = RK86Frontend
+
+    def __init__(self, headless=False):
+        Configuration.__init__(self, headless)
+
+
+    def get_cpu_frequency(self):
+        return RK86_CPU_FREQUENCY
 
 
     def create_memories(self):
@@ -488,6 +1104,7 @@ class Radio86RKConfiguration(Configuration):
 
         self._keyboard = RK86Keyboard()
         self._ppi.set_portA_handler(self._keyboard.set_columns)
+        self._ppi.set_input_scanning_port(PPI_PORT_A)
         self._ppi.set_portB_handler(self._keyboard.read_rows)
         self._ppi.set_portC_bit_handler(6, self._keyboard.read_ctrl_key)
         self._ppi.set_portC_bit_handler(5, self._keyboard.read_shift_key)
@@ -496,8 +1113,9 @@ class Radio86RKConfiguration(Configuration):
         self._dma = DMA(self._machine)
         self._machine.add_memory(MemoryDevice(self._dma, 0xe000))
 
-        self._display = RK86Display(self._dma)
+        self._display = RK86Display(self._dma, self._headless)
         self._machine.add_memory(MemoryDevice(self._display, 0xc000))
+        self._machine.schedule_event(CURSOR_BLINK_PERIOD, self._display.toggle_cursor, CURSOR_BLINK_PERIOD)
 
         self._recorder = TapeRecorder()
         # Intentionally not connecting tape recorder to port C here. Radio-86RK shares the same port
@@ -545,28 +1163,94 @@ class Radio86RKConfiguration(Configuration):
         return 0xf800
 
 
-    def get_screen_size(self):
-        return (78*12, 30*16)
-
-
     def use_alternalte_font(self):
         self._display.select_font(True)
 
 
+    def get_display(self):
+        return self._display
+
+
     def update(self, screen):
-        alt_pressed = pygame.key.get_mods() & (pygame.KMOD_ALT | pygame.KMOD_META) 
-        if pygame.key.get_pressed()[pygame.K_l] and alt_pressed:
-            self._recorder.load_from_file(open_pki())
-        if pygame.key.get_pressed()[pygame.K_s] and alt_pressed:
-            self._recorder.dump_to_file(save_pki())
+        return self._display.update_screen(screen)
+
 
-        self._display.update_screen(screen)
+    def invalidate_screen(self):
+        self._display.invalidate()
 
 
     def handle_event(self, event):
         self._keyboard.handle_key_event(event)
 
 
+    def emulate_key_press(self, ch):
+        if ch == '\n':
+            self._keyboard.emulate_special_key_press(pygame.K_RETURN)
+        else:
+            self._keyboard.emulate_key_press(ch if ch is None else ch.upper())
+
+
+    def get_screen_text(self):
+        return self._display.get_text()
+
+
+    def set_key_state(self, data):
+        self._keyboard.set_state(data)
+
+
+    def get_screen_data(self):
+        # The display renders the video memory fed by the DMA, so the DMA settings and the video memory
+        # are passed along with the display controller state
+        data = pack_chunk("Display", self._display.save_state()) + pack_chunk("DMA", self._dma.save_state())
+        if self._dma.is_channel_enabled(2):
+            start = self._dma.get_register_value(2, False)
+            count = self._dma.get_register_value(2, True)
+            data += pack_chunk("Video", bytes(self._machine.read_memory_burst(start, count)))
+        return data
+
+
+
+CONFIGURATIONS = {
+    "basic":        BasicConfiguration,
+    "video":        VideoConfiguration,
+    "ut88os":       UT88OSConfiguration,
+    "cpm64":        QuasiDiskConfiguration,
+    "radio86rk":    Radio86RKConfiguration,
+}
+
+
+def create_configuration(args, headless=False):
+    """ Create the configuration according to the command line arguments """
+    configuration = CONFIGURATIONS[args.configuration](headless)
+    
+    configuration.enable_logging(args.debug)
+    if args.emulate_bios:
+        configuration.enable_bios_emulation()
+    if args.alternate_font:
+        configuration.use_alternalte_font()
+    if args.jit:
+        configuration.enable_block_translation()
+    if args.trace:
+        configuration.enable_trace_recording(args.trace)
+    if args.snapshot:
+        configuration.set_snapshot_file(args.snapshot)
+    if args.screenshot:
+        configuration.set_screenshot_file(args.screenshot)
+    if args.record:
+        configuration.enable_screen_recording(args.record)
+    if args.turbo:
+        configuration.enable_turbo()
+
+    return configuration
+
+
+def create_frontend(args):
+    """ Create the display-only frontend for the configuration running in the emulation process """
+    frontend = CONFIGURATIONS[args.configuration].FRONTEND(args.turbo)
+    if args.alternate_font:
+        frontend.use_alternalte_font()
+
+    return frontend
 
 
 def main():
@@ -574,33 +1258,44 @@ def main():
                     prog='UT-88 Emulator',
                     description='UT-88 DIY i8080-based computer emulator')
     
-    parser.add_argument('configuration', choices=["basic", "video", "ut88os", "cpm64", "radio86rk"])
+    parser.add_argument('configuration', choices=CONFIGURATIONS.keys())
     parser.add_argument('-d', '--debug', help="enable CPU instructions logging", action='store_true')
     parser.add_argument('-b', '--emulate_bios', help="emulate BIOS and MonitorF I/O functions", action='store_true')
     parser.add_argument('-f', '--alternate_font', help="Use alternate font for the display", action='store_true')
+    parser.add_argument('-t', '--trace', help="record last TRACE executed instructions, and print them on error", type=int, default=0)
+    parser.add_argument('-s', '--snapshot', help="restore the machine state from the SNAPSHOT file on start, and save it on exit")
+    parser.add_argument('-j', '--jit', help="run translated code blocks instead of interpreting instructions (no CPU instructions logging)", action='store_true')
+    parser.add_argument('-T', '--turbo', help="run as fast as possible instead of the real CPU speed (Alt-T toggles in runtime)", action='store_true')
+    parser.add_argument('-P', '--process', help="run the emulation in a separate process, decoupled from the screen rendering", action='store_true')
+    parser.add_argument('--headless', help="run without a display: type the INPUT script (or stdin), and print the screen as text", action='store_true')
+    parser.add_argument('-i', '--input', help="input script file for the headless mode")
+    parser.add_argument('--screenshot', help="save the screen image to the SCREENSHOT file (e.g. PNG) on exit")
+    parser.add_argument('--record', help="record the screen changes to the RECORD file (see common/recording.py)")
     args = parser.parse_args()
 
-    pygame.init()
-
-    
-    if args.configuration == "basic":
-        configuration = BasicConfiguration()
-    if args.configuration == "video":
-        configuration = VideoConfiguration()
-    if args.configuration == "ut88os":
-        configuration = UT88OSConfiguration()
-    if args.configuration == "cpm64":
-        configuration = QuasiDiskConfiguration()
-    if args.configuration == "radio86rk":
-        configuration = Radio86RKConfiguration()
-    
-    configuration.enable_logging(args.debug)
-    if args.emulate_bios:
-        configuration.enable_bios_emulation()
-    if args.alternate_font:
-        configuration.use_alternalte_font()
-
-    configuration.run()
+    if args.process and not args.headless:
+        # Start the emulation process before the SDL initialization
+        process = EmulationProcess(args)
+        pygame.init()
+
+        # The UI process only renders the screen, the machine is emulated by the emulation process
+        create_frontend(args).run(process)
+        return
+
+    if not args.headless:
+        pygame.init()
+
+    configuration = create_configuration(args, args.headless)
+
+    if args.headless:
+        if args.input:
+            with open(args.input) as f:
+                text = f.read()
+        else:
+            text = sys.stdin.read()
+        configuration.run_headless(text)
+    else:
+        configuration.run()
 
 
 if __name__ == '__main__':
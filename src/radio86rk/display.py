@@ -3,7 +3,8 @@ import pygame
 
 from common.utils import *
 from common.interfaces import *
-from common.surface import DisplaySurface, CHAR_WIDTH, CHAR_HEIGHT
+from common.state import pack_optional, unpack_optional
+from common.surface import DisplaySurface, CHAR_WIDTH, CHAR_HEIGHT, chars_to_text
 
 resources_dir = os.path.join(os.path.dirname(__file__), "..", "..", "resources")
 
@@ -17,6 +18,9 @@ CRT_COMMAND_RESET_COUNTERS  =   7
 CRT_SREG                    =   1
 CRT_PREG                    =   0
 
+# Cursor blink half-period (0.5s at 1.78 MHz CPU clock)
+CURSOR_BLINK_PERIOD         =   888000
+
 class RK86Display:
     """
         This class implement a display module of Radio-86RK computer. The actual displaying and
@@ -25,16 +29,29 @@ class RK86Display:
         registers and commands exposed by the chip.
 
         The class supports blinking cursor (only full char blinking). Like in the chip, the cursor
-        location is handled by this class. 
+        location is handled by this class. The cursor is toggled by the toggle_cursor() function, which
+        is expected to be scheduled every CURSOR_BLINK_PERIOD CPU cycles.
+
+        The video memory is fed by the DMA on every frame, but only the changed cells are redrawn. The class
+        keeps the previously drawn frame (with the cursor applied), compares the new frame with it as a
+        whole, and then row by row. Only the changed span of each changed row is drawn, and blit on the
+        screen. Since the cursor is applied to the frame as a single cell, a cursor blink redraws just one
+        glyph.
+
+        A headless display does not render anything, the screen contents can be retrieved as text with
+        get_text() function.
+
+        Regardless of the headless mode, the screen contents can be rendered to an off-screen surface, and
+        exported as pixels (get_pixels()), or saved as an image (save_screenshot()).
 
         Note: refer to the Intel 8275 datasheet for command and parameters description
 
         Note: only modes sufficient for the Radio-86RK are implemented. 
     """
 
-    def __init__(self, dma):
+    def __init__(self, dma, headless=False):
         self._dma = dma
-        self._surface = DisplaySurface(f"{resources_dir}/rk86_font.bin", 78, 30)
+        self._surface = None if headless else DisplaySurface(f"{resources_dir}/rk86_font.bin", 78, 30)
 
         self._current_command = None
         self._current_parameter = None
@@ -53,17 +70,35 @@ class RK86Display:
         self._cursor_x = None
         self._cursor_y = None
         self._cursor_invert = False
-        self._cursor_timer = 0
 
         self._burst_space_code = None
         self._burst_count_code = None
 
+        # The frame drawn on the surface, None if the whole screen needs to be redrawn
+        self._frame = None
+        self._resize_pending = False    # The screen geometry was changed by load_state()
+
+        self._alternate_font = False
+        self._offscreen = None      # Off-screen surface for screenshots
+
+
     def get_size(self):
         return 2    # The Intel 8275 controller has just 2 registers
     
 
     def select_font(self, alternate = False):
-        self._surface.select_font(alternate)
+        self._alternate_font = alternate
+        if self._offscreen:
+            self._offscreen.select_font(alternate)
+
+        if self._surface:
+            self._surface.select_font(alternate)
+            self.invalidate()
+
+
+    def invalidate(self):
+        """ Redraw and blit the whole screen on the next update """
+        self._frame = None
 
 
     def _handle_command(self, value):
@@ -141,9 +176,15 @@ class RK86Display:
             raise IOError("Writing i8275 parameter for an unknown command")
     
 
-    def _handle_start_display_command(self):
+    def _resize_screen(self):
         screen_size = self._surface.set_size(self._screen_width, self._screen_height)
-        pygame.display.set_mode(screen_size)
+        self.invalidate()
+        return pygame.display.set_mode(screen_size)
+
+
+    def _handle_start_display_command(self):
+        if self._surface:
+            self._resize_screen()
 
 
     def _read_status_reg(self):
@@ -166,25 +207,147 @@ class RK86Display:
             raise MemoryError(f"Writing CRT register {offset} is not supported")
             
 
+    def _get_frame(self):
+        # Read the video memory over the DMA, and apply the cursor
+        width = self._screen_width
+        frame = bytearray(self._dma.dma_read(2)[0 : width * self._screen_height])
+
+        if self._cursor_invert and self._cursor_x is not None and self._cursor_y is not None:
+            if self._cursor_x < width and self._cursor_y * width + self._cursor_x < len(frame):
+                frame[self._cursor_y * width + self._cursor_x] |= 0x80
+
+        return bytes(frame)
+
+
     def update_screen(self, screen):
-        # Read the video memory over the DMA
-        data = self._dma.dma_read(2)
-
-        # Update chars on the surface
-        index = 0
-        for y in range(self._screen_height):
-            for x in range(self._screen_width):
-                ch = data[index]
-                if x == self._cursor_x and y==self._cursor_y and self._cursor_invert:
-                    ch |= 0x80
-                self._surface.update_char(x, y, ch)
-
-                index += 1
-
-        # Blit the surface to the screen
-        self._surface.blit(screen)
-
-        # Toggle cursor when time comes
-        if pygame.time.get_ticks() - self._cursor_timer > 500:
-            self._cursor_timer = pygame.time.get_ticks()
-            self._cursor_invert = not self._cursor_invert
+        """
+        Redraw the changed cells, and blit them on the screen. Returns the list of changed screen rects, or
+        None if the whole screen was redrawn.
+        """
+        # Apply the screen geometry restored by load_state()
+        if self._resize_pending and self._screen_width is not None and self._screen_height is not None:
+            self._resize_pending = False
+            screen = self._resize_screen()
+
+        # The screen stays blank until the video memory is fed by the DMA
+        if not self._dma.is_channel_enabled(2):
+            if self._frame == b"":
+                return []
+
+            self._frame = b""
+            screen.fill(pygame.Color('black'))
+            return None
+
+        frame = self._get_frame()
+        prev = self._frame
+        if frame == prev:
+            return []
+
+        self._frame = frame
+        width = self._screen_width
+        full_update = not prev or len(prev) != len(frame)
+        rects = []
+
+        for start in range(0, len(frame), width):
+            row = frame[start : start + width]
+
+            if full_update:
+                first, end = 0, len(row)
+            else:
+                prev_row = prev[start : start + width]
+                if row == prev_row:
+                    continue
+
+                # Limit the redraw to the span between the first and the last changed cells
+                changed = [x for x in range(len(row)) if row[x] != prev_row[x]]
+                first, end = changed[0], changed[-1] + 1
+
+            y = start // width
+            for x in range(first, end):
+                self._surface.update_char(x, y, row[x])
+
+            if not full_update:
+                rects.append(self._surface.blit_area(screen, first, y, end - first))
+
+        if full_update:
+            screen.fill(pygame.Color('black'))
+            self._surface.blit(screen)
+            return None
+
+        return rects
+
+
+    def get_text(self):
+        if self._screen_width is None or self._screen_height is None or not self._dma.is_channel_enabled(2):
+            return ""
+
+        return chars_to_text(self._dma.dma_read(2), self._screen_width, self._screen_height)
+
+
+    def get_cells(self):
+        """ Return visible char codes (with the cursor applied) row by row, and the screen width and height """
+        if self._screen_width is None or self._screen_height is None:
+            return b"", 0, 0
+
+        # The screen is blank until the video memory is fed by the DMA
+        if not self._dma.is_channel_enabled(2):
+            return b" " * (self._screen_width * self._screen_height), self._screen_width, self._screen_height
+
+        return self._get_frame(), self._screen_width, self._screen_height
+
+
+    def _render_offscreen(self):
+        cells, width, height = self.get_cells()
+        if not self._offscreen:
+            self._offscreen = DisplaySurface(f"{resources_dir}/rk86_font.bin", width, height)
+            self._offscreen.select_font(self._alternate_font)
+        elif self._offscreen.get_size() != (width, height):
+            self._offscreen.set_size(width, height)
+
+        self._offscreen.draw_cells(cells)
+        return self._offscreen
+
+
+    def get_pixels(self):
+        """ Return the screen as a NumPy RGB array of (height, width, 3) shape """
+        return self._render_offscreen().get_pixels()
+
+
+    def save_screenshot(self, filename):
+        self._render_offscreen().save_image(filename)
+
+
+    def toggle_cursor(self):
+        self._cursor_invert = not self._cursor_invert
+
+
+    def save_state(self):
+        return pack_optional(self._current_command, self._current_parameter, self._spaced_rows,
+                             self._screen_width, self._screen_height, self._vertical_retrace,
+                             self._underline_height, self._character_height, self._line_counter_mode,
+                             self._field_attr_mode, self._cursor_format, self._horizontal_retrace,
+                             self._cursor_x, self._cursor_y, self._cursor_invert,
+                             self._burst_space_code, self._burst_count_code)
+
+
+    def load_state(self, data):
+        size = (self._screen_width, self._screen_height)
+        (self._current_command, self._current_parameter, spaced_rows,
+         self._screen_width, self._screen_height, self._vertical_retrace,
+         self._underline_height, self._character_height, line_counter_mode,
+         field_attr_mode, self._cursor_format, self._horizontal_retrace,
+         self._cursor_x, self._cursor_y, cursor_invert,
+         self._burst_space_code, self._burst_count_code) = unpack_optional(data)
+
+        # Flags are stored as integers, but None means the parameter was not set yet
+        self._spaced_rows = None if spaced_rows is None else bool(spaced_rows)
+        self._line_counter_mode = None if line_counter_mode is None else bool(line_counter_mode)
+        self._field_attr_mode = None if field_attr_mode is None else bool(field_attr_mode)
+        self._cursor_invert = bool(cursor_invert)
+
+        # The window is resized on the next update_screen() call. Redraw only if the geometry has changed,
+        # otherwise the drawn frame is still valid (the screen data received from the emulation process is
+        # loaded on every change)
+        if size != (self._screen_width, self._screen_height):
+            self._resize_pending = True
+            self.invalidate()
@@ -217,3 +217,30 @@ class RK86Keyboard():
             
         if event.type == pygame.KEYUP:
             self._pressed_key = (0xff, 0xff, False, False)
+
+
+    def emulate_key_press(self, ch):
+        if ch == None:
+            self._pressed_key = (0xff, 0xff, False, False)
+
+        if ch in self._key_map:
+            self._pressed_key = self._key_map[ch]
+
+
+    def emulate_special_key_press(self, key):
+        if key == None:
+            self._pressed_key = (0xff, 0xff, False, False)
+
+        if key in self._key_codes_map:
+            self._pressed_key = self._key_codes_map[key]
+
+
+    def get_state(self):
+        """ Return the pressed key state as bytes (e.g. to pass it to another process) """
+        port_a, port_b, ctrl, shift = self._pressed_key
+        return bytes([port_a, port_b, ctrl, shift])
+
+
+    def set_state(self, data):
+        """ Restore the pressed key state previously returned by get_state() """
+        self._pressed_key = (data[0], data[1], bool(data[2]), bool(data[3]))
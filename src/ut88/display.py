@@ -3,10 +3,13 @@ import pygame
 
 from common.utils import *
 from common.ram import *
-from common.surface import DisplaySurface
+from common.surface import DisplaySurface, chars_to_text
 
 resources_dir = os.path.join(os.path.dirname(__file__), "..", "..", "resources")
 
+DISPLAY_WIDTH = 64
+DISPLAY_HEIGHT = 28
+
 class Display(RAM):
     """
     UT-88 64x28 character display
@@ -49,8 +52,15 @@ class Display(RAM):
 
     Emulation notes:
     In order to decrease amount of calculation during each frame, the Display class detects memory
-    write operations, and blit new char on the screen only when data is changing. On a regular display
-    update precalculated image is simply blit on the screen.
+    write operations, and marks the changed char cells in a dirty cells map. On the display update the
+    dirty cells are drawn once (regardless of the number of writes to the cell during the frame), and
+    only the changed screen areas are blit on the screen, and reported to the caller as a list of rects
+    (so that only these areas of the window are updated). A headless display does not render anything,
+    and keeps only the video memory, which can be converted to text with get_text() function.
+
+    Regardless of the headless mode, the display contents can be rendered to an off-screen surface, and
+    exported as pixels (get_pixels()), or saved as an image (save_screenshot()). The off-screen surface
+    is created on the first use, and redraws only the chars changed since the previous export.
 
     MemoryDevice interface notes:
     According to MemoryDevice guidelines, the Display class does not operate with absolute addresses. Instead, 
@@ -59,33 +69,117 @@ class Display(RAM):
     2k cells (0x800 bytes) represent char attributes array, and second 2k represent char codes array.
     """
 
-    def __init__(self):
+    def __init__(self, headless=False):
         RAM.__init__(self, 0x1000)  # 0x800 bytes for chars, 0x800 bytes for inversion attribute
-        self._surface = DisplaySurface(f"{resources_dir}/font.bin", 64, 28)
+        self._surface = None if headless else DisplaySurface(f"{resources_dir}/font.bin", DISPLAY_WIDTH, DISPLAY_HEIGHT)
+
+        # Cells changed since the previous screen update. The whole screen is blit on the first update.
+        self._dirty = bytearray(DISPLAY_WIDTH * DISPLAY_HEIGHT)
+        self._full_update = True
+
+        self._alternate_font = False
+        self._offscreen = None      # Off-screen surface for screenshots
 
     
     def select_font(self, alternate = False):
-        self._surface.select_font(alternate)
+        self._alternate_font = alternate
+        if self._offscreen:
+            self._offscreen.select_font(alternate)
+
+        if self._surface:
+            self._surface.select_font(alternate)
+            self.invalidate()
+
+
+    def invalidate(self):
+        """ Redraw all the chars, and blit the whole screen on the next update """
+        self._dirty[:] = b"\x01" * len(self._dirty)
+        self._full_update = True
 
 
     def write_byte(self, offset, value):
+        char_offset = 0x0800 + (offset & 0x07ff)
+        prev = RAM.read_byte(self, char_offset)
+
         # Writing to 0xe000-0xe7ff is treated as changing symbol attribute. Take only MSB of the
         # value, and apply the inversion bit to the corresponding character in 0xe800-0xefff range
         if offset < 0x0800:
-            char_offset = offset + 0x0800
-            value = set_bit_value(RAM.read_byte(self, char_offset), 7, is_bit_set(value, 7))
+            value = set_bit_value(prev, 7, is_bit_set(value, 7))
             RAM.write_byte(self, char_offset, value)
 
         # Both attribute and char values updated as usual
         RAM.write_byte(self, offset, value)
 
-        # Then update corresponding char on the screen
+        # Mark the visible char as changed, it will be drawn on the next screen update
         offset &= 0x07ff
-        ch = RAM.read_byte(self, 0x0800 + offset)
-        col = offset % 0x40
-        row = offset // 0x40
-        self._surface.update_char(col, row, ch)
+        if self._surface and offset < len(self._dirty) and RAM.read_byte(self, char_offset) != prev:
+            self._dirty[offset] = 1
+
+
+    def write_burst(self, offset, data):
+        # Go through the regular write, so that attributes and the screen are updated as well
+        for i, value in enumerate(data):
+            self.write_byte(offset + i, value)
 
 
     def update_screen(self, screen):
-        self._surface.blit(screen)
+        """
+        Draw the chars changed since the previous update, and blit them on the screen. Returns the list of
+        changed screen rects, or None if the whole screen was blit.
+        """
+        rects = []
+        dirty = self._dirty
+        offset = dirty.find(1)
+        while offset >= 0:
+            # Consecutive changed chars in a row are blit as a single rect
+            row, col = divmod(offset, DISPLAY_WIDTH)
+            end = offset
+            while end < (row + 1) * DISPLAY_WIDTH and dirty[end]:
+                self._surface.update_char(end - row * DISPLAY_WIDTH, row, self._ram[0x0800 + end])
+                end += 1
+
+            dirty[offset:end] = bytes(end - offset)
+            rects.append(self._surface.blit_area(screen, col, row, end - offset))
+            offset = dirty.find(1, end)
+
+        if self._full_update:
+            self._full_update = False
+            self._surface.blit(screen)
+            return None
+
+        return rects
+
+
+    def get_text(self):
+        return chars_to_text(self._ram[0x0800:], 64, 28)
+
+
+    def get_cells(self):
+        """ Return visible char codes (with the inversion bit) row by row, and the screen width and height """
+        return bytes(self._ram[0x0800 : 0x0800 + DISPLAY_WIDTH * DISPLAY_HEIGHT]), DISPLAY_WIDTH, DISPLAY_HEIGHT
+
+
+    def _render_offscreen(self):
+        if not self._offscreen:
+            self._offscreen = DisplaySurface(f"{resources_dir}/font.bin", DISPLAY_WIDTH, DISPLAY_HEIGHT)
+            self._offscreen.select_font(self._alternate_font)
+
+        self._offscreen.draw_cells(self.get_cells()[0])
+        return self._offscreen
+
+
+    def get_pixels(self):
+        """ Return the screen as a NumPy RGB array of (height, width, 3) shape """
+        return self._render_offscreen().get_pixels()
+
+
+    def save_screenshot(self, filename):
+        self._render_offscreen().save_image(filename)
+
+
+    def load_state(self, data):
+        RAM.load_state(self, data)
+
+        # Redraw all the chars according to the restored video memory
+        if self._surface:
+            self.invalidate()
@@ -51,6 +51,10 @@ class HexKeyboard:
         return self._pressed_key
 
 
+    def set_state(self, value):
+        self._pressed_key = value
+
+
     def read_byte(self, offset):
         return self._pressed_key
 
@@ -325,3 +325,13 @@ class Keyboard:
             self._pressed_key = self._ctrl_codes_map[ch]
         else:
             self._pressed_key = (0xff, 0xff, 0xff)
+
+
+    def get_state(self):
+        """ Return the pressed key state as bytes (e.g. to pass it to another process) """
+        return bytes(self._pressed_key)
+
+
+    def set_state(self, data):
+        """ Restore the pressed key state previously returned by get_state() """
+        self._pressed_key = tuple(data)
@@ -1,4 +1,5 @@
 import os
+import copy
 import pygame
 
 from common.utils import *
@@ -15,14 +16,28 @@ class LCD:
         (stored at 0x9000). 
         
         Note: MemoryDevice class is responsible for binding LCD to the actual memory
-        address, while this class maintains just 3 bytes of data.
+        address, while this class maintains just 3 bytes of data. A headless LCD does not
+        render digit images, the displayed value is available with get_text() function.
     """
-    def __init__(self):
+    def __init__(self, headless=False):
         self._ram = [0] * 3
 
-        self._images = [pygame.image.load(f"{resources_dir}/digit_{d:1X}.png") for d in range(0x10)]
+        if headless:
+            self._images = None
+            self._display = None
+        else:
+            self._images = [pygame.image.load(f"{resources_dir}/digit_{d:1X}.png") for d in range(0x10)]
+            self._display = pygame.Surface((75*6, 94))
 
-        self._display = pygame.Surface((75*6, 94))
+
+    def __deepcopy__(self, memo):
+        # Digit images are shared between copies
+        lcd = copy.copy(self)
+        lcd._ram = list(self._ram)
+        if self._display:
+            lcd._display = self._display.copy()
+        memo[id(self)] = lcd
+        return lcd
 
 
     def get_size(self):
@@ -38,6 +53,9 @@ class LCD:
 
 
     def _update_screen_buffer(self):
+        if not self._display:
+            return
+
         x = self._draw_byte(self._display, self._ram[2], 0)
         x = self._draw_byte(self._display, self._ram[1], x)
         self._draw_byte(self._display, self._ram[0], x)
@@ -47,6 +65,10 @@ class LCD:
         screen.blit(self._display, (0, 0))
 
 
+    def get_text(self):
+        return f"{self._ram[2]:02X}{self._ram[1]:02X} {self._ram[0]:02X}"
+
+
     def _check_value(self, value, max):
         if value < 0 or value > max:
             raise ValueError(f"Value {value:x} is out of range")
@@ -67,3 +89,12 @@ class LCD:
         self._ram[offset + 1] = value >> 8
 
         self._update_screen_buffer()
+
+
+    def save_state(self):
+        return bytes(self._ram)
+
+
+    def load_state(self, data):
+        self._ram = list(data)
+        self._update_screen_buffer()
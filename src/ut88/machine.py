@@ -1,11 +1,15 @@
 from common.machine import Machine
 
+QUASI_DISK_FLUSH_PERIOD = 2000000   # Flush quasi disk changes to the file every second (at 2 MHz)
+
 class UT88Machine(Machine):
     """
         UT88Machine is a specialized Machine instance, that may connect quasi_disk to stack read/write
         lines. The selection between quasi disk and regular memory is done using special configuration
         register at port 0x40. Value 0xff written to port 0x40 enables regular RAM, values other than 
         0xff enable quasi disk operations.
+
+        Quasi disk changes are periodically flushed to the disk file using the machine scheduler.
     """
     def __init__(self):
         Machine.__init__(self)
@@ -13,19 +17,40 @@ class UT88Machine(Machine):
         self._quasi_disk_enabled = False
     
     def set_quasi_disk(self, disk):
+        if self._quasi_disk:
+            self._scheduler.remove_event(self._quasi_disk.flush)
         self._quasi_disk = disk
+        self.schedule_event(QUASI_DISK_FLUSH_PERIOD, disk.flush, QUASI_DISK_FLUSH_PERIOD)
+
+    def _get_stateful_devices(self):
+        devices = Machine._get_stateful_devices(self)
+        if self._quasi_disk:
+            devices.append(self._quasi_disk)
+        return devices
+
+    def load_state(self, data):
+        Machine.load_state(self, data)
+
+        # Quasi disk is enabled whenever a quasi disk page is selected
+        self._quasi_disk_enabled = self._quasi_disk is not None and self._quasi_disk._page is not None
+        self.set_stack_direct_access(not self._quasi_disk_enabled)
 
     def write_io(self, addr, value):
         # Non-ff values in the configuration port will enable quasi disk access on stack reads/write operations
         if addr == 0x40:
+            self._write_count += 1
             self._quasi_disk_enabled = (value != 0xff)
             self._quasi_disk.select_page(value)
+
+            # Stack operations shall not bypass the machine while the quasi disk is enabled
+            self.set_stack_direct_access(not self._quasi_disk_enabled)
         else:
             Machine.write_io(self, addr, value)
 
     def write_stack(self, addr, value):
         if self._quasi_disk_enabled:
             self._quasi_disk.write_stack(addr, value)
+            self._write_count += 1
         else:
             Machine.write_stack(self, addr, value)
 
@@ -34,9 +59,3 @@ class UT88Machine(Machine):
             return self._quasi_disk.read_stack(addr)
         else:
             return Machine.read_stack(self, addr)
-
-    def update(self):
-        Machine.update(self)
-
-        if self._quasi_disk:
-            self._quasi_disk.update()
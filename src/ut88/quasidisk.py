@@ -1,6 +1,8 @@
 import os
+import copy
 
 from common.utils import *
+from common.state import pack_optional, unpack_optional
 
 class QuasiDisk:
     """
@@ -17,8 +19,15 @@ class QuasiDisk:
         dumps the content of the RAM disk to a file, and restore the content on startup. There is a possibility
         to flush the RAM contents to file in runtime, as well as reloading the data from file. This is used
         for testing.
+
+        The data is stored in 1k chunks. When the quasi disk is copied (e.g. when the emulator is forked),
+        the chunks are shared between the copies, and a chunk is copied only on the first write to it
+        (copy-on-write). Shared chunks are stored as immutable bytes objects. A copy of the quasi disk is
+        not backed by the file.
     """
 
+    CHUNK_SIZE = 1024
+
 
     def __init__(self, fname):
         self._page = None
@@ -45,13 +54,27 @@ class QuasiDisk:
                 raise IOError(f"Incorrect quasi disk page selection: {value:02x}")
 
 
+    def _write_byte(self, offset, value):
+        index = offset // self.CHUNK_SIZE
+        chunk = self._chunks[index]
+        if type(chunk) is bytes:
+            # The chunk is shared with another copy of the quasi disk, make a private copy
+            chunk = bytearray(chunk)
+            self._chunks[index] = chunk
+        chunk[offset % self.CHUNK_SIZE] = value
+
+
+    def _read_byte(self, offset):
+        return self._chunks[offset // self.CHUNK_SIZE][offset % self.CHUNK_SIZE]
+
+
     def write_stack(self, addr, value):
         if self._page == None:
             raise IOError(f"Quasi disk page was not selected")
 
         page_offset = 64*1024*self._page
-        self._data[page_offset + addr + 1] = (value >> 8) & 0xff
-        self._data[page_offset + addr] = value & 0xff
+        self._write_byte(page_offset + addr + 1, (value >> 8) & 0xff)
+        self._write_byte(page_offset + addr, value & 0xff)
         
         self._changed = True
 
@@ -61,29 +84,49 @@ class QuasiDisk:
             raise IOError(f"Quasi disk page was not selected")
         
         page_offset = 64*1024*self._page
-        return (self._data[page_offset + addr + 1] << 8) | self._data[page_offset + addr]
+        return (self._read_byte(page_offset + addr + 1) << 8) | self._read_byte(page_offset + addr)
 
 
     def reload(self):
         self._changed = False
 
-        if os.path.exists(self._fname):
+        if self._fname and os.path.exists(self._fname):
             with open(self._fname, "rb") as f:
-                self._data = bytearray(f.read())
-                assert len(self._data) == 256*1024
+                data = f.read()
+                assert len(data) == 256*1024
         else:
-            self._data = bytearray(256*1024)
+            data = bytes(256*1024)
+
+        size = self.CHUNK_SIZE
+        self._chunks = [bytearray(data[offset : offset + size]) for offset in range(0, len(data), size)]
 
     
     def flush(self):
-        if not self._changed:
+        if not self._changed or not self._fname:
             return
         
         with open(self._fname, "w+b") as f:
-            f.write(self._data)
+            f.write(b"".join(self._chunks))
         
         self._changed = False
 
 
-    def update(self):
-        self.flush()
\ No newline at end of file
+    def __deepcopy__(self, memo):
+        # Freeze the chunks, so that both copies make a private copy of a chunk on write
+        self._chunks = [bytes(chunk) if type(chunk) is bytearray else chunk for chunk in self._chunks]
+
+        disk = copy.copy(self)
+        disk._chunks = list(self._chunks)
+        disk._fname = None
+        disk._changed = False
+        memo[id(self)] = disk
+        return disk
+
+
+    def save_state(self):
+        # Quasi disk data is backed by the disk file, only the page selection is a part of the machine state
+        return pack_optional(self._page)
+
+
+    def load_state(self, data):
+        self._page, = unpack_optional(data)
@@ -1,4 +1,4 @@
-import time
+TIMER_PERIOD = 2000000      # CPU cycles per second at 2 MHz
 
 class Timer:
     """
@@ -6,16 +6,14 @@ class Timer:
         
         UT-88 basic configuration employs a timer/counter that generates an interrupt request every second.
         The Monitor 0 handles this interrupt to track current time.
+
+        The timer period is measured in CPU cycles using the machine scheduler, so that the emulated time
+        runs at the emulated CPU speed.
     """
 
     def __init__(self, machine):
         self._machine = machine
-        self._last_update = int(time.time())
+        self._machine.schedule_event(TIMER_PERIOD, self._tick, TIMER_PERIOD)
     
-    def update(self):
-        cur_time = int(time.time())
-        if self._last_update == cur_time:
-            return
-        
-        self._last_update = cur_time
-        self._machine.schedule_interrupt()
\ No newline at end of file
+    def _tick(self):
+        self._machine.schedule_interrupt()
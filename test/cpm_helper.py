@@ -15,19 +15,27 @@ from ut88.machine import UT88Machine
 # This is a helper class that sets up the machine emulator, configures it for running a
 # CP/M functions, feeds function arguments, and retrieves the result
 class CPM(EmulatedInstanceWithKeyboard):
+    _snapshot = None    # Machine state right after loading the binaries, shared between tests
+
     def __init__(self):
         EmulatedInstanceWithKeyboard.__init__(self)
 
         self._machine.add_memory(MemoryDevice(RAM(), 0x0000, 0xf7ff))
         self._machine.add_memory(MemoryDevice(ROM(f"{resources_dir}/monitorF.bin"), 0xf800))
 
-        self._emulator.load_memory(f"{tapes_dir}/cpm64_bdos.rku")
-        self._emulator.load_memory(f"{tapes_dir}/cpm64_bios.rku")
-        self._emulator.load_memory(f"{tapes_dir}/cpm64_monitorf_addon.rku")
+        # Loading tapes is slow, so the loaded machine state is restored from a snapshot for subsequent tests
+        if CPM._snapshot:
+            self._emulator.load_state(CPM._snapshot)
+        else:
+            self._emulator.load_memory(f"{tapes_dir}/cpm64_bdos.rku")
+            self._emulator.load_memory(f"{tapes_dir}/cpm64_bios.rku")
+            self._emulator.load_memory(f"{tapes_dir}/cpm64_monitorf_addon.rku")
+
+            # Since we do not run MonitorF initialization routine, let's just initialize needed variables,
+            # and particularly set cursor to the top-left corner
+            self.set_word(0xf7b2, 0xe800)
 
-        # Since we do not run MonitorF initialization routine, let's just initialize needed variables,
-        # and particularly set cursor to the top-left corner
-        self.set_word(0xf7b2, 0xe800)
+            CPM._snapshot = self._emulator.save_state()
 
         # Each key press require 127 cycles of the keyboard scanning, until the key is considered pressed.
         # Skip this, 1 scan is enough. Key repeat function is also disabled, as not needed for tests
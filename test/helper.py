@@ -24,6 +24,7 @@ class MockIO:
 class EmulatedInstance:
     def __init__(self):
         self._machine = self._create_machine()
+        self._machine.enable_flat_memory()
         self._emulator = self._create_emulator()
 
         self._emulator._cpu.enable_registers_logging(True)
@@ -76,8 +77,7 @@ class EmulatedInstance:
 
         # Run the requested function, until it returns or in other way gets to the end address
         # Set the counter limit to avoid infinite loop
-        while self._emulator._cpu.pc != endaddr and self._emulator._cpu._cycles < 10000000:
-            self._emulator.step()
+        self._emulator.run_until(pc=endaddr, max_cycles=10000000)
 
         # Validate that the code really reached the end, and not stopped by a cycles limit
         assert self._emulator._cpu.pc == endaddr
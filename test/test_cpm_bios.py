@@ -151,7 +151,7 @@ def test_bios_write_sector(cpm, tmp_path):
     cpm.run_function(BIOS_FUNC_WRITE_SECTOR)
 
     # Flush the data to the host
-    disk.update()
+    disk.flush()
 
     # Check written data
     data = f.read_bytes()
@@ -2,23 +2,25 @@
 # py.test -rfeEsxXwa --verbose --showlocals
 
 import pytest
+import logging
 import sys
 from unittest.mock import MagicMock
 
 sys.path.append('../src')
 
 from common.machine import Machine
-from common.cpu import CPU
+from common.cpu import CPU, SZP_FLAGS
 from common.rom import ROM
 from common.ram import RAM
 from common.interfaces import MemoryDevice, IODevice
 from common.utils import *
 from helper import MockIO
 
-@pytest.fixture
-def cpu():
+@pytest.fixture(params=[False, True], ids=["machine", "flat"])
+def cpu(request):
     machine = Machine()
     machine.add_memory(MemoryDevice(RAM(), 0x0000, 0xffff))
+    machine.enable_flat_memory(request.param)
     return CPU(machine) 
 
 def test_reset_values(cpu):
@@ -1544,6 +1546,22 @@ def test_daa(cpu):
     assert cpu._zero == False
     assert cpu._parity == False
 
+def test_daa_no_adjustment(cpu):
+    cpu._machine.write_memory_byte(0x0000, 0x27)    # Instruction Opcode
+    cpu.a = 0x42
+    cpu.step()
+    assert cpu.a == 0x42
+    assert cpu._half_carry == False
+    assert cpu._carry == False
+    assert cpu._parity == True
+
+def test_szp_flags_table():
+    for value in range(0x100):
+        sign, zero, parity = SZP_FLAGS[value]
+        assert sign == ((value & 0x80) != 0)
+        assert zero == (value == 0)
+        assert parity == (bin(value).count("1") % 2 == 0)
+
 def test_out(cpu):
     mock = MockIO()
     mock.write_byte = MagicMock()
@@ -1564,4 +1582,29 @@ def test_in(cpu):
     cpu._machine.write_memory_byte(0x0000, 0xdb)    # Instruction Opcode
     cpu._machine.write_memory_byte(0x0001, 0x42)    # IO addr
     cpu.step()
-    assert cpu.a == 0x55
\ No newline at end of file
+    assert cpu.a == 0x55
+
+def test_logging_disabled(cpu):
+    assert cpu._tracing == False
+    assert cpu._instructions is cpu._lean_instructions
+
+def test_logging_enabled(cpu, caplog):
+    caplog.set_level(logging.DEBUG, logger='cpu')
+    cpu.enable_registers_logging(True)
+    assert cpu._instructions is cpu._traced_instructions
+
+    cpu._machine.write_memory_byte(0x0000, 0x3e)    # Instruction Opcode
+    cpu._machine.write_memory_byte(0x0001, 0x42)    # Value
+    cpu._machine.write_memory_byte(0x0002, 0x21)    # Instruction Opcode
+    cpu._machine.write_memory_word(0x0003, 0xbeef)  # Value
+    cpu.step()
+    cpu.step()
+
+    assert caplog.messages[0].startswith(" 0000  3e 42      MVI A, 42")
+    assert caplog.messages[0].endswith("A=42 BC=0000 DE=0000 HL=0000 SP=0000 ------")
+    assert caplog.messages[1].startswith(" 0002  21 ef be   LXI HL, beef")
+    assert caplog.messages[1].endswith("HL=beef SP=0000 ------")
+
+    caplog.set_level(logging.INFO, logger='cpu')
+    cpu.update_logging()
+    assert cpu._instructions is cpu._lean_instructions
@@ -0,0 +1,92 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+
+sys.path.append('../src')
+
+import pygame
+
+import common.surface as surface
+from ut88.display import Display
+from common.interfaces import MemoryDevice
+from common.utils import *
+
+# Char codes are located at 0xe800, inversion attributes at 0xe000
+DISPLAY_PTR = 0xe000
+CHARS_PTR = 0xe800
+
+@pytest.fixture
+def display():
+    return MemoryDevice(Display(headless=True), DISPLAY_PTR)
+
+@pytest.fixture
+def screen_display(tmp_path, monkeypatch):
+    monkeypatch.setattr(surface, "FONT_CACHE_DIR", str(tmp_path))
+    return MemoryDevice(Display(), DISPLAY_PTR)
+
+@pytest.fixture
+def screen():
+    return pygame.Surface((64*12, 28*16))
+
+def test_headless_empty(display):
+    assert display._device.get_text() == "\n" * 27
+
+def test_headless_text(display):
+    for i, ch in enumerate(b"HELLO"):
+        display.write_byte(CHARS_PTR + 0x40 + 2 + i, ch)
+    display.write_byte(CHARS_PTR + 0x40 + 8, 0x60)     # Cyrillic char
+    display.write_byte(CHARS_PTR + 0x40 + 9, 0xc1)     # Inverted char (cursor)
+    assert display._device.get_text().split("\n")[1] == "  HELLO ЮA"
+
+def test_headless_attribute(display):
+    display.write_byte(CHARS_PTR, 0x41)
+    display.write_byte(DISPLAY_PTR, 0x80)              # Inversion attribute keeps the char code
+    assert display._device.get_text().split("\n")[0] == "A"
+    assert display.read_byte(CHARS_PTR) == 0xc1
+
+def test_first_update_is_full(screen_display, screen):
+    assert screen_display._device.update_screen(screen) is None
+    assert screen_display._device.update_screen(screen) == []
+
+def test_update_changed_cells(screen_display, screen):
+    screen_display._device.update_screen(screen)
+
+    for i, ch in enumerate(b"HELLO"):
+        screen_display.write_byte(CHARS_PTR + 0x40 + 2 + i, ch)
+    screen_display.write_byte(CHARS_PTR + 0x80, 0x41)
+    screen_display.write_byte(CHARS_PTR + 0x80, 0x42)   # Repeated writes to a cell are drawn once
+
+    rects = screen_display._device.update_screen(screen)
+    assert rects == [pygame.Rect(2*12, 1*16, 5*12, 16), pygame.Rect(0, 2*16, 12, 16)]
+    assert screen_display._device.update_screen(screen) == []
+
+def test_update_unchanged_cell(screen_display, screen):
+    screen_display.write_byte(CHARS_PTR, 0x41)
+    screen_display._device.update_screen(screen)
+
+    screen_display.write_byte(CHARS_PTR, 0x41)          # Same value
+    screen_display.write_byte(DISPLAY_PTR + 1, 0x00)    # Attribute is not changed
+    assert screen_display._device.update_screen(screen) == []
+
+def test_update_attribute(screen_display, screen):
+    screen_display._device.update_screen(screen)
+
+    screen_display.write_byte(DISPLAY_PTR + 0x43, 0x80)
+    assert screen_display._device.update_screen(screen) == [pygame.Rect(3*12, 1*16, 12, 16)]
+
+def test_update_invalidate(screen_display, screen):
+    screen_display._device.update_screen(screen)
+
+    screen_display._device.invalidate()
+    assert screen_display._device.update_screen(screen) is None
+
+def test_headless_screenshot(display, tmp_path, monkeypatch):
+    monkeypatch.setattr(surface, "FONT_CACHE_DIR", str(tmp_path))
+    display.write_byte(CHARS_PTR, 0x41)
+    assert display._device.get_cells()[0][0:2] == b"\x41\x00"
+
+    display._device.save_screenshot(str(tmp_path / "screen.png"))
+    image = pygame.image.load(str(tmp_path / "screen.png"))
+    assert image.get_size() == (64*12, 28*16)
@@ -83,7 +83,7 @@ def test_dma_read(dma):
     data = dma.dma_read(0)
 
     # Check the result
-    assert data == [0x42, 0x43, 0x44, 0x45]
+    assert data == bytes([0x42, 0x43, 0x44, 0x45])
 
 
 def test_dma_write(dma):
@@ -121,7 +121,7 @@ def test_dma_autoload(dma):
 
     # Perform the transfer using channel 2, and check the result
     data = dma.dma_read(2)
-    assert data == [0x42, 0x43, 0x44, 0x45]
+    assert data == bytes([0x42, 0x43, 0x44, 0x45])
 
     # Fill the same memory with another bytes
     dma._machine.write_memory_byte(0x1234, 0x24)
@@ -131,7 +131,7 @@ def test_dma_autoload(dma):
 
     # Perform the transfer again, expecting the channel parameters are autoloaded, and check the result
     data = dma.dma_read(2)
-    assert data == [0x24, 0x25, 0x26, 0x27]
+    assert data == bytes([0x24, 0x25, 0x26, 0x27])
 
 
 def test_dma_not_autoloaded(dma):
@@ -151,7 +151,7 @@ def test_dma_not_autoloaded(dma):
 
     # Perform the transfer using channel 3, and check the result
     data = dma.dma_read(3)
-    assert data == [0x42, 0x43, 0x44, 0x45]
+    assert data == bytes([0x42, 0x43, 0x44, 0x45])
 
     # Try running another DMA read and verify that the channel is no longer enabled
     with pytest.raises(RuntimeError):
@@ -0,0 +1,65 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+
+sys.path.append('../src')
+
+import pygame
+
+import common.surface as surface
+from emulation_process import SharedState
+from main import CONFIGURATIONS
+
+@pytest.fixture
+def shared():
+    state = SharedState()
+    yield state
+    state.close()
+
+@pytest.fixture
+def attached(shared):
+    state = SharedState(shared.name)
+    yield state
+    state.close()
+
+def test_no_data(shared, attached):
+    assert attached.read_screen_data() == None
+    assert attached.read_key_state() == None
+    assert attached.get_cycles() == 0
+
+def test_screen_data(shared, attached):
+    shared.write_screen_data(b"\x01\x02\x03")
+    assert attached.read_screen_data() == b"\x01\x02\x03"
+    assert attached.read_screen_data() == None     # Not changed since the previous read
+
+    shared.write_screen_data(b"\x04")
+    assert attached.read_screen_data() == b"\x04"
+
+def test_key_state(shared, attached):
+    attached.write_key_state(b"\xfe\xfd\xff")
+    assert shared.read_key_state() == b"\xfe\xfd\xff"
+    assert shared.read_key_state() == None
+
+def test_key_state_too_big(shared):
+    with pytest.raises(ValueError):
+        shared.write_key_state(bytes(100))
+
+def test_cycles(shared, attached):
+    shared.set_cycles(0x123456789a)
+    assert attached.get_cycles() == 0x123456789a
+
+@pytest.mark.parametrize("name", ["video", "radio86rk"])
+def test_frontend_screen_data(name, tmp_path, monkeypatch):
+    monkeypatch.setattr(surface, "FONT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(pygame.display, "set_mode", lambda size: pygame.Surface(size))
+
+    configuration = CONFIGURATIONS[name](headless=True)
+    configuration.boot(10000000)
+
+    # The display-only frontend renders the same screen as the emulated machine
+    frontend = configuration.FRONTEND()
+    frontend.set_screen_data(configuration.get_screen_data())
+    assert frontend._display.get_text() == configuration.get_screen_text()
+    assert frontend.update(pygame.Surface(frontend.SCREEN_SIZE)) is None
@@ -0,0 +1,279 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+import os
+
+sys.path.append('../src')
+
+from common.machine import Machine
+from common.emulator import Emulator, read_tape_image
+from common.ram import RAM
+from common.interfaces import MemoryDevice, IODevice
+from common.ppi import PPI, PPI_PORT_A
+from common.utils import *
+
+@pytest.fixture(params=[False, True], ids=["interpreter", "translator"])
+def emulator(request):
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0xffff))
+    machine.enable_flat_memory()
+    emulator = Emulator(machine)
+    emulator.enable_block_translation(request.param)
+
+    program = [
+        0x0e, 0x0a,         # 0000  MVI C, 0a
+        0x0d,               # 0002  loop: DCR C
+        0xc2, 0x02, 0x00,   # 0003  JNZ loop
+        0x3e, 0x42,         # 0006  MVI A, 42
+        0xc3, 0x08, 0x00,   # 0008  JMP 0008
+    ]
+    for i, value in enumerate(program):
+        machine.write_memory_byte(i, value)
+
+    return emulator
+
+def test_run(emulator):
+    emulator.run(100)
+    assert emulator._cpu._cycles > 100
+
+def test_run_until_pc(emulator):
+    assert emulator.run_until(pc=0x0006) == True
+    assert emulator._cpu._pc == 0x0006
+    assert emulator._cpu._c == 0x00
+    assert emulator._cpu._cycles == 7 + 10 * (5 + 10)
+
+def test_run_until_pc_in_loop(emulator):
+    assert emulator.run_until(pc=0x0002) == True
+    assert emulator.run_until(pc=0x0002) == True   # Already there
+    assert emulator._cpu._c == 0x0a
+
+    emulator.step()
+    assert emulator.run_until(pc=0x0002) == True
+    assert emulator._cpu._c == 0x09
+
+def test_run_until_cycles_limit(emulator):
+    assert emulator.run_until(pc=0x0006, max_cycles=30) == False
+    assert emulator._cpu._cycles > 30
+    assert emulator._cpu._cycles < 7 + 10 * (5 + 10)
+
+def test_run_until_predicate(emulator):
+    assert emulator.run_until(predicate=lambda: emulator._cpu._a == 0x42) == True
+    assert emulator._cpu._c == 0x00
+
+def test_run_until_breakpoint(emulator):
+    hits = []
+    emulator.add_breakpoint(0x0003, lambda: hits.append(emulator._cpu._c))
+    emulator.run_until(pc=0x0006)
+    assert hits == [9, 8, 7, 6, 5, 4, 3, 2, 1, 0]
+
+class MockIO:
+    def __init__(self):
+        self.value = 0
+
+    def read_byte(self, offset):
+        return self.value
+
+def create_polling_emulator(translate):
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0xffff))
+    machine.enable_flat_memory()
+    port = MockIO()
+    machine.add_io(IODevice(port, 0x05))
+    emulator = Emulator(machine)
+    emulator.enable_block_translation(translate)
+    emulator.enable_idle_detection()
+
+    program = [
+        0x31, 0x00, 0x80,   # 0000  LXI SP, 8000
+        0xcd, 0x10, 0x00,   # 0003  wait: CALL 0010
+        0xb7,               # 0006  ORA A
+        0xca, 0x03, 0x00,   # 0007  JZ wait
+        0xc3, 0x0a, 0x00,   # 000a  JMP 000a
+        0x00, 0x00, 0x00,
+        0xdb, 0x05,         # 0010  IN 05
+        0xc9,               # 0012  RET
+    ]
+    for i, value in enumerate(program):
+        machine.write_memory_byte(i, value)
+
+    return emulator, port
+
+@pytest.mark.parametrize("translate", [False, True], ids=["interpreter", "translator"])
+def test_idle_polling_loop(translate):
+    emulator, port = create_polling_emulator(translate)
+    emulator.run(100)
+    assert emulator.is_idle() == False      # Initialization code is not idle
+
+    start = emulator._cpu._cycles
+    emulator.run(100000)
+    assert emulator.is_idle() == True
+    assert emulator._cpu._cycles == start + 100000 + 1
+
+    emulator.run(100000)                    # Still idle
+    assert emulator.is_idle() == True
+
+    port.value = 0x01                       # Input changes, the machine wakes up
+    emulator.wake()
+    emulator.run(1000)
+    assert emulator.is_idle() == False
+    assert emulator._cpu._pc == 0x000a
+
+def test_idle_counter_loop(emulator):
+    emulator.enable_idle_detection()
+    emulator.run(20)
+    emulator.run(20)
+    assert emulator.is_idle() == False      # Counter changes every iteration
+    assert emulator._cpu._c != 0x00
+
+def test_idle_detection_disabled():
+    emulator, port = create_polling_emulator(False)
+    emulator.enable_idle_detection(False)
+    emulator.run(100)
+    emulator.run(100000)
+    assert emulator.is_idle() == False
+
+def test_scheduled_event(emulator):
+    cycles = []
+    emulator._machine.schedule_event(50, lambda: cycles.append(emulator._cpu._cycles))
+    emulator.run_until(pc=0x0006)
+    assert len(cycles) == 1
+    assert cycles[0] >= 50 and cycles[0] < 50 + 10     # Called right after the instruction crossing the time
+
+def test_scheduled_stop(emulator):
+    emulator._machine.schedule_event(40, emulator.stop, 40)
+    assert emulator.run_until() == False
+    assert emulator._cpu._cycles >= 40 and emulator._cpu._cycles < 40 + 15    # Up to a loop iteration late
+    emulator.run_until()
+    assert emulator._cpu._cycles >= 80 and emulator._cpu._cycles < 80 + 15
+
+@pytest.mark.parametrize("translate", [False, True], ids=["interpreter", "translator"])
+def test_idle_scheduled_event(translate):
+    emulator, port = create_polling_emulator(translate)
+    emulator.run(100)
+
+    calls = []
+    event_time = emulator._cpu._cycles + 50000
+    emulator._machine.schedule_event(50000, lambda: calls.append(emulator._cpu._cycles))
+    emulator.run(100000)
+    assert emulator.is_idle() == True
+    assert calls == [event_time]                # Idle fast forward stops exactly at the event time
+
+def test_fork(emulator):
+    emulator.run_until(pc=0x0003)
+    child = emulator.fork()
+    assert child._cpu is not emulator._cpu
+    assert child._cpu._pc == 0x0003
+    assert child._cpu._cycles == emulator._cpu._cycles
+
+    # The fork runs on its own memory and registers
+    child._machine.write_memory_byte(0x0007, 0x55)  # MVI A, 55
+    child.run_until(pc=0x0008)
+    assert child._cpu._a == 0x55
+    assert emulator._cpu._pc == 0x0003
+    assert emulator._machine.read_memory_byte(0x0007) == 0x42
+
+    emulator.run_until(pc=0x0008)
+    assert emulator._cpu._a == 0x42
+
+def test_fork_breakpoint(emulator):
+    calls = []
+    emulator.add_breakpoint(0x0006, lambda: calls.append(0x0006))
+    child = emulator.fork()
+    child.run_until(pc=0x0008)
+    assert calls == [0x0006]    # Breakpoints are preserved in the fork
+    assert emulator._cpu._cycles == 0
+
+def test_load_memory(emulator, tmp_path):
+    fname = tmp_path / "test.rku"
+    fname.write_bytes(bytes([0x12, 0x34, 0x12, 0x36, 0x41, 0x42, 0x43]))
+    emulator.load_memory(str(fname))
+    assert emulator._machine.read_memory_burst(0x1234, 3) == bytes([0x41, 0x42, 0x43])
+
+def test_load_memory_pki(emulator, tmp_path):
+    fname = tmp_path / "test.pki"
+    fname.write_bytes(bytes([0xe6, 0x12, 0x34, 0x12, 0x35, 0x41, 0x42]))
+    emulator.load_memory(str(fname))
+    assert emulator._machine.read_memory_burst(0x1234, 2) == bytes([0x41, 0x42])
+
+def test_load_memory_truncated(emulator, tmp_path):
+    fname = tmp_path / "test.rku"
+    fname.write_bytes(bytes([0x12, 0x34, 0x12, 0x36, 0x41]))
+    with pytest.raises(ValueError):
+        emulator.load_memory(str(fname))
+
+def test_tape_image_cache(tmp_path):
+    fname = tmp_path / "test.rku"
+    fname.write_bytes(bytes([0x12, 0x34, 0x12, 0x34, 0x41]))
+    assert read_tape_image(str(fname)) == (0x1234, b"\x41")
+    assert read_tape_image(str(fname))[1] is read_tape_image(str(fname))[1]
+
+    # Modified file is parsed again
+    fname.write_bytes(bytes([0x43, 0x21, 0x43, 0x21, 0x42]))
+    os.utime(fname, ns=(0, os.stat(fname).st_mtime_ns + 1000000))
+    assert read_tape_image(str(fname)) == (0x4321, b"\x42")
+
+class MockVideoMemory:
+    def __init__(self):
+        self.data = bytearray(0x100)
+        self.writes = 0
+
+    def get_size(self):
+        return len(self.data)
+
+    def read_byte(self, offset):
+        return self.data[offset]
+
+    def write_byte(self, offset, value):
+        self.data[offset] = value
+        self.writes += 1
+
+@pytest.mark.parametrize("translate", [False, True], ids=["interpreter", "translator"])
+def test_idle_device_memory_loop(translate):
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0x7fff))
+    video = MockVideoMemory()
+    machine.add_memory(MemoryDevice(video, 0xe800))     # Device memory is not a part of the flat image
+    machine.enable_flat_memory()
+    emulator = Emulator(machine)
+    emulator.enable_block_translation(translate)
+    emulator.enable_idle_detection()
+
+    program = [
+        0x21, 0x00, 0xe8,   # 0000  LXI H, e800
+        0x34,               # 0003  loop: INR M
+        0xc3, 0x03, 0x00,   # 0004  JMP loop
+    ]
+    for i, value in enumerate(program):
+        machine.write_memory_byte(i, value)
+
+    for _ in range(10):
+        emulator.run(1000)
+        assert emulator.is_idle() == False      # The loop changes the device memory every iteration
+
+    assert video.writes >= 10 * 1000 // 20                # INR M + JMP take 20 cycles
+
+@pytest.mark.parametrize("loop, idle", [
+    ([0xaf, 0xd3, 0x04, 0xdb, 0x05, 0xc3, 0x04, 0x00], True),         # XRA A; OUT 04; IN 05; JMP loop
+    ([0x3e, 0x01, 0xd3, 0x07, 0x3d, 0xd3, 0x07, 0xc3, 0x04, 0x00], False),  # Toggle Port C bit 0 (BSR)
+], ids=["keyboard_scan", "port_output"])
+def test_idle_ppi_loop(loop, idle):
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0x7fff))
+    ppi = PPI()
+    ppi.set_portA_handler(lambda value: None)
+    ppi.set_portB_handler(lambda: 0xff)
+    ppi.set_input_scanning_port(PPI_PORT_A)
+    machine.add_io(IODevice(ppi, 0x04))
+    machine.enable_flat_memory()
+    emulator = Emulator(machine)
+    emulator.enable_idle_detection()
+
+    program = [0x3e, 0x8a, 0xd3, 0x07] + loop       # MVI A, 8a; OUT 07 (port A and lower port C output)
+    for i, value in enumerate(program):
+        machine.write_memory_byte(i, value)
+
+    for _ in range(10):
+        emulator.run(1000)
+    assert emulator.is_idle() == idle
@@ -0,0 +1,47 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+
+sys.path.append('../src')
+
+import main     # Imported before workers are forked, as scenarios run in a temporary directory
+import farm
+
+SCENARIOS = """
+import farm
+
+def fail(configuration):
+    configuration.run_cycles(1000)
+    assert False, "Expected failure"
+
+SCENARIOS = [scenario for scenario in farm.SMOKE_SCENARIOS if scenario[1] == "basic"]
+SCENARIOS.append(("basic_fail", "basic", fail))
+"""
+
+def get_results(output):
+    """ Parse scenario result lines into a {name: (status, cycles)} dict """
+    results = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if parts and parts[0] in ("PASS", "FAIL"):
+            results[parts[1]] = (parts[0], int(parts[2]))
+    return results
+
+def test_smoke(tmp_path, capsys):
+    scenarios = tmp_path / "scenarios.py"
+    scenarios.write_text(SCENARIOS)
+
+    assert farm.run_farm(str(scenarios), processes=2) == False
+
+    output = capsys.readouterr().out
+    assert "Booted basic" in output
+    assert "1 passed, 1 failed" in output
+    assert "AssertionError: Expected failure" in output
+
+    results = get_results(output)
+    assert results["basic_idle"][0] == "PASS"
+    assert results["basic_idle"][1] >= farm.SMOKE_CYCLES
+    assert results["basic_fail"][0] == "FAIL"
+    assert results["basic_fail"][1] >= 1000
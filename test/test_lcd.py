@@ -24,4 +24,10 @@ def test_write_byte(lcd):
 def test_write_word(lcd):
     lcd.write_word(LCD_PTR + 1, 0xbeef)
     assert lcd._device._ram[1] == 0xef    
-    assert lcd._device._ram[2] == 0xbe
\ No newline at end of file
+    assert lcd._device._ram[2] == 0xbe
+
+def test_headless_text():
+    lcd = MemoryDevice(LCD(headless=True), LCD_PTR)
+    lcd.write_word(LCD_PTR + 1, 0xbeef)
+    lcd.write_byte(LCD_PTR, 0x42)
+    assert lcd._device.get_text() == "BEEF 42"
@@ -30,9 +30,9 @@ def test_ram_read_write(machine):
     machine.write_memory_word(0x8642, 0xbeef)
     assert machine.read_memory_word(0x8642) == 0xbeef
 
-    assert machine.read_memory_burst(0x8123, 8) == [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
+    assert machine.read_memory_burst(0x8123, 8) == bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
     machine.write_memory_burst(0x8123, [0x41, 0x42, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48])
-    assert machine.read_memory_burst(0x8123, 8) == [0x41, 0x42, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48]
+    assert machine.read_memory_burst(0x8123, 8) == bytes([0x41, 0x42, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48])
 
     assert machine.read_stack(0x8ace) == 0x0000
     machine.write_stack(0x8ace, 0xbeef)
@@ -41,7 +41,7 @@ def test_ram_read_write(machine):
 def test_rom_read(machine):
     assert machine.read_memory_byte(0x4042) == 0x26
     assert machine.read_memory_word(0x4242) == 0x09e5
-    assert machine.read_memory_burst(0x4242, 10) == [0xe5, 0x09, 0x22, 0xf6, 0xc3, 0x2a, 0xf0, 0xc3, 0x4d, 0x44]
+    assert machine.read_memory_burst(0x4242, 10) == bytes([0xe5, 0x09, 0x22, 0xf6, 0xc3, 0x2a, 0xf0, 0xc3, 0x4d, 0x44])
 
 def test_memory_addr_validation(machine):
     machine.set_strict_validation(True)
@@ -50,16 +50,25 @@ def test_memory_addr_validation(machine):
     assert "No memory registered for address 0x1234" in str(e.value)
 
 def test_io_read_write(machine):
+    # Device functions are bound on registration
     mock_io = MockIO()
+    mock_io.write_byte = MagicMock()
+    mock_io.read_byte = MagicMock(return_value=0x12)
     machine.add_io(IODevice(mock_io, 0x42))
 
-    mock_io.write_byte = MagicMock()
     machine.write_io(0x42, 0x12)
     mock_io.write_byte.assert_called_once_with(0, 0x12)
 
-    mock_io.read_byte = MagicMock(return_value=0x12)
     assert machine.read_io(0x42) == 0x12
 
+def test_unsupported_operations(machine):
+    machine.add_io(IODevice(MockIO(), 0x42))
+    with pytest.raises(IOError):
+        machine.read_io(0x42)
+
+    with pytest.raises(MemoryError):
+        machine.write_memory_byte(0x4042, 0x42)    # ROM
+
 def test_io_addr_validation(machine):
     machine.set_strict_validation(True)
     with pytest.raises(IOError) as e:
@@ -83,3 +92,182 @@ def test_write_no_io(machine):
     # Just check it does not throw the error
     machine.set_strict_validation(False)
     machine.write_io(0x12, 0x42)
+
+def test_overlapping_memories(machine):
+    # Memory registered first takes precedence over memories registered later
+    machine.add_memory(MemoryDevice(RAM(), 0x8800, 0x9fff))
+    machine.write_memory_byte(0x8900, 0x42)
+    machine.write_memory_byte(0x9900, 0x43)
+    assert machine.read_memory_byte(0x8900) == 0x42
+    assert machine.read_memory_byte(0x9900) == 0x43
+    assert machine._get_memory(0x8900) is not machine._get_memory(0x9900)
+
+def test_burst_across_memories(machine):
+    machine.add_memory(MemoryDevice(RAM(), 0x9000, 0x9fff))
+    machine.write_memory_burst(0x8ffe, [0x41, 0x42, 0x43, 0x44])
+    assert machine.read_memory_burst(0x8ffe, 2) == bytes([0x41, 0x42])
+    assert machine.read_memory_burst(0x9000, 2) == bytes([0x43, 0x44])
+
+def test_burst_across_overlapped_memories(machine):
+    # The memory registered first takes precedence in the middle of the range
+    ram = RAM(0x2000)
+    machine.add_memory(MemoryDevice(ram, 0x7000, 0x8fff))
+    machine.write_memory_burst(0x7ffe, [0x41, 0x42, 0x43, 0x44])
+    assert machine.read_memory_burst(0x7ffe, 2) == bytes([0x41, 0x42])
+    assert machine.read_memory_burst(0x8000, 2) == bytes([0x43, 0x44])
+    assert ram.read_burst(0x0ffe, 4) == bytes([0x41, 0x42, 0x00, 0x00])
+
+def test_burst_no_memory(machine):
+    machine.set_strict_validation(False)
+    machine.write_memory_burst(0x7ffe, [0x41, 0x42, 0x43, 0x44])
+    assert machine.read_memory_burst(0x8000, 2) == bytes([0x43, 0x44])
+
+    machine.set_strict_validation(True)
+    with pytest.raises(MemoryError):
+        machine.write_memory_burst(0x7ffe, [0x41, 0x42, 0x43, 0x44])
+
+def test_remove_memory(machine):
+    ram = MemoryDevice(RAM(), 0x2000, 0x2fff)
+    machine.add_memory(ram)
+    machine.write_memory_byte(0x2345, 0x42)
+    assert machine.read_memory_byte(0x2345) == 0x42
+
+    machine.remove_memory(ram)
+    assert machine.read_memory_byte(0x2345) == 0xff
+
+def test_flat_memory_pages(machine):
+    machine.add_memory(MemoryDevice(RAM(), 0x9000, 0x9080))    # Partial page is not directly accessible
+    machine.enable_flat_memory()
+    memory, read_pages, write_pages, stack_pages = machine.get_memory_map()
+
+    assert read_pages[0x40] and not write_pages[0x40]   # ROM is read only
+    assert read_pages[0x80] and write_pages[0x80]       # RAM
+    assert stack_pages[0x80]
+    assert not read_pages[0x90] and not write_pages[0x90]
+    assert not read_pages[0x12] and not write_pages[0x12]
+    assert memory[0x4042] == 0x26
+
+def test_flat_memory_shared_with_ram(machine):
+    machine.enable_flat_memory()
+    memory, _, _, _ = machine.get_memory_map()
+
+    machine.write_memory_byte(0x8765, 0x42)
+    assert memory[0x8765] == 0x42
+
+    memory[0x8766] = 0x43
+    assert machine.read_memory_byte(0x8766) == 0x43
+
+def test_flat_memory_keeps_ram_data(machine):
+    machine.write_memory_word(0x8642, 0xbeef)
+    machine.enable_flat_memory()
+    assert machine.read_memory_word(0x8642) == 0xbeef
+
+def test_flat_memory_overlapped_ram(machine):
+    # RAM partially shadowed by other memory is not mapped to the flat image
+    machine.add_memory(MemoryDevice(RAM(), 0x8800, 0x9fff))
+    machine.enable_flat_memory()
+    _, read_pages, write_pages, _ = machine.get_memory_map()
+    assert not read_pages[0x98] and not write_pages[0x98]
+
+def test_flat_memory_remove_overlapping_ram(machine):
+    # Removing a RAM that shadows another RAM keeps the removed RAM data
+    a = MemoryDevice(RAM(), 0x0000, 0x0fff)
+    b = MemoryDevice(RAM(), 0x0000, 0x0fff)
+    machine.add_memory(a)
+    machine.add_memory(b)
+    machine.enable_flat_memory()
+    machine.write_memory_byte(0x0010, 0x42)
+
+    machine.remove_memory(a)
+    assert a.read_byte(0x0010) == 0x42
+    assert machine.read_memory_byte(0x0010) == 0x00     # The shadowed RAM is visible now
+
+def test_flat_memory_stack_direct_access(machine):
+    machine.enable_flat_memory()
+    _, _, _, stack_pages = machine.get_memory_map()
+
+    machine.set_stack_direct_access(False)
+    assert not stack_pages[0x80]
+    machine.set_stack_direct_access(True)
+    assert stack_pages[0x80]
+
+class MockDirtyDevice:
+    def __init__(self):
+        self.dirty = False
+        self.updates = 0
+
+    def get_size(self):
+        return 4
+
+    def is_dirty(self):
+        return self.dirty
+
+    def update(self):
+        self.updates += 1
+        self.dirty = False
+
+def test_update_dirty_device(machine):
+    device = MockDirtyDevice()
+    machine.add_io(IODevice(device, 0x40))     # Device registered at 4 ports is updated once
+    machine.update()
+    assert device.updates == 0
+
+    device.dirty = True
+    machine.update()
+    assert device.updates == 1
+
+def test_update_period(machine):
+    device = MockDirtyDevice()
+    device.UPDATE_PERIOD = 1000
+    machine.add_other_device(device)
+    machine.update()
+    assert device.updates == 0
+
+    machine.get_scheduler().run_events(1000)
+    assert device.updates == 1
+
+def test_update_removed_device(machine):
+    device = MockDirtyDevice()
+    memory = MemoryDevice(device, 0x2000)
+    machine.add_memory(memory)
+    machine.remove_memory(memory)
+
+    device.dirty = True
+    machine.update()
+    assert device.updates == 0
+
+def test_write_watch(machine):
+    callback = MagicMock()
+    machine.add_write_watch(0x8100, 0x81ff, callback)
+
+    machine.write_memory_byte(0x8142, 0x42)
+    callback.assert_called_with(0x8142, 1)
+
+    machine.write_memory_word(0x81ff, 0xbeef)           # Only the watched part of the range is reported
+    callback.assert_called_with(0x81ff, 1)
+
+    machine.write_stack(0x8100, 0xbeef)
+    callback.assert_called_with(0x8100, 2)
+
+    machine.write_memory_burst(0x80f0, bytes(0x20))
+    callback.assert_called_with(0x8100, 0x10)
+
+    callback.reset_mock()
+    machine.write_memory_byte(0x80ff, 0x42)             # Not watched address on the same page
+    machine.write_memory_byte(0x8200, 0x42)
+    callback.assert_not_called()
+
+def test_write_watch_flat_memory(machine):
+    machine.enable_flat_memory()
+    _, read_pages, write_pages, stack_pages = machine.get_memory_map()
+
+    callback = MagicMock()
+    machine.add_write_watch(0x8110, 0x8120, callback)
+    assert read_pages[0x81] and not write_pages[0x81] and not stack_pages[0x81]
+    assert write_pages[0x80] and write_pages[0x82]
+
+    machine.remove_write_watch(callback)
+    assert write_pages[0x81] and stack_pages[0x81]
+
+    machine.write_memory_byte(0x8115, 0x42)
+    callback.assert_not_called()
@@ -155,3 +155,43 @@ def test_disconnect_port_in_runtime(ppi):
     ppi.set_portC_bit_handler(0, mock_func)
     ppi.write_byte(PPI_PORT_CFG, 0x01)
     mock_func.assert_called_once_with(True)
+
+
+def test_input_scanning_port(ppi):
+    ppi.write_byte(PPI_PORT_CFG, 0x8a)      # Port A and lower Port C as output
+    ppi.set_portA_handler(MagicMock())
+    ppi.set_input_scanning_port(PPI_PORT_A)
+
+    ppi.write_byte(PPI_PORT_A, 0xfe)
+    assert ppi.is_input_scanning(PPI_PORT_A) == True
+
+
+def test_input_scanning_unchanged_output(ppi):
+    ppi.write_byte(PPI_PORT_CFG, 0x8a)      # Port A and lower Port C as output
+    assert ppi.is_input_scanning(PPI_PORT_CFG) == False     # Mode changed
+
+    ppi.write_byte(PPI_PORT_CFG, 0x8a)
+    assert ppi.is_input_scanning(PPI_PORT_CFG) == True      # Same mode
+
+    ppi.write_byte(PPI_PORT_C, 0x00)
+    assert ppi.is_input_scanning(PPI_PORT_C) == True        # Output lines not changed
+
+    ppi.write_byte(PPI_PORT_C, 0x10)
+    assert ppi.is_input_scanning(PPI_PORT_C) == True        # Upper Port C is input
+
+    ppi.write_byte(PPI_PORT_C, 0x01)
+    assert ppi.is_input_scanning(PPI_PORT_C) == False       # Bit 0 output changed (e.g. tape output)
+
+    ppi.write_byte(PPI_PORT_CFG, 0x01)
+    assert ppi.is_input_scanning(PPI_PORT_CFG) == True      # BSR sets the bit that is already set
+
+    ppi.write_byte(PPI_PORT_CFG, 0x00)
+    assert ppi.is_input_scanning(PPI_PORT_CFG) == False     # BSR resets the bit
+
+
+def test_input_scanning_output_port(ppi):
+    ppi.write_byte(PPI_PORT_CFG, 0x80)      # All ports as output
+    ppi.set_portA_handler(MagicMock())
+
+    ppi.write_byte(PPI_PORT_A, 0xfe)
+    assert ppi.is_input_scanning(PPI_PORT_A) == False       # Not an input scanning port
@@ -3,6 +3,7 @@
 
 import pytest
 import sys
+import copy
 
 sys.path.append('../src')
 
@@ -133,7 +134,7 @@ def test_read_data(diskfile):
     quasidisk.write_stack(0x4567, 0x78)
 
     # Ensure data is dumped to the host system file
-    quasidisk.update()
+    quasidisk.flush()
 
     # Validate the data
     data = diskfile.read_bytes()
@@ -180,3 +181,21 @@ def test_select_between_disk_and_memory(ut88):
     assert ut88.read_stack(0xbeef) == 0x4321    # Quasi disk read
     ut88.write_io(CONFIG_PORT, QUASI_DISK_DISABLE)
     assert ut88.read_stack(0xbeef) == 0x1234    # RAM read
+
+def test_fork_copy_on_write(quasidisk):
+    quasidisk.select_page(QUASI_DISK_PAGE_0)
+    quasidisk.write_stack(0x4000, 0x4242)
+
+    fork = copy.deepcopy(quasidisk)
+    assert fork.read_stack(0x4000) == 0x4242
+    assert all(a is b for a, b in zip(fork._chunks, quasidisk._chunks))   # Data is shared until modified
+
+    # Only the modified chunk is copied, and the original disk is not affected
+    fork.write_stack(0x4000, 0x1234)
+    assert fork.read_stack(0x4000) == 0x1234
+    assert quasidisk.read_stack(0x4000) == 0x4242
+    assert sum(a is not b for a, b in zip(fork._chunks, quasidisk._chunks)) == 1
+
+    # Original disk changes are not visible in the fork
+    quasidisk.write_stack(0x8000, 0x5678)
+    assert fork.read_stack(0x8000) == 0x0000
@@ -47,9 +47,14 @@ def test_read_burst(ram):
     ram.write_byte(0x1235, 0x43)
     ram.write_byte(0x1236, 0x44)
     ram.write_byte(0x1237, 0x45)
-    assert ram.read_burst(0x1230, 12) == [0x00, 0x00, 0x00, 0x00, 0x42, 0x43, 0x44, 0x45, 0x00, 0x00, 0x00, 0x00]
+    assert ram.read_burst(0x1230, 12) == bytes([0x00, 0x00, 0x00, 0x00, 0x42, 0x43, 0x44, 0x45, 0x00, 0x00, 0x00, 0x00])
 
 
+def test_read_burst_no_copy(ram):
+    data = ram.read_burst(0x1234, 4)
+    ram.write_byte(0x1235, 0x42)
+    assert data[1] == 0x42
+
 def test_write_burst(ram):
     ram.write_byte(0x1238, 0xa5)    # Guard byte, to check if this not overwritten  
     ram.write_burst(0x1234, bytes([0x42, 0x43, 0x44, 0x45]))
@@ -132,3 +137,13 @@ def test_out_of_addr_range_burst():
         ram.write_burst(0x6789, buf)
     with pytest.raises(MemoryError):
         ram.write_burst(0x5ff8, buf)
+
+def test_write_burst_does_not_resize():
+    ram = RAM(0x10)
+    with pytest.raises(MemoryError):
+        ram.write_burst(0x0e, [0x42, 0x43, 0x44])
+    assert ram.get_size() == 0x10
+
+def test_write_burst_value_range(ram):
+    with pytest.raises(ValueError):
+        ram.write_burst(0x1234, [0x42, 0x100])
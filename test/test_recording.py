@@ -0,0 +1,65 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+import os
+
+sys.path.append('../src')
+
+import common.surface as surface
+from common.recording import *
+
+WIDTH = 8
+HEIGHT = 3
+
+@pytest.fixture
+def fname(tmp_path):
+    return str(tmp_path / "screen.rec")
+
+def make_frame(text):
+    return text.ljust(WIDTH * HEIGHT).encode()
+
+def test_changed_runs():
+    prev = make_frame("")
+    cells = make_frame("A     BC" + "        " + "X  Y   Z")
+    # Close changes are merged into a single run
+    assert get_changed_runs(prev, cells, WIDTH) == [(0, b"A"), (6, b"BC"), (16, b"X  Y   Z")]
+
+def test_record_replay(fname):
+    frames = [make_frame("HELLO"), make_frame("HELLO"), make_frame("HELLO WORLD"), make_frame("")]
+    with ScreenRecorder(fname) as recorder:
+        assert not recorder.add_frame(b"", 0, 0, 10)        # Display is not configured yet
+        for i, frame in enumerate(frames):
+            recorder.add_frame(frame, WIDTH, HEIGHT, 100 * i)
+        assert recorder.get_frames_count() == 3             # Unchanged frame is not stored
+
+    assert list(ScreenPlayer(fname).frames()) == [
+        (0, frames[0], WIDTH, HEIGHT),
+        (200, frames[2], WIDTH, HEIGHT),
+        (300, frames[3], WIDTH, HEIGHT),
+    ]
+
+def test_record_size_change(fname):
+    with ScreenRecorder(fname) as recorder:
+        recorder.add_frame(make_frame("HELLO"), WIDTH, HEIGHT, 0)
+        recorder.add_frame(b"ABCD", 2, 2, 100)
+
+    frames = list(ScreenPlayer(fname).frames())
+    assert frames[1] == (100, b"ABCD", 2, 2)
+
+def test_not_a_recording(fname):
+    with open(fname, "wb") as f:
+        f.write(b"garbage")
+    with pytest.raises(Exception):
+        ScreenPlayer(fname)
+
+def test_save_images(fname, tmp_path, monkeypatch):
+    monkeypatch.setattr(surface, "FONT_CACHE_DIR", str(tmp_path))
+    with ScreenRecorder(fname) as recorder:
+        recorder.add_frame(make_frame("HELLO"), WIDTH, HEIGHT, 0)
+        recorder.add_frame(make_frame("WORLD"), WIDTH, HEIGHT, 100)
+
+    pattern = str(tmp_path / "frame{:03}.png")
+    assert ScreenPlayer(fname).save_images("../resources/font.bin", pattern) == 2
+    assert os.path.exists(pattern.format(0)) and os.path.exists(pattern.format(1))
@@ -0,0 +1,130 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+
+sys.path.append('../src')
+
+import pygame
+
+import common.surface as surface
+from radio86rk.display import *
+from common.dma import *
+from common.ram import RAM
+from common.machine import Machine
+from common.interfaces import MemoryDevice
+
+VIDEO_RAM = 0x7000
+WIDTH = 78
+HEIGHT = 30
+
+@pytest.fixture
+def machine():
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0x7fff))
+    return machine
+
+@pytest.fixture
+def display(machine, tmp_path, monkeypatch):
+    monkeypatch.setattr(surface, "FONT_CACHE_DIR", str(tmp_path))
+
+    dma = DMA(machine)
+    dma.write_byte(DMA_PORT_CFG, 0x80)                  # Autoload mode
+    dma.write_byte(DMA_CH2_START, VIDEO_RAM & 0xff)
+    dma.write_byte(DMA_CH2_START, VIDEO_RAM >> 8)
+    count = WIDTH * HEIGHT - 1
+    dma.write_byte(DMA_CH2_COUNT, count & 0xff)
+    dma.write_byte(DMA_CH2_COUNT, (count >> 8) | 0x40)  # Read transfer
+    dma.write_byte(DMA_PORT_CFG, 0x84)                  # Enable channel 2
+
+    display = RK86Display(dma)
+    display.write_byte(CRT_SREG, 0x00)                  # Reset command
+    display.write_byte(CRT_PREG, WIDTH - 1)
+    display.write_byte(CRT_PREG, HEIGHT - 1)
+    display.write_byte(CRT_PREG, 0x99)
+    display.write_byte(CRT_PREG, 0x93)
+    return display
+
+@pytest.fixture
+def screen():
+    return pygame.Surface((WIDTH*12, HEIGHT*16))
+
+def set_cursor(display, x, y):
+    display.write_byte(CRT_SREG, 0x80)
+    display.write_byte(CRT_PREG, x)
+    display.write_byte(CRT_PREG, y)
+
+def test_first_update_is_full(display, screen):
+    assert display.update_screen(screen) is None
+    assert display.update_screen(screen) == []
+
+def test_update_changed_cells(display, machine, screen):
+    display.update_screen(screen)
+
+    machine.write_memory_byte(VIDEO_RAM + WIDTH + 3, 0x41)
+    machine.write_memory_byte(VIDEO_RAM + WIDTH + 5, 0x42)
+    machine.write_memory_byte(VIDEO_RAM + 2*WIDTH, 0x43)
+
+    rects = display.update_screen(screen)
+    assert rects == [pygame.Rect(3*12, 1*16, 3*12, 16), pygame.Rect(0, 2*16, 12, 16)]
+    assert display.update_screen(screen) == []
+
+def test_update_cursor_blink(display, screen):
+    set_cursor(display, 10, 5)
+    display.update_screen(screen)
+
+    display.toggle_cursor()
+    assert display.update_screen(screen) == [pygame.Rect(10*12, 5*16, 12, 16)]
+
+    display.toggle_cursor()
+    assert display.update_screen(screen) == [pygame.Rect(10*12, 5*16, 12, 16)]
+
+def test_update_cursor_move(display, screen):
+    set_cursor(display, 10, 5)
+    display.toggle_cursor()
+    display.update_screen(screen)
+
+    set_cursor(display, 10, 6)
+    assert display.update_screen(screen) == [pygame.Rect(10*12, 5*16, 12, 16), pygame.Rect(10*12, 6*16, 12, 16)]
+
+def test_update_matches_full_redraw(display, machine, screen):
+    display.update_screen(screen)
+
+    for i, ch in enumerate(b"HELLO WORLD"):
+        machine.write_memory_byte(VIDEO_RAM + 3*WIDTH + 7 + i, ch)
+    set_cursor(display, 18, 3)
+    display.toggle_cursor()
+    display.update_screen(screen)
+
+    expected = pygame.Surface(screen.get_size())
+    display.invalidate()
+    display.update_screen(expected)
+    assert pygame.image.tobytes(screen, "RGB") == pygame.image.tobytes(expected, "RGB")
+
+def test_update_load_state(display, screen):
+    display.update_screen(screen)
+
+    # Loading the same screen geometry (e.g. from the emulation process) keeps the drawn frame
+    display.load_state(display.save_state())
+    assert display.update_screen(screen) == []
+
+def test_load_state_resize(display, screen, monkeypatch):
+    modes = []
+    monkeypatch.setattr(pygame.display, "set_mode", lambda size: modes.append(size) or pygame.Surface(size))
+    state = display.save_state()
+
+    display.write_byte(CRT_SREG, 0x00)                  # Reset command with a narrower screen
+    display.write_byte(CRT_PREG, 63)
+    display.write_byte(CRT_PREG, HEIGHT - 1)
+    display.write_byte(CRT_PREG, 0x99)
+    display.write_byte(CRT_PREG, 0x93)
+    display.update_screen(screen)
+
+    # Loading a different screen geometry does not touch the window, the next update resizes it, and
+    # redraws the whole frame
+    display.load_state(state)
+    assert modes == []
+    assert display.update_screen(screen) is None
+    assert modes == [(WIDTH*12, HEIGHT*16)]
+    assert display.update_screen(screen) == []
@@ -46,4 +46,10 @@ def test_out_of_addr_range_burst(rom):
         rom.read_burst(0x43f8, 0x10)    # Start address is ok, end address is not
 
 def test_read_burst(rom):
-    assert rom.read_burst(0x4242, 10) == [0xe5, 0x09, 0x22, 0xf6, 0xc3, 0x2a, 0xf0, 0xc3, 0x4d, 0x44]
+    assert rom.read_burst(0x4242, 10) == bytes([0xe5, 0x09, 0x22, 0xf6, 0xc3, 0x2a, 0xf0, 0xc3, 0x4d, 0x44])
+
+def test_mapped_rom():
+    rom = MemoryDevice(ROM("../resources/monitor0.bin", mapped=True), 0x4000)
+    assert rom.read_byte(0x4042) == 0x26
+    assert rom.read_word(0x4242) == 0x09e5
+    assert rom.read_burst(0x4242, 4) == bytes([0xe5, 0x09, 0x22, 0xf6])
@@ -0,0 +1,67 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+
+sys.path.append('../src')
+
+from common.scheduler import Scheduler
+
+@pytest.fixture
+def scheduler():
+    return Scheduler()
+
+def test_no_events(scheduler):
+    assert scheduler.get_next_event_cycles() == float('inf')
+    scheduler.run_events(1000)                  # Nothing happens
+
+def test_event_order(scheduler):
+    calls = []
+    scheduler.add_event(200, lambda: calls.append("b"))
+    scheduler.add_event(100, lambda: calls.append("a"))
+    scheduler.add_event(200, lambda: calls.append("c"))
+    assert scheduler.get_next_event_cycles() == 100
+
+    scheduler.run_events(99)
+    assert calls == []
+
+    scheduler.run_events(100)
+    assert calls == ["a"]
+    assert scheduler.get_next_event_cycles() == 200
+
+    scheduler.run_events(500)
+    assert calls == ["a", "b", "c"]
+    assert scheduler.get_next_event_cycles() == float('inf')
+
+def test_periodic_event(scheduler):
+    calls = []
+    scheduler.add_event(100, lambda: calls.append(1), 50)
+    scheduler.run_events(100)
+    assert len(calls) == 1
+    assert scheduler.get_next_event_cycles() == 150
+
+    scheduler.run_events(260)                   # Missed periods are called as well
+    assert len(calls) == 4
+    assert scheduler.get_next_event_cycles() == 300
+
+def test_remove_event(scheduler):
+    calls = []
+    callback = lambda: calls.append(1)
+    scheduler.add_event(100, callback, 50)
+    scheduler.add_event(120, lambda: calls.append(2))
+    scheduler.remove_event(callback)
+    assert scheduler.get_next_event_cycles() == 120
+
+    scheduler.run_events(1000)
+    assert calls == [2]
+
+def test_schedule_from_callback(scheduler):
+    calls = []
+    def callback():
+        calls.append(1)
+        scheduler.add_event(150, lambda: calls.append(2))
+
+    scheduler.add_event(100, callback)
+    scheduler.run_events(200)
+    assert calls == [1, 2]
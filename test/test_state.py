@@ -0,0 +1,132 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+
+sys.path.append('../src')
+
+from common.machine import Machine
+from common.emulator import Emulator
+from common.ram import RAM
+from common.ppi import PPI
+from common.dma import DMA
+from common.tape import TapeRecorder
+from common.interfaces import MemoryDevice, IODevice
+from common.state import pack_chunk, unpack_chunks, pack_optional, unpack_optional
+from common.utils import *
+
+def create_emulator():
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0x7fff))
+    machine.add_memory(MemoryDevice(DMA(machine), 0xe000))
+    machine.add_io(IODevice(PPI(), 0x04, invertaddr=True))
+    machine.add_io(IODevice(TapeRecorder(), 0xa1))
+    machine.enable_flat_memory()
+    return Emulator(machine)
+
+def get_cpu_state(emulator):
+    cpu = emulator._cpu
+    return (cpu._a, cpu._b, cpu._c, cpu._d, cpu._e, cpu._h, cpu._l, cpu._sp, cpu._pc, cpu._cycles,
+            cpu._sign, cpu._zero, cpu._half_carry, cpu._parity, cpu._carry, cpu._enable_interrupts,
+            cpu._interrupt_instructions)
+
+def test_chunks():
+    data = pack_chunk("ABC", b"\x01\x02") + pack_chunk("Empty", b"")
+    chunks = unpack_chunks(data)
+    assert [(name, bytes(chunk)) for name, chunk in chunks] == [("ABC", b"\x01\x02"), ("Empty", b"")]
+
+def test_truncated_chunk():
+    data = pack_chunk("ABC", b"\x01\x02\x03")
+    with pytest.raises(ValueError):
+        unpack_chunks(data[:-1])
+
+def test_optional_values():
+    assert unpack_optional(pack_optional(1, None, True, 0x1234)) == [1, None, 1, 0x1234]
+
+def test_cpu_state():
+    emulator = create_emulator()
+    program = [0x31, 0x00, 0x80, 0x3e, 0x42, 0x01, 0x34, 0x12, 0x37, 0xfb]  # LXI SP; MVI A; LXI B; STC; EI
+    for i, value in enumerate(program):
+        emulator._machine.write_memory_byte(i, value)
+    for _ in range(5):
+        emulator.step()
+    emulator._cpu.schedule_interrupt([0xff])
+
+    state = emulator.save_state()
+    expected = get_cpu_state(emulator)
+
+    restored = create_emulator()
+    restored.load_state(state)
+    assert get_cpu_state(restored) == expected
+
+def test_memory_state():
+    emulator = create_emulator()
+    emulator._machine.write_memory_word(0x1234, 0xbeef)
+    emulator._machine.write_memory_byte(0x7fff, 0x42)
+    state = emulator.save_state()
+
+    restored = create_emulator()
+    restored.load_state(state)
+    assert restored._machine.read_memory_word(0x1234) == 0xbeef
+    assert restored._machine.read_memory_byte(0x7fff) == 0x42
+    assert restored._cpu._memory[0x1234] == 0xef            # Flat memory image is updated as well
+
+def test_device_state():
+    emulator = create_emulator()
+    machine = emulator._machine
+    machine.write_io(0x04, 0x8b)                            # PPI configuration (port A output)
+    machine.write_memory_byte(0xe004, 0x00)                 # DMA channel 2 start address
+    machine.write_memory_byte(0xe004, 0xd0)
+    machine.write_memory_byte(0xe005, 0x00)                 # DMA channel 2 count
+    machine.write_memory_byte(0xe005, 0x49)
+
+    tape = machine._io[0xa1].get_device()
+    tape._buffer = bytearray(b"\x12\x34\x56")
+    tape.read_bit()
+    tape.read_bit()
+
+    state = emulator.save_state()
+
+    restored = create_emulator()
+    restored.load_state(state)
+    ppi = restored._machine._io[0x04].get_device()
+    assert ppi._portA_mode_input == False
+    assert ppi._portB_mode_input == True
+    dma = restored._machine._memories.get_memory_for_addr(0xe000).get_device()
+    assert dma.get_register_value(2, False) == 0xd000
+    assert dma.get_register_value(2, True) == 0x0901
+    assert dma._channels[2]['read'] == True
+    restored_tape = restored._machine._io[0xa1].get_device()
+    assert restored_tape._buffer == tape._buffer
+    assert restored_tape._bits == tape._bits
+    assert restored_tape.read_bit() == tape.read_bit()      # Continues from the same tape position
+
+def test_scheduled_events_shift():
+    emulator = create_emulator()
+    state = emulator.save_state()                           # Saved at cycle 0
+
+    emulator._cpu._cycles = 1000
+    calls = []
+    emulator._machine.schedule_event(100, lambda: calls.append(emulator._cpu._cycles))
+    emulator.load_state(state)
+    assert emulator._machine.get_scheduler().get_next_event_cycles() == 100
+
+def test_bad_snapshot():
+    emulator = create_emulator()
+    with pytest.raises(ValueError):
+        emulator.load_state(b"garbage")
+
+    state = bytearray(emulator.save_state())
+    state[4] = 0x7f                                         # Version
+    with pytest.raises(ValueError):
+        emulator.load_state(bytes(state))
+
+def test_configuration_mismatch():
+    emulator = create_emulator()
+    state = emulator.save_state()
+
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0x7fff))
+    with pytest.raises(ValueError):
+        Emulator(machine).load_state(state)
@@ -0,0 +1,83 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import sys
+import pygame
+
+sys.path.append('../src')
+
+import common.surface as surface
+from common.surface import DisplaySurface, build_atlas_pixels, CHAR_WIDTH, CHAR_HEIGHT
+
+@pytest.fixture
+def font():
+    with open("../resources/font.bin", "rb") as f:
+        return f.read()[0:0x400]
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(surface, "FONT_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+def get_pixel(pixels, ch, x, y):
+    return pixels[y * 256 * CHAR_WIDTH + ch * CHAR_WIDTH + x]
+
+@pytest.mark.parametrize("ch", [0x00, 0x41, 0x5f, 0x7f])
+def test_atlas_pixels(font, ch):
+    pixels = build_atlas_pixels(font)
+    assert len(pixels) == 256 * CHAR_WIDTH * CHAR_HEIGHT
+
+    for y in range(CHAR_HEIGHT):
+        for x in range(CHAR_WIDTH):
+            lit = font[ch * 8 + y // 2] & (0x20 >> (x // 2)) == 0     # Font bits are inverted
+            assert get_pixel(pixels, ch, x, y) == (0xff if lit else 0x00)
+            assert get_pixel(pixels, ch | 0x80, x, y) == (0x00 if lit else 0xff)
+
+def test_atlas_cache(font, cache_dir):
+    pixels = surface.get_atlas_pixels(font)
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # Cached atlas is used
+    cached = next(cache_dir.iterdir())
+    cached.write_bytes(bytes(len(pixels)))
+    assert surface.get_atlas_pixels(font) == bytes(len(pixels))
+
+def test_char_glyph(cache_dir):
+    display = DisplaySurface("../resources/font.bin")
+    with open("../resources/font.bin", "rb") as f:
+        font = f.read()
+
+    char = display._chars[0x41]
+    lit = font[0x41 * 8] & 0x20 == 0
+    assert char.get_at((0, 0))[0:3] == ((255, 255, 255) if lit else (0, 0, 0))
+    assert display._chars[0xc1].get_at((0, 0))[0:3] == ((0, 0, 0) if lit else (255, 255, 255))
+
+def test_draw_cells(cache_dir):
+    display = DisplaySurface("../resources/font.bin", 4, 2)
+    display.draw_cells(b"AB  CD  ")
+
+    expected = DisplaySurface("../resources/font.bin", 4, 2)
+    for offset, ch in enumerate(b"AB  CD  "):
+        expected.update_char(offset % 4, offset // 4, ch)
+    assert pygame.image.tobytes(display._display, "RGB") == pygame.image.tobytes(expected._display, "RGB")
+
+    # Only changed chars are redrawn
+    display.update_char(3, 1, 0x41)
+    display.draw_cells(b"AB  CD  ")
+    assert pygame.image.tobytes(display._display, "RGB") != pygame.image.tobytes(expected._display, "RGB")
+
+def test_save_image(cache_dir, tmp_path):
+    display = DisplaySurface("../resources/font.bin", 4, 2)
+    display.draw_cells(b"AB  CD  ")
+    display.save_image(str(tmp_path / "screen.png"))
+
+    image = pygame.image.load(str(tmp_path / "screen.png"))
+    assert image.get_size() == (4 * CHAR_WIDTH, 2 * CHAR_HEIGHT)
+
+def test_get_pixels(cache_dir):
+    display = DisplaySurface("../resources/font.bin", 4, 2)
+    display.draw_cells(b"\x80" * 8)      # Inverted space is all white
+    pixels = display.get_pixels()
+    assert pixels.shape == (2 * CHAR_HEIGHT, 4 * CHAR_WIDTH, 3)
+    assert pixels.min() == 0xff
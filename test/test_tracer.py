@@ -0,0 +1,101 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import io
+import pytest
+import sys
+
+sys.path.append('../src')
+
+from common.machine import Machine
+from common.cpu import CPU
+from common.ram import RAM
+from common.tracer import TraceRecorder
+from common.interfaces import MemoryDevice
+from common.utils import *
+
+@pytest.fixture
+def cpu():
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0xffff))
+    machine.enable_flat_memory()
+    return CPU(machine)
+
+def load_program(cpu, program):
+    for i, value in enumerate(program):
+        cpu._machine.write_memory_byte(i, value)
+
+def test_record(cpu):
+    recorder = TraceRecorder(16)
+    cpu.set_trace_recorder(recorder)
+    assert cpu._tracing == True
+
+    load_program(cpu, [0x3e, 0x42, 0x21, 0xef, 0xbe, 0x37, 0x00])  # MVI A, 42; LXI H, beef; STC; NOP
+    for _ in range(4):
+        cpu.step()
+
+    records = recorder.get_records()
+    assert len(records) == 4
+    assert records[0].pc == 0x0000
+    assert records[0].opcode == 0x3e
+    assert records[0].operand == 0x42
+    assert records[0].a == 0x00                 # State before execution
+    assert records[1].pc == 0x0002
+    assert records[1].operand == 0xbeef
+    assert records[1].a == 0x42
+    assert records[1].cycles == 7
+    assert records[2].hl == 0xbeef
+    assert records[3].flags == 0x03             # Carry is set
+
+def test_ring_buffer(cpu):
+    recorder = TraceRecorder(4)
+    cpu.set_trace_recorder(recorder)
+
+    load_program(cpu, [0x00] * 10)              # NOPs
+    for _ in range(10):
+        cpu.step()
+
+    assert recorder.get_count() == 4
+    assert [rec.pc for rec in recorder.get_records()] == [6, 7, 8, 9]
+    assert [rec.pc for rec in recorder.get_records(2)] == [8, 9]
+
+def test_detach(cpu):
+    recorder = TraceRecorder(4)
+    cpu.set_trace_recorder(recorder)
+    cpu.set_trace_recorder(None)
+    assert cpu._tracing == False
+
+    load_program(cpu, [0x00])
+    cpu.step()
+    assert recorder.get_count() == 0
+
+def test_format(cpu):
+    recorder = TraceRecorder(16)
+    cpu.set_trace_recorder(recorder)
+
+    load_program(cpu, [0x3e, 0x42, 0xc3, 0x34, 0x12])              # MVI A, 42; JMP 1234
+    cpu.step()
+    cpu.step()
+
+    lines = recorder.format_records()
+    assert len(lines) == 2
+    assert "0000  3e 42" in lines[0]
+    assert "MVI A, 42" in lines[0]
+    assert lines[0].endswith("A=00 BC=0000 DE=0000 HL=0000 SP=0000 -----")
+    assert "0002  c3 34 12   JMP 1234" in lines[1]
+    assert "A=42" in lines[1]
+
+def test_dump(cpu):
+    recorder = TraceRecorder(16)
+    cpu.set_trace_recorder(recorder)
+
+    load_program(cpu, [0x00, 0x00, 0x00])                           # NOP; NOP; NOP
+    for _ in range(3):
+        cpu.step()
+
+    stream = io.StringIO()
+    recorder.dump(2, stream)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert "0001  00         NOP" in lines[0]
+    assert "0002  00         NOP" in lines[1]
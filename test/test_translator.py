@@ -0,0 +1,251 @@
+# To run these tests install pytest, then run this command line:
+# py.test -rfeEsxXwa --verbose --showlocals
+
+import pytest
+import random
+import sys
+
+sys.path.append('../src')
+
+from common.machine import Machine
+from common.emulator import Emulator
+from common.translator import BlockTranslator, INSTRUCTION_LENGTHS
+from common.ram import RAM
+from common.interfaces import MemoryDevice
+from common.utils import *
+
+def create_emulator(flat=True, translate=True):
+    machine = Machine()
+    machine.add_memory(MemoryDevice(RAM(), 0x0000, 0xffff))
+    machine.enable_flat_memory(flat)
+    emulator = Emulator(machine)
+    emulator.enable_block_translation(translate)
+    return emulator
+
+@pytest.fixture
+def emulator():
+    return create_emulator()
+
+def load_program(emulator, program, addr=0x0000):
+    for i, value in enumerate(program):
+        emulator._machine.write_memory_byte(addr + i, value)
+
+def get_state(emulator):
+    cpu = emulator._cpu
+    return (cpu._a, cpu._b, cpu._c, cpu._d, cpu._e, cpu._h, cpu._l, cpu._sp, cpu._pc, cpu._cycles,
+            cpu._sign, cpu._zero, cpu._half_carry, cpu._parity, cpu._carry, cpu._enable_interrupts)
+
+def run_to(emulator, endaddr, max_cycles=100000):
+    emulator.run_until(pc=endaddr, max_cycles=max_cycles)
+
+def run_both(program, endaddr, setup=None):
+    """ Run the program with the interpreter, and with the translator, and compare results """
+    emulators = []
+    for translate in [True, False]:
+        emulator = create_emulator(translate=translate)
+        load_program(emulator, program)
+        if setup:
+            setup(emulator)
+        emulators.append(emulator)
+
+    translated, interpreted = emulators
+    run_to(translated, endaddr)
+
+    # Translated code may stop by the cycles limit at a block boundary, run the interpreter to the same point
+    while interpreted._cpu._pc != endaddr and interpreted._cpu._cycles < translated._cpu._cycles:
+        interpreted.step()
+
+    assert get_state(translated) == get_state(interpreted)
+    assert translated._machine.read_memory_burst(0x0000, 0x10000) == interpreted._machine.read_memory_burst(0x0000, 0x10000)
+    return get_state(translated)
+
+def test_translate_block(emulator):
+    load_program(emulator, [0x3e, 0x05, 0x06, 0x03, 0x80, 0x76])   # MVI A, 05; MVI B, 03; ADD B; HLT
+    assert emulator._translator.run_block(0) == True
+    assert emulator._cpu._a == 0x08
+    assert emulator._cpu._pc == 0x0005                              # Stopped at HLT
+    assert emulator._cpu._cycles == 18
+    assert emulator._translator.run_block(0) == False               # HLT is not translated
+
+def test_translation_enables_flat_memory():
+    emulator = create_emulator(flat=False)
+    load_program(emulator, [0x3e, 0x05, 0x76])                      # MVI A, 05; HLT
+    assert emulator._translator.run_block(0) == True
+    assert emulator._cpu._a == 0x05
+
+def test_no_flat_memory():
+    emulator = create_emulator()
+    emulator._machine.enable_flat_memory(False)
+    load_program(emulator, [0x3e, 0x05, 0x76])                      # MVI A, 05; HLT
+    assert emulator._translator.run_block(0) == False
+
+    run_to(emulator, 0x0002)                                        # Interpreter is used instead
+    assert emulator._cpu._a == 0x05
+
+def test_block_cache(emulator):
+    load_program(emulator, [0x3e, 0x05, 0xc3, 0x00, 0x00])          # MVI A, 05; JMP 0000
+    block = emulator._translator.get_block(0x0000)
+    assert block.start == 0x0000
+    assert block.end == 0x0005
+    assert emulator._translator.get_block(0x0000) is block
+
+def test_code_reload(emulator):
+    load_program(emulator, [0x3e, 0x05, 0x76])                      # MVI A, 05; HLT
+    emulator._translator.run_block(0)
+    assert emulator._cpu._a == 0x05
+
+    load_program(emulator, [0x3e, 0x42, 0x76])                      # MVI A, 42; HLT
+    emulator._cpu._pc = 0x0000
+    emulator._translator.run_block(0)
+    assert emulator._cpu._a == 0x42
+
+def test_memory_removed():
+    machine = Machine()
+    ram = MemoryDevice(RAM(), 0x0000, 0xffff)
+    machine.add_memory(ram)
+    machine.enable_flat_memory()
+    emulator = Emulator(machine)
+    emulator.enable_block_translation()
+
+    load_program(emulator, [0x3e, 0x42, 0x76], 0x1000)              # MVI A, 42; HLT
+    emulator._cpu._pc = 0x1000
+    assert emulator._translator.get_block(0x1000) is not None
+
+    # The old code bytes stay in the flat memory image, but the block must not run anymore
+    machine.remove_memory(ram)
+    assert emulator._translator.run_block(0) == False
+    assert emulator._translator.get_block(0x1000) is None
+    assert emulator._cpu._a == 0x00
+
+def test_self_modifying_code_constant_addr():
+    program = [
+        0x3e, 0x42,         # MVI A, 42
+        0x32, 0x06, 0x00,   # STA 0006
+        0x06, 0x00,         # MVI B, 00     <-- patched to MVI B, 42
+        0x76                # HLT
+    ]
+    state = run_both(program, 0x0007)
+    assert state[1] == 0x42
+
+def test_self_modifying_code_dynamic_addr():
+    program = [
+        0x21, 0x08, 0x00,   # LXI H, 0008
+        0x3e, 0x42,         # MVI A, 42
+        0x77,               # MOV M, A
+        0x00,               # NOP
+        0x06, 0x00,         # MVI B, 00     <-- patched to MVI B, 42
+        0x76                # HLT
+    ]
+    state = run_both(program, 0x0009)
+    assert state[1] == 0x42
+
+def test_loop():
+    program = [
+        0x0e, 0x0a,         # MVI C, 0a
+        0x0d,               # loop: DCR C
+        0xc2, 0x02, 0x00,   # JNZ loop
+        0x76                # HLT
+    ]
+    state = run_both(program, 0x0006)
+    assert state[2] == 0x00
+    assert state[9] == 7 + 10 * (5 + 10)
+
+def test_loop_cycles_limit(emulator):
+    load_program(emulator, [0x0d, 0xc2, 0x00, 0x00, 0x76])          # loop: DCR C; JNZ loop; HLT
+    emulator._translator.run_block(30)
+    assert emulator._cpu._pc == 0x0000                              # Loop has not finished
+    assert emulator._cpu._cycles == 45                              # Iterations stop past the limit
+    assert emulator._cpu._c == 0xfd
+
+def test_breakpoint_inside_block(emulator):
+    load_program(emulator, [0x3e, 0x05, 0x3c, 0x3c, 0x76])          # MVI A, 05; INR A; INR A; HLT
+    values = []
+    emulator.add_breakpoint(0x0003, lambda: values.append(emulator._cpu._a))
+    run_to(emulator, 0x0004)
+    assert values == [0x06]
+    assert emulator._cpu._a == 0x07
+
+def test_run_target_inside_block(emulator):
+    load_program(emulator, [0x3e, 0x05, 0x3c, 0x3c, 0x76])          # MVI A, 05; INR A; INR A; HLT
+    block = emulator._translator.get_block(0x0000)
+    assert block.end == 0x0004
+
+    run_to(emulator, 0x0003)                                        # The block is split at the run target
+    assert emulator._cpu._a == 0x06
+    assert emulator._cpu._pc == 0x0003
+
+    # The run target is not a stop address anymore, so the block is translated as a whole again
+    assert 0x0003 not in emulator._stop_addrs
+    assert emulator._translator.get_block(0x0000).end == 0x0004
+
+def test_interrupt(emulator):
+    load_program(emulator, [0xfb, 0x00, 0x00, 0x00])                # EI; NOP; NOP; NOP
+    emulator._cpu._sp = 0x8000
+    emulator.run(1)
+    emulator._cpu.schedule_interrupt([0xff])                        # RST 7
+    emulator.run(1)
+    assert emulator._cpu._pc == 0x0038
+    assert emulator._machine.read_memory_word(0x7ffe) == 0x0001
+
+def test_control_flow():
+    program = [
+        0x31, 0x00, 0x80,   # 0000  LXI SP, 8000
+        0x3e, 0x99,         # 0003  MVI A, 99
+        0xcd, 0x20, 0x00,   # 0005  CALL 0020
+        0xc4, 0x28, 0x00,   # 0008  CNZ 0028
+        0xcc, 0x28, 0x00,   # 000b  CZ 0028
+        0x21, 0x30, 0x00,   # 000e  LXI H, 0030
+        0xe5,               # 0011  PUSH H
+        0xe3,               # 0012  XTHL
+        0xe1,               # 0013  POP H
+        0xe9,               # 0014  PCHL
+        0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+
+        0xf5,               # 0020  PUSH PSW
+        0xc6, 0x67,         # 0021  ADI 67
+        0x27,               # 0023  DAA
+        0xc1,               # 0024  POP B
+        0xd8,               # 0025  RC
+        0xc9,               # 0026  RET
+        0x00,
+
+        0x37,               # 0028  STC
+        0xd0,               # 0029  RNC
+        0xf5,               # 002a  PUSH PSW
+        0xf1,               # 002b  POP PSW
+        0xd8,               # 002c  RC
+        0x00, 0x00, 0x00,
+
+        0x3f,               # 0030  CMC
+        0x1f,               # 0031  RAR
+        0x17,               # 0032  RAL
+        0x0f,               # 0033  RRC
+        0x07,               # 0034  RLC
+        0x2f,               # 0035  CMA
+        0x76                # 0036  HLT
+    ]
+    run_both(program, 0x0036)
+
+# Opcodes that may appear in a random straight-line code sequence
+STRAIGHT_LINE_OPCODES = [opcode for opcode in range(0x100)
+                         if INSTRUCTION_LENGTHS[opcode] != 0 and opcode & 0xc0 != 0xc0 or opcode & 0xc7 == 0xc6
+                         or opcode & 0xcb == 0xc1 or opcode in (0xe3, 0xeb, 0xf9)]    # PUSH, POP, XTHL, XCHG, SPHL
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_code(seed):
+    rnd = random.Random(seed)
+    program = []
+    while len(program) < 0x100:
+        opcode = rnd.choice(STRAIGHT_LINE_OPCODES)
+        program.append(opcode)
+        program.extend(rnd.randrange(0x100) for _ in range(INSTRUCTION_LENGTHS[opcode] - 1))
+    program.append(0x76)    # HLT
+
+    def setup(emulator):
+        # Point memory accessing registers to the data area
+        emulator._cpu._sp = 0x8000
+        emulator._cpu._h = 0x90
+        emulator._cpu._b = 0xa0
+        emulator._cpu._d = 0xb0
+
+    run_both(program, len(program) - 1, setup)
@@ -18,19 +18,27 @@ from helper import EmulatedInstanceWithKeyboard
 # This is a helper class that sets up the machine emulator, configures it for running a
 # UT-88 OS functions, feeds function arguments, and retrieves the result
 class UT88OS(EmulatedInstanceWithKeyboard):
+    _snapshot = None    # Machine state right after loading the binaries, shared between tests
+
     def __init__(self):
         EmulatedInstanceWithKeyboard.__init__(self)
 
         self._machine.add_memory(MemoryDevice(RAM(), 0x0000, 0xffff))
 
-        self._emulator.load_memory(f"{tapes_dir}/ut88os_monitor.rku")   # 0xf800-0xffff
-        self._emulator.load_memory(f"{tapes_dir}/ut88os_monitor2.rku")  # 0xc000-0xcaff
-        self._emulator.load_memory(f"{tapes_dir}/ut88os_editor.rku")    # 0xcb00-0xd7ff
-        self._emulator.load_memory(f"{tapes_dir}/ut88os_assembler.rku") # 0xd800-0xdfff
+        # Loading tapes is slow, so the loaded machine state is restored from a snapshot for subsequent tests
+        if UT88OS._snapshot:
+            self._emulator.load_state(UT88OS._snapshot)
+        else:
+            self._emulator.load_memory(f"{tapes_dir}/ut88os_monitor.rku")   # 0xf800-0xffff
+            self._emulator.load_memory(f"{tapes_dir}/ut88os_monitor2.rku")  # 0xc000-0xcaff
+            self._emulator.load_memory(f"{tapes_dir}/ut88os_editor.rku")    # 0xcb00-0xd7ff
+            self._emulator.load_memory(f"{tapes_dir}/ut88os_assembler.rku") # 0xd800-0xdfff
+
+            # Since we do not run Monitor initialization code, we need to initialize some variables
+            self.set_word(0xf75a, 0xe800)   # Cursor position
+            self.set_byte(0xf77a, 0xff)     # Enable scroll flag
 
-        # Since we do not run Monitor initialization code, we need to initialize some variables
-        self.set_word(0xf75a, 0xe800)   # Cursor position
-        self.set_byte(0xf77a, 0xff)     # Enable scroll flag
+            UT88OS._snapshot = self._emulator.save_state()
 
 
     def _get_sp(self):